@@ -0,0 +1,262 @@
+"""
+Admission control and priority load shedding
+
+Every request is put in a priority class before it reaches the app:
+
+    health   - health checks and /metrics: always admitted
+    read     - GET/HEAD/OPTIONS
+    write    - other methods
+    hashing  - endpoints that run bcrypt (login, register, change password)
+    download - APK/patch/blob streams: own pool, outside the shared limit
+
+read, write and hashing share ADMISSION_MAX_CONCURRENCY slots, and each
+class also has its own concurrency limit, a bounded wait queue and a
+maximum wait. A freed slot goes to the waiting request of the highest
+priority class (read > write > hashing), so a login storm queues behind
+cheap reads instead of slowing everything down. A request that finds its
+class queue full, or waits too long, gets an immediate 503 with
+Retry-After.
+
+ADMISSION_ROUTE_LIMITS gives single routes their own limit and queue, e.g.
+"POST /api/auth/login=8:50" (limit 8, queue 50). Such a route keeps the
+priority of the class it would otherwise be in.
+"""
+from collections import deque
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Dict, List, Optional, Tuple
+from app.http_client import LatencyHistogram
+import asyncio
+import os
+import time
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "100"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+ADMISSION_ROUTE_LIMITS = os.getenv("ADMISSION_ROUTE_LIMITS", "")
+
+def _class_config(name: str, limit: int, queue: int, wait: float) -> Tuple[int, int, float]:
+    prefix = f"ADMISSION_{name.upper()}"
+    return (
+        int(os.getenv(f"{prefix}_LIMIT", str(limit))),
+        int(os.getenv(f"{prefix}_QUEUE", str(queue))),
+        float(os.getenv(f"{prefix}_MAX_WAIT", str(wait))),
+    )
+
+# name: (priority, (limit, queue size, max wait seconds))
+CLASSES = {
+    "read": (1, _class_config("read", 100, 200, 2)),
+    "write": (2, _class_config("write", 50, 100, 5)),
+    "hashing": (3, _class_config("hashing", (os.cpu_count() or 4) * 2, 50, 5)),
+    "download": (1, _class_config("download", 200, 100, 10)),
+}
+
+HEALTH_PATHS = {"/", "/api/health", "/api/auth/health", "/metrics"}
+HASHING_ROUTES = {
+    ("POST", "/api/auth/login"),
+    ("POST", "/api/auth/register"),
+    ("POST", "/api/users/profile/change-password"),
+}
+DOWNLOAD_PREFIXES = ("/downloads/", "/api/public/downloads/", "/api/public/blobs/")
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+class Rejected(Exception):
+    """The request was shed; answer 503"""
+
+class PriorityClass:
+    def __init__(self, name: str, priority: int, limit: int, queue_size: int, max_wait: float, shared: bool = True):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        # Whether it takes one of the ADMISSION_MAX_CONCURRENCY shared slots
+        self.shared = shared
+        self.active = 0
+        self.waiters: deque = deque()
+        self.queue_wait = LatencyHistogram()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timeouts": 0}
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self.waiters if not waiter.done())
+
+    def snapshot(self) -> dict:
+        return {
+            "priority": self.priority,
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "waiting": self.waiting,
+            **self.stats,
+            "queue_wait": self.queue_wait.snapshot(),
+        }
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.shared_active = 0
+        self.classes: Dict[str, PriorityClass] = {}
+        self.route_classes: Dict[Tuple[str, str], PriorityClass] = {}
+
+    def add_class(self, cls: PriorityClass):
+        self.classes[cls.name] = cls
+        self._ordered: List[PriorityClass] = sorted(self.classes.values(), key=lambda c: c.priority)
+
+    def add_route_limit(self, method: str, path: str, limit: int, queue_size: int):
+        base = self.classes[self.base_class(method, path)]
+        cls = PriorityClass(f"{method} {path}", base.priority, limit, queue_size, base.max_wait, base.shared)
+        self.add_class(cls)
+        self.route_classes[(method, path)] = cls
+
+    def base_class(self, method: str, path: str) -> str:
+        if (method, path) in HASHING_ROUTES:
+            return "hashing"
+        if method in READ_METHODS:
+            if path.startswith(DOWNLOAD_PREFIXES) or (path.startswith("/api/public/apps/") and "/patches/" in path):
+                return "download"
+            return "read"
+        return "write"
+
+    def classify(self, method: str, path: str) -> Optional[PriorityClass]:
+        """The class a request belongs to, or None for health checks (never limited)"""
+        path = path.rstrip("/") or "/"
+        if path in HEALTH_PATHS:
+            return None
+        route_class = self.route_classes.get((method, path))
+        if route_class is not None:
+            return route_class
+        return self.classes[self.base_class(method, path)]
+
+    def _has_room(self, cls: PriorityClass) -> bool:
+        if cls.active >= cls.limit:
+            return False
+        return not cls.shared or self.shared_active < self.max_concurrency
+
+    def _must_queue(self, cls: PriorityClass) -> bool:
+        """True if taking a slot now would jump ahead of an earlier or more important request"""
+        if cls.waiting:
+            return True
+        if not cls.shared:
+            return False
+        # Classes that are only waiting for a shared slot get it first
+        return any(
+            other.waiting and other.active < other.limit
+            for other in self._ordered
+            if other.shared and other.priority < cls.priority
+        )
+
+    def _take(self, cls: PriorityClass):
+        cls.active += 1
+        cls.stats["admitted"] += 1
+        if cls.shared:
+            self.shared_active += 1
+
+    async def acquire(self, cls: PriorityClass):
+        """Wait for a slot in `cls`; raises Rejected when shed"""
+        if self._has_room(cls) and not self._must_queue(cls):
+            self._take(cls)
+            cls.queue_wait.observe(0.0)
+            return
+        if cls.waiting >= cls.queue_size:
+            cls.stats["rejected"] += 1
+            raise Rejected(cls.name)
+
+        waiter = asyncio.get_running_loop().create_future()
+        cls.waiters.append(waiter)
+        cls.stats["queued"] += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, cls.max_wait)
+        except asyncio.TimeoutError:
+            cls.stats["timeouts"] += 1
+            raise Rejected(cls.name)
+        except BaseException:
+            # Cancelled (client went away) after the slot was handed over
+            if waiter.done() and not waiter.cancelled():
+                self.release(cls)
+            raise
+        finally:
+            cls.queue_wait.observe(time.perf_counter() - started)
+            self._prune(cls)
+            self._dispatch()
+
+    def release(self, cls: PriorityClass):
+        cls.active -= 1
+        if cls.shared:
+            self.shared_active -= 1
+        self._dispatch()
+
+    def _prune(self, cls: PriorityClass):
+        while cls.waiters and cls.waiters[0].done():
+            cls.waiters.popleft()
+
+    def _dispatch(self):
+        """Hand free slots to waiters, highest priority class first"""
+        for cls in self._ordered:
+            self._prune(cls)
+            while cls.waiters and self._has_room(cls):
+                waiter = cls.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._take(cls)
+                waiter.set_result(None)
+
+    def snapshot(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "shared_active": self.shared_active,
+            "classes": {name: cls.snapshot() for name, cls in self.classes.items()},
+        }
+
+def _parse_route_limits(value: str) -> List[Tuple[str, str, int, int]]:
+    """"POST /api/auth/login=8:50;GET /api/admin/stats=2" -> [(method, path, limit, queue)]"""
+    limits = []
+    for item in value.split(";"):
+        if not item.strip():
+            continue
+        route, _, numbers = item.partition("=")
+        method, _, path = route.strip().partition(" ")
+        limit, _, queue = numbers.partition(":")
+        limit = int(limit)
+        limits.append((method.upper(), path.strip(), limit, int(queue) if queue.strip() else limit * 2))
+    return limits
+
+def _build_controller() -> AdmissionController:
+    controller = AdmissionController()
+    for name, (priority, (limit, queue, wait)) in CLASSES.items():
+        controller.add_class(PriorityClass(name, priority, limit, queue, wait, shared=name != "download"))
+    for method, path, limit, queue in _parse_route_limits(ADMISSION_ROUTE_LIMITS):
+        controller.add_route_limit(method, path, limit, queue)
+    return controller
+
+controller = _build_controller()
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, controller: AdmissionController = controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not ADMISSION_CONTROL:
+            await self.app(scope, receive, send)
+            return
+        cls = self.controller.classify(scope["method"], scope["path"])
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(cls)
+        except Rejected:
+            response = JSONResponse(
+                {"detail": "Server busy, please retry"},
+                status_code=503,
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls)
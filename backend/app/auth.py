@@ -7,8 +7,12 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
+from app.http_client import LatencyHistogram
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
 import logging
+import time
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
@@ -225,6 +229,42 @@ def get_password_hash(password: str) -> str:
     # The wrapper will truncate again, but this ensures we're safe
     return pwd_context.hash(password)
 
+# bcrypt runs on its own threads so a burst of logins can't take every
+# threadpool worker away from DB-backed requests (bcrypt releases the GIL)
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(os.cpu_count() or 4)))
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_POOL_SIZE, thread_name_prefix="password-hash")
+hash_pool_stats = {"queued": 0, "running": 0, "completed": 0}
+hash_queue_wait = LatencyHistogram()
+hash_duration = LatencyHistogram()
+
+async def run_password_hash(fn, *args):
+    """Run `verify_password`/`get_password_hash` on the hashing pool"""
+    submitted = time.perf_counter()
+    hash_pool_stats["queued"] += 1
+
+    def job():
+        started = time.perf_counter()
+        hash_pool_stats["queued"] -= 1
+        hash_pool_stats["running"] += 1
+        hash_queue_wait.observe(started - submitted)
+        try:
+            return fn(*args)
+        finally:
+            hash_pool_stats["running"] -= 1
+            hash_pool_stats["completed"] += 1
+            hash_duration.observe(time.perf_counter() - started)
+
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, job)
+
+def hash_pool_snapshot() -> dict:
+    return {
+        "workers": HASH_POOL_SIZE,
+        **hash_pool_stats,
+        "queue_wait": hash_queue_wait.snapshot(),
+        "duration": hash_duration.snapshot(),
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -236,16 +276,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_token_subject(token: Optional[str]) -> Optional[str]:
+    """Return the email (`sub`) of a valid access token, or None. No DB access."""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+def get_token_subject(token: str = Depends(oauth2_scheme)) -> str:
+    """Authenticate by token alone, for hot endpoints that don't need the user row"""
+    email = decode_token_subject(token)
+    if email is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return email
+
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
     """Get user by email"""
     return db.query(User).filter(User.email == email).first()
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     """Authenticate a user"""
     user = get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await run_password_hash(verify_password, password, user.password_hash):
         return None
     if not user.is_active:
         return None
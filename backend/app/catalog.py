@@ -0,0 +1,263 @@
+"""
+Apps catalog storage (apps_list.json) with an incremental change log
+
+Every mutation made through the Admin Panel bumps `catalogVersion` and
+appends an entry to apps_changes.json, so desktop clients can ask for
+only what changed since the version they already have.
+"""
+from fastapi import HTTPException, status
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+import json
+import os
+import threading
+
+# How many catalog mutations to keep; older clients get a full snapshot
+CATALOG_CHANGELOG_SIZE = int(os.getenv("CATALOG_CHANGELOG_SIZE", "500"))
+
+_catalog_lock = threading.RLock()
+
+# Shipped catalog served while apps_list.json doesn't exist (or can't be read)
+DEFAULT_APPS = [
+    {
+        "id": "androama_websocket_client",
+        "name": "ANDROAMA Client",
+        "description": "Enhanced WebSocket client v2.0 with SMS, phone calls, photos, notifications, and ADB Proxy. Full device integration for seamless PC-to-phone connectivity.",
+        "version": "2.0.0",
+        "build": 13,
+        "packageName": "com.androama.websocketclient",
+        "downloadUrl": "https://androama.com/downloads/androama-client-v2.0.0-build13.apk",
+        "iconUrl": "https://androama.com/images/androama-client-icon.png",
+        "category": "Essentials",
+        "isEssential": True
+    },
+    {
+        "id": "termux",
+        "name": "Termux",
+        "description": "Terminal emulator with package management. Required for SSH tunnels and advanced features. Provides Linux-like environment on Android.",
+        "version": "0.118.0",
+        "packageName": "com.termux",
+        "downloadUrl": "https://androama.com/downloads/termux-latest.apk",
+        "iconUrl": "https://raw.githubusercontent.com/termux/termux-app/master/app/src/main/res/mipmap-xxxhdpi/ic_launcher.png",
+        "category": "Tools",
+        "isEssential": False
+    }
+]
+
+def get_apps_list_path() -> Path:
+    """Get path to apps list JSON file"""
+    backend_dir = Path(__file__).parent.parent
+    apps_file = backend_dir / "apps_list.json"
+    return apps_file
+
+def get_changelog_path() -> Path:
+    """Get path to catalog change log JSON file"""
+    return get_apps_list_path().with_name("apps_changes.json")
+
+def _write_json_atomic(path: Path, data: dict):
+    """Write JSON to a temp file and rename it over the target"""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_apps_list() -> dict:
+    """Load apps list from JSON file"""
+    apps_file = get_apps_list_path()
+    if not apps_file.exists():
+        # Return default structure
+        return {
+            "apps": [],
+            "catalogVersion": 0,
+            "lastUpdated": datetime.utcnow().isoformat() + "Z"
+        }
+
+    try:
+        with open(apps_file, 'r', encoding='utf-8') as f:
+            apps_data = json.load(f)
+        apps_data.setdefault("catalogVersion", 0)
+        return apps_data
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to load apps list: {str(e)}"
+        )
+
+def load_published_apps_list() -> dict:
+    """Load the catalog as clients see it: apps_list.json, or DEFAULT_APPS
+    when it is missing or unreadable (unlike load_apps_list, never raises)"""
+    try:
+        with open(get_apps_list_path(), 'r', encoding='utf-8') as f:
+            apps_data = json.load(f)
+    except Exception:
+        # If JSON file is missing or corrupted, fall back to default
+        apps_data = None
+    if not isinstance(apps_data, dict):
+        apps_data = {
+            "apps": DEFAULT_APPS,
+            "lastUpdated": datetime.utcnow().isoformat() + "Z"
+        }
+    apps_data.setdefault("catalogVersion", 0)
+    return apps_data
+
+def load_changelog() -> dict:
+    """Load the catalog change log (empty if missing or unreadable)"""
+    changelog_file = get_changelog_path()
+    if not changelog_file.exists():
+        return {"changes": []}
+    try:
+        with open(changelog_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        # A broken change log only costs clients a full snapshot
+        return {"changes": []}
+
+def save_apps_list(apps_data: dict, changes: Optional[list] = None):
+    """Save apps list to JSON file, recording `(op, app_id)` changes.
+
+    `op` is one of "add", "update" or "delete". Each change gets its own
+    catalog version so clients can resume from any point in the log.
+    """
+    apps_file = get_apps_list_path()
+    try:
+        with _catalog_lock:
+            version = int(apps_data.get("catalogVersion", 0))
+            now = datetime.utcnow().isoformat() + "Z"
+
+            changelog = load_changelog() if changes else None
+            for op, app_id in changes or []:
+                version += 1
+                changelog["changes"].append({
+                    "version": version,
+                    "op": op,
+                    "id": app_id,
+                    "at": now
+                })
+
+            apps_data["catalogVersion"] = version
+            apps_data["lastUpdated"] = now
+            _write_json_atomic(apps_file, apps_data)
+
+            if changelog is not None:
+                changelog["changes"] = changelog["changes"][-CATALOG_CHANGELOG_SIZE:]
+                _write_json_atomic(get_changelog_path(), changelog)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to save apps list: {str(e)}"
+        )
+
+def update_catalog(
+    mutate: Callable[[dict], Optional[list]],
+    after_save: Optional[Callable[[dict], None]] = None
+) -> dict:
+    """Load, change and save the catalog as one step under the catalog lock.
+
+    `mutate(apps_data)` edits the catalog in place and returns the
+    `(op, app_id)` changes to record; nothing is saved if it returns no
+    changes or raises (e.g. an HTTPException). `after_save(apps_data)` runs
+    under the same lock once the catalog is saved, e.g. to delete files that
+    nothing references any more. Never await between loading the catalog and
+    saving it: anything published meanwhile (patches, other admin edits)
+    would be overwritten.
+    """
+    with _catalog_lock:
+        apps_data = load_apps_list()
+        changes = mutate(apps_data)
+        if changes:
+            save_apps_list(apps_data, changes=changes)
+            if after_save is not None:
+                after_save(apps_data)
+        return apps_data
+
+def update_app_entry(app_id: str, mutate: Callable[[dict], bool]) -> Optional[dict]:
+    """Apply `mutate(app)` to one catalog entry under the catalog lock.
+
+    `mutate` returns False to skip saving. Returns the entry, or None if it
+    is gone.
+    """
+    found = {}
+
+    def apply(apps_data: dict) -> Optional[list]:
+        app = next((app for app in apps_data["apps"] if app.get("id") == app_id), None)
+        if app is None:
+            return None
+        found["app"] = app
+        return None if mutate(app) is False else [("update", app_id)]
+
+    update_catalog(apply)
+    return found.get("app")
+
+def get_catalog_changes(since: int) -> dict:
+    """Build a delta of the catalog since `since`.
+
+    Returns `full: True` with the whole catalog for new clients (`since=0`),
+    when the client is ahead of us (catalog was reset) or when the change log
+    no longer reaches back far enough.
+    """
+    with _catalog_lock:
+        # Same source as /apps/list, so a full snapshot matches what it serves
+        apps_data = load_published_apps_list()
+        changes = load_changelog()["changes"]
+
+    version = int(apps_data.get("catalogVersion", 0))
+    result = {
+        "catalogVersion": version,
+        "since": since,
+        "lastUpdated": apps_data.get("lastUpdated"),
+    }
+
+    oldest = changes[0]["version"] if changes else version + 1
+    if since == 0 or since > version or (since < version and since < oldest - 1):
+        return {**result, "full": True, "apps": apps_data["apps"]}
+
+    # First op after `since` tells us whether the client has ever seen the app
+    first_op = {}
+    for change in changes:
+        if change["version"] > since:
+            first_op.setdefault(change["id"], change["op"])
+
+    current = {app.get("id"): app for app in apps_data["apps"]}
+    added, updated, removed = [], [], []
+    for app_id, op in first_op.items():
+        app = current.get(app_id)
+        if app is None:
+            if op != "add":
+                removed.append(app_id)
+        elif op == "add":
+            added.append(app)
+        else:
+            updated.append(app)
+
+    return {**result, "full": False, "added": added, "updated": updated, "removed": removed}
+
+_index_cache = {"mtime": None, "by_filename": {}, "by_sha256": {}}
+
+def find_app(filename: Optional[str] = None, sha256: Optional[str] = None) -> Optional[dict]:
+    """Look up a catalog entry by friendly download filename or blob SHA-256.
+
+    The index is rebuilt only when apps_list.json changes on disk.
+    """
+    apps_file = get_apps_list_path()
+    try:
+        mtime = apps_file.stat().st_mtime_ns
+    except OSError:
+        return None
+    if _index_cache["mtime"] != mtime:
+        by_filename, by_sha256 = {}, {}
+        try:
+            apps = load_apps_list()["apps"]
+        except HTTPException:
+            apps = []
+        for app in apps:
+            if app.get("downloadUrl"):
+                by_filename[app["downloadUrl"].rsplit("/", 1)[-1]] = app
+            if app.get("sha256"):
+                by_sha256[app["sha256"]] = app
+            for old in app.get("history", []):
+                by_sha256.setdefault(old.get("sha256"), app)
+        _index_cache.update(mtime=mtime, by_filename=by_filename, by_sha256=by_sha256)
+    if filename is not None:
+        return _index_cache["by_filename"].get(filename)
+    return _index_cache["by_sha256"].get(sha256)
@@ -0,0 +1,190 @@
+"""
+Response compression
+
+CompressionMiddleware gzips (or brotli-compresses, when the `brotli` package
+is installed and the client accepts it) response bodies of at least
+COMPRESSION_MIN_SIZE bytes whose content type is in COMPRESSION_TYPES.
+Bodies of COMPRESSION_THREAD_SIZE bytes or more are compressed in a worker
+thread so the event loop keeps serving other requests.
+
+Only bodies sent in a single message are compressed. Streamed responses,
+anything that advertises byte ranges (the APK/patch/blob downloads) and
+responses that already carry a Content-Encoding pass through untouched.
+
+PrecompressedPayload holds a payload that many clients poll (the apps
+catalog) already encoded and compressed, with an ETag, so serving it costs
+neither serialization nor compression and unchanged polls get a 304.
+"""
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.responses import dumps
+from typing import Dict, Optional, Tuple
+import gzip
+import hashlib
+import os
+
+# brotli is optional: without it only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+    print("⚠️ Warning: brotli not installed, responses are compressed with gzip only")
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_THREAD_SIZE = int(os.getenv("COMPRESSION_THREAD_SIZE", "65536"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_TYPES = tuple(
+    t.strip() for t in os.getenv(
+        "COMPRESSION_TYPES",
+        "application/json,text/,application/javascript,image/svg+xml"
+    ).split(",") if t.strip()
+)
+# Precompressed payloads are built once, so they get the best ratio
+PRECOMPRESSED_GZIP_LEVEL = 9
+PRECOMPRESSED_BROTLI_QUALITY = 11
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY if level is None else level)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL if level is None else level, mtime=0)
+
+def choose_encoding(accept_encoding: str, available=None) -> Optional[str]:
+    """Best encoding the client accepts (honoring q=0), preferring brotli"""
+    if available is None:
+        available = ("br", "gzip") if brotli is not None else ("gzip",)
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(";", 1)[0].strip().lower()
+    return any(content_type.startswith(prefix) for prefix in COMPRESSION_TYPES)
+
+def _add_vary(headers: MutableHeaders):
+    vary = headers.get("vary")
+    if vary is None:
+        headers["vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["vary"] = f"{vary}, Accept-Encoding"
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressingResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+class _CompressingResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start_message: Optional[Message] = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    def _eligible(self, message: Message) -> bool:
+        headers = Headers(raw=message["headers"])
+        return (
+            200 <= message["status"] < 300
+            and message["status"] not in (204, 206)
+            and "content-encoding" not in headers
+            and "content-range" not in headers
+            and "accept-ranges" not in headers
+            and is_compressible(headers.get("content-type", ""))
+        )
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            self.passthrough = not self._eligible(message)
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if self.passthrough or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streamed or small: send as is
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+
+            if len(body) >= COMPRESSION_THREAD_SIZE:
+                body = await run_in_threadpool(compress, body, self.encoding)
+            else:
+                body = compress(body, self.encoding)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["content-encoding"] = self.encoding
+            headers["content-length"] = str(len(body))
+            _add_vary(headers)
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": body, "more_body": False})
+            return
+
+        await self.send(message)
+
+class PrecompressedPayload:
+    """A JSON payload encoded once and kept compressed in every supported encoding"""
+
+    def __init__(self, content, cache_control: str = "no-cache"):
+        self.body = dumps(content)
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.cache_control = cache_control
+        self.encoded: Dict[str, bytes] = {"gzip": compress(self.body, "gzip", PRECOMPRESSED_GZIP_LEVEL)}
+        if brotli is not None:
+            self.encoded["br"] = compress(self.body, "br", PRECOMPRESSED_BROTLI_QUALITY)
+
+    def _select(self, accept_encoding: str) -> Tuple[Optional[str], bytes]:
+        encoding = choose_encoding(accept_encoding, tuple(e for e in ("br", "gzip") if e in self.encoded))
+        if encoding is None or len(self.encoded[encoding]) >= len(self.body):
+            return None, self.body
+        return encoding, self.encoded[encoding]
+
+    def response(self, request: Request) -> Response:
+        headers = {"etag": self.etag, "cache-control": self.cache_control, "vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match", "")
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if self.etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+        encoding, body = self._select(request.headers.get("accept-encoding", ""))
+        if encoding is not None:
+            headers["content-encoding"] = encoding
+        return Response(body, media_type="application/json", headers=headers)
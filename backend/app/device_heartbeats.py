@@ -0,0 +1,198 @@
+"""
+Coalesced device heartbeats
+
+Heartbeats only update an in-memory entry per (user, device): repeated
+heartbeats from the same device between flushes collapse into one. Every
+DEVICE_FLUSH_INTERVAL seconds (or once DEVICE_FLUSH_BATCH devices are
+pending) the entries are written as multi-row upserts on
+user_devices (user_id, device_id), so the database sees at most one write
+per device per interval however often devices report in.
+
+Device IDs are chosen by the client, so both the number of devices per user
+(DEVICE_MAX_PER_USER) and the number of pending entries (DEVICE_MAX_PENDING)
+are capped: new devices past either limit are refused instead of growing
+memory and the user_devices table without bound.
+"""
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+from app.database import SessionLocal, dialect_insert
+from app.models import User, UserDevice
+import asyncio
+import os
+import uuid
+
+DEVICE_FLUSH_INTERVAL = float(os.getenv("DEVICE_FLUSH_INTERVAL", "15"))
+DEVICE_FLUSH_BATCH = int(os.getenv("DEVICE_FLUSH_BATCH", "1000"))
+DEVICE_MAX_PER_USER = int(os.getenv("DEVICE_MAX_PER_USER", "10"))
+DEVICE_MAX_PENDING = int(os.getenv("DEVICE_MAX_PENDING", "50000"))
+# Devices are told to report in about this often
+DEVICE_HEARTBEAT_INTERVAL = int(os.getenv("DEVICE_HEARTBEAT_INTERVAL", "60"))
+
+DEVICE_FIELDS = ("device_name", "device_model", "android_version")
+
+_pending = {}
+# Pending devices per user (email), to cap them without a database query
+_pending_per_user = Counter()
+_wakeup: Optional[asyncio.Event] = None
+_task: Optional[asyncio.Task] = None
+stats = {
+    "heartbeats": 0, "flushed": 0, "flushes": 0, "flush_errors": 0, "unknown_users": 0,
+    "shed": 0, "over_device_limit": 0,
+}
+
+def _merge(entry: Optional[dict], update: dict) -> dict:
+    """Newest last_seen wins; descriptive fields keep their last reported value"""
+    if entry is None:
+        return dict(update)
+    merged = dict(entry)
+    for field in DEVICE_FIELDS:
+        if update.get(field) is not None:
+            merged[field] = update[field]
+    merged["last_seen"] = max(entry["last_seen"], update["last_seen"])
+    return merged
+
+def _put(key: tuple, entry: dict):
+    if key in _pending:
+        _pending[key] = _merge(_pending[key], entry)
+    else:
+        _pending[key] = entry
+        _pending_per_user[key[0]] += 1
+
+def record_heartbeat(email: str, device_id: str, **fields):
+    """Note that a device is alive; written on the next flush.
+
+    Raises 429 for a user already reporting DEVICE_MAX_PER_USER other
+    devices, and 503 while DEVICE_MAX_PENDING devices await a flush.
+    """
+    key = (email, device_id)
+    if key not in _pending:
+        if _pending_per_user[email] >= DEVICE_MAX_PER_USER:
+            stats["over_device_limit"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many devices (at most {DEVICE_MAX_PER_USER} per account)"
+            )
+        if len(_pending) >= DEVICE_MAX_PENDING:
+            stats["shed"] += 1
+            if _wakeup is not None:
+                _wakeup.set()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many pending heartbeats, please retry",
+                headers={"Retry-After": str(int(DEVICE_FLUSH_INTERVAL))}
+            )
+    update = {field: fields.get(field) for field in DEVICE_FIELDS}
+    update["last_seen"] = datetime.now(timezone.utc)
+    _put(key, update)
+    stats["heartbeats"] += 1
+    if _wakeup is not None and len(_pending) >= DEVICE_FLUSH_BATCH:
+        _wakeup.set()
+
+def pending_last_seen(email: str, device_id: str) -> Optional[datetime]:
+    entry = _pending.get((email, device_id))
+    return entry["last_seen"] if entry else None
+
+def _flush_batch(entries: dict) -> int:
+    """Upsert one batch of devices (runs in a worker thread). Returns rows written."""
+    db = SessionLocal()
+    try:
+        emails = {email for email, _ in entries}
+        user_ids = dict(
+            db.query(User.email, User.id).filter(User.email.in_(emails), User.is_active == True).all()
+        )
+        known = {key: entry for key, entry in entries.items() if key[0] in user_ids}
+        stats["unknown_users"] += len(entries) - len(known)
+
+        # Only known devices, plus new ones while the user is under DEVICE_MAX_PER_USER
+        existing = {}
+        for user_id, device_id in db.query(UserDevice.user_id, UserDevice.device_id).filter(
+            UserDevice.user_id.in_(set(user_ids.values()))
+        ):
+            existing.setdefault(user_id, set()).add(device_id)
+        rows = []
+        for (email, device_id), entry in known.items():
+            devices = existing.setdefault(user_ids[email], set())
+            if device_id not in devices:
+                if len(devices) >= DEVICE_MAX_PER_USER:
+                    stats["over_device_limit"] += 1
+                    continue
+                devices.add(device_id)
+            rows.append({"id": uuid.uuid4(), "user_id": user_ids[email], "device_id": device_id, "is_active": True, **entry})
+        if rows:
+            table = UserDevice.__table__
+            stmt = dialect_insert(table)
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["user_id", "device_id"],
+                    set_={
+                        "last_seen": stmt.excluded.last_seen,
+                        "is_active": True,
+                        **{
+                            field: func.coalesce(getattr(stmt.excluded, field), table.c[field])
+                            for field in DEVICE_FIELDS
+                        },
+                    }
+                ),
+                rows
+            )
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def flush():
+    """Write all pending heartbeats"""
+    global _pending, _pending_per_user
+    if not _pending:
+        return
+    entries, _pending, _pending_per_user = _pending, {}, Counter()
+    items = list(entries.items())
+    for start in range(0, len(items), DEVICE_FLUSH_BATCH):
+        batch = dict(items[start:start + DEVICE_FLUSH_BATCH])
+        try:
+            stats["flushed"] += await run_in_threadpool(_flush_batch, batch)
+            stats["flushes"] += 1
+        except Exception as e:
+            stats["flush_errors"] += 1
+            # Fold the unwritten entries back in with anything that arrived since
+            for key, entry in items[start:]:
+                if key in _pending:
+                    _pending[key] = _merge(entry, _pending[key])
+                else:
+                    _put(key, entry)
+            print(f"⚠️ Warning: device heartbeat flush failed: {e}")
+            return
+
+async def _flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=DEVICE_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        await flush()
+
+async def start():
+    """Start the background flusher (call on application startup)"""
+    global _wakeup, _task
+    _wakeup = asyncio.Event()
+    _task = asyncio.create_task(_flush_loop())
+
+async def stop():
+    """Stop the flusher and write out whatever is still pending"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    await flush()
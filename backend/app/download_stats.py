@@ -0,0 +1,176 @@
+"""
+Batched download accounting
+
+Download endpoints only append an event to an in-memory queue. A background
+task flushes the queue every DOWNLOAD_FLUSH_INTERVAL seconds (or as soon as
+DOWNLOAD_FLUSH_BATCH events are waiting) with one multi-row insert into
+user_app_downloads and one aggregated `download_count + n` update per app.
+"""
+from fastapi.concurrency import run_in_threadpool
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import update, bindparam
+from starlette.responses import Response
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Optional
+from app.database import SessionLocal, dialect_insert
+from app.models import App, User, UserAppDownload
+from app.auth import decode_token_subject
+from app.catalog import find_app
+import asyncio
+import os
+import uuid
+
+DOWNLOAD_FLUSH_INTERVAL = float(os.getenv("DOWNLOAD_FLUSH_INTERVAL", "10"))
+DOWNLOAD_FLUSH_BATCH = int(os.getenv("DOWNLOAD_FLUSH_BATCH", "500"))
+# Oldest events are dropped (and counted in stats["dropped"]) beyond this if
+# the database is unreachable for long
+DOWNLOAD_QUEUE_MAX = int(os.getenv("DOWNLOAD_QUEUE_MAX", "100000"))
+
+_queue = deque(maxlen=DOWNLOAD_QUEUE_MAX)
+_wakeup: Optional[asyncio.Event] = None
+_task: Optional[asyncio.Task] = None
+stats = {"recorded": 0, "flushed": 0, "flushes": 0, "flush_errors": 0, "dropped": 0}
+
+def counts_as_download(method: str, response: Response) -> bool:
+    """Full downloads and the first chunk of ranged ones count; resumes and 304s don't"""
+    if method != "GET":
+        return False
+    if response.status_code == 200:
+        return True
+    ranges = getattr(response, "ranges", None)
+    return response.status_code == 206 and bool(ranges) and ranges[0][0] == 0
+
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return None
+
+def record_download(app: Optional[dict], authorization: Optional[str] = None):
+    """Queue one download of a catalog app (attributed to the token's user, if any)"""
+    if not app or not app.get("packageName"):
+        return
+    if len(_queue) == _queue.maxlen:
+        stats["dropped"] += 1
+    _queue.append((
+        app["packageName"],
+        app.get("name") or app["packageName"],
+        app.get("version"),
+        decode_token_subject(_bearer_token(authorization)),
+        datetime.now(timezone.utc),
+    ))
+    stats["recorded"] += 1
+    if _wakeup is not None and len(_queue) >= DOWNLOAD_FLUSH_BATCH:
+        _wakeup.set()
+
+def _flush_batch(events: list):
+    """Write one batch of events (runs in a worker thread)"""
+    db = SessionLocal()
+    try:
+        per_app = Counter(e[0] for e in events)
+        packages = list(per_app)
+
+        # Catalog apps get an `apps` row the first time they are downloaded
+        first_seen = {}
+        for package_name, name, version, _, _ in events:
+            first_seen.setdefault(package_name, {"name": name, "version": version})
+        db.execute(
+            dialect_insert(App.__table__).on_conflict_do_nothing(index_elements=["package_name"]),
+            [
+                {"id": uuid.uuid4(), "package_name": p, "name": v["name"], "version": v["version"], "download_count": 0}
+                for p, v in first_seen.items()
+            ]
+        )
+        app_ids = dict(
+            db.query(App.package_name, App.id).filter(App.package_name.in_(packages)).all()
+        )
+
+        db.execute(
+            update(App.__table__)
+            .where(App.__table__.c.id == bindparam("app_id"))
+            .values(download_count=App.__table__.c.download_count + bindparam("n")),
+            [{"app_id": app_ids[p], "n": n} for p, n in per_app.items()]
+        )
+
+        emails = {e[3] for e in events if e[3]}
+        user_ids = dict(
+            db.query(User.email, User.id).filter(User.email.in_(emails)).all()
+        ) if emails else {}
+        rows = [
+            {"id": uuid.uuid4(), "user_id": user_ids[email], "app_id": app_ids[package_name], "downloaded_at": at}
+            for package_name, _, _, email, at in events
+            if email in user_ids
+        ]
+        if rows:
+            db.execute(UserAppDownload.__table__.insert(), rows)
+            db.query(User).filter(
+                User.id.in_({r["user_id"] for r in rows}),
+                User.has_downloaded.isnot(True)
+            ).update({User.has_downloaded: True}, synchronize_session=False)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def flush():
+    """Drain the queue into the database"""
+    while _queue:
+        events = [_queue.popleft() for _ in range(min(len(_queue), DOWNLOAD_FLUSH_BATCH))]
+        try:
+            await run_in_threadpool(_flush_batch, events)
+        except Exception as e:
+            stats["flush_errors"] += 1
+            # Put the batch back and retry next round. If events recorded since
+            # filled the queue, the oldest of the batch are the ones dropped.
+            room = _queue.maxlen - len(_queue)
+            if len(events) > room:
+                stats["dropped"] += len(events) - room
+                events = events[len(events) - room:]
+            _queue.extendleft(reversed(events))
+            print(f"⚠️ Warning: download stats flush failed: {e}")
+            return
+        stats["flushed"] += len(events)
+        stats["flushes"] += 1
+
+async def _flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=DOWNLOAD_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        await flush()
+
+async def start():
+    """Start the background flusher (call on application startup)"""
+    global _wakeup, _task
+    _wakeup = asyncio.Event()
+    _task = asyncio.create_task(_flush_loop())
+
+async def stop():
+    """Stop the flusher and write out whatever is still queued"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    await flush()
+
+class CountingStaticFiles(StaticFiles):
+    """StaticFiles that records APK downloads served from the /downloads mount"""
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if path.endswith(".apk") and counts_as_download(scope["method"], response):
+            headers = dict(scope.get("headers", []))
+            authorization = headers.get(b"authorization", b"").decode("latin-1") or None
+            filename = os.path.basename(path)
+            app = find_app(filename=filename) or find_app(sha256=filename[:-len(".apk")])
+            record_download(app, authorization)
+        return response
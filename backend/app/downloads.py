@@ -0,0 +1,324 @@
+"""
+APK file serving with HTTP Range, conditional requests and strong ETags
+
+Resumable downloads matter for 80 MB APKs over mobile data: clients send
+`Range: bytes=N-` (optionally guarded by `If-Range`) and continue where the
+connection dropped instead of starting from zero.
+"""
+from fastapi import HTTPException, Request, status
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+import anyio
+import os
+import secrets
+import threading
+import time
+
+APK_MEDIA_TYPE = "application/vnd.android.package-archive"
+
+# How long a resolved path is reused before resolving it again (the file itself
+# is re-stat'ed on every request)
+DOWNLOAD_STAT_TTL = float(os.getenv("DOWNLOAD_STAT_TTL", "5"))
+# Requests with more ranges than this are served as a plain 200
+MAX_RANGES = 16
+CHUNK_SIZE = 256 * 1024
+
+class FileInfo(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    etag: str
+    last_modified: str
+    inode: int = 0
+    mtime_ns: int = 0
+
+def get_public_downloads_dir() -> Path:
+    """Get path to the public/downloads directory served to clients"""
+    # backend/app/downloads.py -> backend/app -> backend -> project root
+    project_root = Path(__file__).parent.parent.parent
+    return project_root / "public" / "downloads"
+
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+def _requested_path(cache_key: Tuple[str, str]) -> str:
+    """The download path a cache entry was looked up by, before resolving symlinks"""
+    return os.path.abspath(os.path.join(*cache_key))
+
+def _same_file(cache_key: Tuple[str, str], info: FileInfo) -> bool:
+    """Whether the requested path still leads to the file `info` was taken from"""
+    try:
+        # Follows the friendly-name symlink, so a relink shows up as a new inode
+        st = os.stat(_requested_path(cache_key))
+    except OSError:
+        return False
+    return (st.st_ino, st.st_size, st.st_mtime_ns) == (info.inode, info.size, info.mtime_ns)
+
+def stat_file(root: Path, filename: str) -> FileInfo:
+    """Resolve `filename` under `root` and stat it.
+
+    The resolved path is cached for DOWNLOAD_STAT_TTL seconds, but every hit
+    is checked against a fresh stat (inode, size, mtime), so a relinked or
+    deleted file is never served with the old size and ETag.
+    """
+    cache_key = (str(root), filename)
+    now = time.monotonic()
+    cached = _file_cache.get(cache_key)
+    if cached and cached[0] > now and _same_file(cache_key, cached[1]):
+        return cached[1]
+
+    root = root.resolve()
+    file_path = (root / filename).resolve()
+
+    # Security: prevent directory traversal
+    try:
+        file_path.relative_to(root)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid file path"
+        )
+
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        st = None
+    if st is None or not file_path.is_file():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"File not found: {filename}"
+        )
+
+    info = FileInfo(
+        path=str(file_path),
+        size=st.st_size,
+        mtime=st.st_mtime,
+        etag=f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+        last_modified=formatdate(st.st_mtime, usegmt=True),
+        inode=st.st_ino,
+        mtime_ns=st.st_mtime_ns,
+    )
+    with _file_cache_lock:
+        if len(_file_cache) > 1024:
+            _file_cache.clear()
+        _file_cache[cache_key] = (now + DOWNLOAD_STAT_TTL, info)
+    return info
+
+def forget_file(path: Path):
+    """Drop cached stat results for `path` (after it is relinked or deleted)"""
+    paths = {os.path.abspath(path), str(Path(path).resolve())}
+    with _file_cache_lock:
+        for key in [
+            key for key, (_, info) in _file_cache.items()
+            if info.path in paths or _requested_path(key) in paths
+        ]:
+            del _file_cache[key]
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a `Range` header into sorted, merged inclusive (start, end) pairs.
+
+    Returns None when the header should be ignored (malformed or too many
+    ranges) and an empty list when no range is satisfiable (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+    for part in parts:
+        start_s, sep, end_s = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s == "":
+                # Suffix range: last N bytes
+                length = int(end_s)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(start_s)
+                end = int(end_s) if end_s else size - 1
+                if end_s and start > end:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size and start <= end:
+            ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    """Compare an If-None-Match / If-Range header against our ETag"""
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+class RangeFileResponse(Response):
+    """Streams byte ranges of a file, using zero-copy sendfile when the server supports it"""
+
+    def __init__(
+        self,
+        info: FileInfo,
+        ranges: Optional[List[Tuple[int, int]]] = None,
+        filename: Optional[str] = None,
+        media_type: str = APK_MEDIA_TYPE,
+        headers: Optional[dict] = None,
+        send_body: bool = True,
+    ):
+        self.info = info
+        self.ranges = (ranges or [(0, info.size - 1)]) if info.size else []
+        self.partial = bool(ranges)
+        self.send_body = send_body
+        self.status_code = 206 if self.partial else 200
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+        self.headers.setdefault("accept-ranges", "bytes")
+        self.headers.setdefault("etag", info.etag)
+        self.headers.setdefault("last-modified", info.last_modified)
+        if filename:
+            self.headers.setdefault(
+                "content-disposition",
+                f"attachment; filename*=utf-8''{quote(filename)}"
+            )
+
+        self.boundary = None
+        if self.partial and len(self.ranges) > 1:
+            self.boundary = secrets.token_hex(16)
+            self.headers["content-type"] = f"multipart/byteranges; boundary={self.boundary}"
+            self.headers["content-length"] = str(
+                sum(len(self._part_header(s, e)) + (e - s + 1) for s, e in self.ranges)
+                + len(self._closing())
+            )
+        else:
+            self.headers["content-type"] = media_type
+            if self.partial:
+                start, end = self.ranges[0]
+                self.headers["content-range"] = f"bytes {start}-{end}/{info.size}"
+                self.headers["content-length"] = str(end - start + 1)
+            else:
+                self.headers["content-length"] = str(info.size)
+
+    def _part_header(self, start: int, end: int) -> bytes:
+        return (
+            f"\r\n--{self.boundary}\r\n"
+            f"Content-Type: {self.media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{self.info.size}\r\n\r\n"
+        ).encode("latin-1")
+
+    def _closing(self) -> bytes:
+        return f"\r\n--{self.boundary}--\r\n".encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if not self.send_body or not self.ranges:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+        async with await anyio.open_file(self.info.path, mode="rb") as f:
+            for start, end in self.ranges:
+                if self.boundary:
+                    await send({
+                        "type": "http.response.body",
+                        "body": self._part_header(start, end),
+                        "more_body": True,
+                    })
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopy",
+                        "file": f.wrapped.fileno(),
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": True,
+                    })
+                    continue
+                await f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        closing = self._closing() if self.boundary else b""
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+def file_response(
+    request: Request,
+    info: FileInfo,
+    filename: Optional[str] = None,
+    media_type: str = APK_MEDIA_TYPE,
+    headers: Optional[dict] = None,
+) -> Response:
+    """Build a 200/206/304/416 response for `info` honoring Range and conditional headers"""
+    headers = dict(headers or {})
+    validators = {"etag": info.etag, "last-modified": info.last_modified, **headers}
+
+    # Conditional GET: If-None-Match wins over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, info.etag, weak=True):
+            return Response(status_code=304, headers=validators)
+    elif _not_modified_since(request.headers.get("if-modified-since"), info.mtime):
+        return Response(status_code=304, headers=validators)
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header:
+        if_range = request.headers.get("if-range")
+        if if_range is None or (
+            _etag_matches(if_range, info.etag, weak=False)
+            if if_range.strip().startswith(('"', 'W/'))
+            else if_range.strip() == info.last_modified
+        ):
+            ranges = parse_range_header(range_header, info.size)
+            if ranges == []:
+                return Response(
+                    status_code=416,
+                    headers={"content-range": f"bytes */{info.size}", "accept-ranges": "bytes", **validators},
+                )
+
+    return RangeFileResponse(
+        info,
+        ranges=ranges,
+        filename=filename,
+        media_type=media_type,
+        headers=headers,
+        send_body=request.method != "HEAD",
+    )
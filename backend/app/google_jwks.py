@@ -0,0 +1,175 @@
+"""
+Local verification of Google ID tokens
+
+Google signs ID tokens with keys published as a JWKS. The key set is
+fetched once and kept for as long as the response's Cache-Control max-age
+allows, so verifying a token is a local RS256 check. A token signed with a
+key we don't know yet (Google rotated keys) triggers one refetch, shared by
+all concurrent requests and rate-limited so bogus `kid`s can't make us hammer
+Google.
+
+The key source is pluggable: GOOGLE_JWKS_FILE points at a local JWKS for
+tests and air-gapped setups; otherwise keys come from GOOGLE_JWKS_URL.
+"""
+from typing import Optional, Tuple
+from jose import jwt, JWTError
+from app.http_client import http_client
+import asyncio
+import httpx
+import json
+import os
+import re
+import time
+
+GOOGLE_JWKS_URL = os.getenv("GOOGLE_JWKS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+GOOGLE_JWKS_FILE = os.getenv("GOOGLE_JWKS_FILE")
+# Used when the JWKS response carries no usable max-age
+GOOGLE_JWKS_DEFAULT_TTL = float(os.getenv("GOOGLE_JWKS_DEFAULT_TTL", "3600"))
+# Minimum seconds between refetches triggered by unknown key ids
+GOOGLE_JWKS_MIN_REFETCH = float(os.getenv("GOOGLE_JWKS_MIN_REFETCH", "30"))
+GOOGLE_TOKEN_LEEWAY = int(os.getenv("GOOGLE_TOKEN_LEEWAY", "60"))
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+class TokenVerificationError(Exception):
+    """The token is not a valid Google ID token for us"""
+
+class KeySourceError(Exception):
+    """The key set could not be loaded (network or configuration problem)"""
+
+def parse_max_age(cache_control: Optional[str], age: Optional[str] = None) -> Optional[float]:
+    """Remaining freshness lifetime from Cache-Control (and Age) headers"""
+    if not cache_control:
+        return None
+    if re.search(r"\b(no-cache|no-store)\b", cache_control):
+        return 0.0
+    match = re.search(r"\bmax-age=(\d+)", cache_control)
+    if not match:
+        return None
+    try:
+        elapsed = float(age) if age else 0.0
+    except ValueError:
+        elapsed = 0.0
+    return max(float(match.group(1)) - elapsed, 0.0)
+
+class KeySource:
+    """Where the JWKS comes from"""
+
+    async def fetch(self) -> Tuple[dict, Optional[float]]:
+        """Return the JWKS and how many seconds it may be cached (None if unknown)"""
+        raise NotImplementedError
+
+class HTTPKeySource(KeySource):
+    def __init__(self, url: str = GOOGLE_JWKS_URL, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    async def fetch(self) -> Tuple[dict, Optional[float]]:
+        try:
+            response = await http_client.get(self.url, upstream="google-jwks", timeout=self.timeout)
+            response.raise_for_status()
+            return response.json(), parse_max_age(
+                response.headers.get("cache-control"), response.headers.get("age")
+            )
+        except (httpx.HTTPError, ValueError) as e:
+            raise KeySourceError(f"Could not fetch {self.url}: {e}")
+
+class StaticKeySource(KeySource):
+    """Fixed key set, from a dict or a JWKS file"""
+
+    def __init__(self, jwks: Optional[dict] = None, path: Optional[str] = None):
+        self.jwks = jwks
+        self.path = path
+
+    async def fetch(self) -> Tuple[dict, Optional[float]]:
+        if self.jwks is not None:
+            return self.jwks, None
+        try:
+            with open(self.path) as f:
+                return json.load(f), None
+        except (OSError, ValueError) as e:
+            raise KeySourceError(f"Could not read {self.path}: {e}")
+
+class JWKSCache:
+    """Keys by `kid`, refreshed on expiry or when an unknown kid shows up"""
+
+    def __init__(self, source: KeySource, default_ttl: float = GOOGLE_JWKS_DEFAULT_TTL,
+                 min_refetch_interval: float = GOOGLE_JWKS_MIN_REFETCH):
+        self.source = source
+        self.default_ttl = default_ttl
+        self.min_refetch_interval = min_refetch_interval
+        self._keys = {}
+        self._expires = 0.0
+        self._fetched = 0.0
+        self._inflight: Optional[asyncio.Future] = None
+        self.stats = {"fetches": 0, "fetch_errors": 0, "unknown_kid_refetches": 0}
+
+    async def _load(self):
+        try:
+            jwks, max_age = await self.source.fetch()
+        except KeySourceError:
+            self.stats["fetch_errors"] += 1
+            raise
+        self._keys = {key["kid"]: key for key in jwks.get("keys", []) if "kid" in key}
+        self._fetched = time.monotonic()
+        self._expires = self._fetched + (self.default_ttl if max_age is None else max_age)
+        self.stats["fetches"] += 1
+
+    async def refresh(self):
+        """Reload the key set; concurrent callers share a single fetch"""
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._load())
+            self._inflight.add_done_callback(lambda _: setattr(self, "_inflight", None))
+        # shield: one caller giving up must not cancel the fetch for the rest
+        await asyncio.shield(self._inflight)
+
+    async def get_key(self, kid: str) -> Optional[dict]:
+        now = time.monotonic()
+        if now >= self._expires:
+            try:
+                await self.refresh()
+            except KeySourceError:
+                # Keep serving the keys we have rather than failing every login
+                if not self._keys:
+                    raise
+                self._expires = now + self.min_refetch_interval
+        elif kid not in self._keys and now - self._fetched >= self.min_refetch_interval:
+            if self._inflight is None:
+                self.stats["unknown_kid_refetches"] += 1
+            await self.refresh()
+        return self._keys.get(kid)
+
+def _default_source() -> KeySource:
+    if GOOGLE_JWKS_FILE:
+        return StaticKeySource(path=GOOGLE_JWKS_FILE)
+    return HTTPKeySource()
+
+jwks_cache = JWKSCache(_default_source())
+
+async def verify_id_token(token: str, audience: str, cache: Optional[JWKSCache] = None) -> dict:
+    """Check signature, audience, issuer and expiry locally; return the claims"""
+    cache = cache or jwks_cache
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError as e:
+        raise TokenVerificationError(f"Malformed token: {e}")
+    kid = header.get("kid")
+    if not kid or header.get("alg") != "RS256":
+        raise TokenVerificationError("Unsupported token header")
+
+    key = await cache.get_key(kid)
+    if key is None:
+        raise TokenVerificationError("Token signed with an unknown key")
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience=audience,
+            # at_hash can only be checked against the access token, which we don't have
+            options={"verify_at_hash": False, "leeway": GOOGLE_TOKEN_LEEWAY}
+        )
+    except JWTError as e:
+        raise TokenVerificationError(str(e))
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise TokenVerificationError("Token issuer mismatch")
+    return claims
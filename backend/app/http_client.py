@@ -0,0 +1,254 @@
+"""
+Shared outbound HTTP client
+
+One pooled httpx.AsyncClient for the whole process (opened on startup,
+closed on shutdown) so calls to Google and other upstreams reuse keep-alive
+connections, over HTTP/2 when `h2` is installed. On top of it:
+
+- at most HTTP_PER_HOST_LIMIT concurrent requests per host
+- retries with full-jitter exponential backoff, only where a retry is safe
+  (connection failures always; timeouts and 5xx/429 only for GET/HEAD)
+- a per-upstream circuit breaker: after HTTP_BREAKER_THRESHOLD consecutive
+  failures calls fail immediately for HTTP_BREAKER_COOLDOWN seconds, then a
+  single trial request decides whether it closes again
+- per-upstream latency histograms
+"""
+from typing import Dict, Optional
+import asyncio
+import httpx
+import os
+import random
+import time
+
+# h2 is optional: without it the client speaks HTTP/1.1 with keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+    print("⚠️ Warning: h2 not installed, outbound HTTP uses HTTP/1.1")
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "20"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2"))
+HTTP_BREAKER_THRESHOLD = int(os.getenv("HTTP_BREAKER_THRESHOLD", "5"))
+HTTP_BREAKER_COOLDOWN = float(os.getenv("HTTP_BREAKER_COOLDOWN", "30"))
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+RETRY_STATUSES = (429, 502, 503, 504)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class CircuitOpenError(httpx.RequestError):
+    """The upstream's circuit breaker is open; the request was not sent"""
+
+class LatencyHistogram:
+    """Cumulative latency histogram (Prometheus-style buckets, seconds)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def snapshot(self) -> dict:
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = total
+        return {"buckets": cumulative, "count": self.count, "sum": round(self.sum, 6)}
+
+class CircuitBreaker:
+    """Opens after `threshold` failures in a row and, once `cooldown` has
+    passed, lets a single trial call through to decide whether to close.
+
+    allow() hands out a ticket per admitted call (None while open); pass it
+    back to record_success/record_failure so a late verdict from a call
+    admitted before the breaker opened can't be mistaken for the trial's.
+    """
+
+    def __init__(self, threshold: int = HTTP_BREAKER_THRESHOLD, cooldown: float = HTTP_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial: Optional[object] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    @property
+    def trial_in_flight(self) -> bool:
+        return self._trial is not None
+
+    def is_trial(self, ticket: Optional[object]) -> bool:
+        return ticket is not None and ticket is self._trial
+
+    def allow(self) -> Optional[object]:
+        state = self.state
+        if state == "closed":
+            return object()
+        if state == "half_open" and self._trial is None:
+            self._trial = object()
+            return self._trial
+        return None
+
+    def record_success(self, ticket: Optional[object] = None):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = None
+
+    def record_failure(self, ticket: Optional[object] = None):
+        self.failures += 1
+        if self.is_trial(ticket):
+            # The trial failed: stay open for another cooldown
+            self._trial = None
+            self.opened_at = time.monotonic()
+        elif self.opened_at is None and self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+class Upstream:
+    """Per-upstream bookkeeping"""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyHistogram()
+        self.stats = {"requests": 0, "failures": 0, "retries": 0, "rejected": 0}
+
+class HTTPClient:
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.upstreams: Dict[str, Upstream] = {}
+
+    def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on demand too, so scripts and tests work without the app lifespan
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(HTTP_PER_HOST_LIMIT)
+        return self._host_limits[host]
+
+    def upstream(self, name: str) -> Upstream:
+        if name not in self.upstreams:
+            self.upstreams[name] = Upstream()
+        return self.upstreams[name]
+
+    async def request(self, method: str, url: str, *, upstream: Optional[str] = None,
+                      retries: Optional[int] = None, **kwargs) -> httpx.Response:
+        """Send a request through the shared pool with retries and the circuit breaker.
+
+        Raises CircuitOpenError (an httpx.RequestError) without sending anything
+        while the upstream's breaker is open.
+        """
+        method = method.upper()
+        host = httpx.URL(url).host
+        target = self.upstream(upstream or host)
+        retries = HTTP_RETRIES if retries is None else retries
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            # The half-open trial's ticket must always get a verdict
+            ticket = target.breaker.allow()
+            if ticket is None:
+                target.stats["rejected"] += 1
+                raise CircuitOpenError(f"Circuit open for {upstream or host}")
+
+            target.stats["requests"] += 1
+            started = time.perf_counter()
+            try:
+                async with self._host_limit(host):
+                    response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                target.latency.observe(time.perf_counter() - started)
+                target.stats["failures"] += 1
+                target.breaker.record_failure(ticket)
+                # A request that never connected can't have been processed
+                retryable = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retryable or attempt >= retries:
+                    raise
+            except asyncio.CancelledError:
+                # Caller went away: says nothing about the upstream, but a trial
+                # left unresolved would keep the breaker rejecting forever
+                if target.breaker.is_trial(ticket):
+                    target.breaker.record_failure(ticket)
+                raise
+            except Exception:
+                # Decoding errors, redirect loops, ...: no usable response
+                target.latency.observe(time.perf_counter() - started)
+                target.stats["failures"] += 1
+                target.breaker.record_failure(ticket)
+                raise
+            else:
+                target.latency.observe(time.perf_counter() - started)
+                if response.status_code < 500:
+                    target.breaker.record_success(ticket)
+                else:
+                    target.stats["failures"] += 1
+                    target.breaker.record_failure(ticket)
+                if response.status_code not in RETRY_STATUSES or not idempotent or attempt >= retries:
+                    return response
+                await response.aclose()
+
+            attempt += 1
+            target.stats["retries"] += 1
+            # Full jitter: spread retries out so callers don't stampede together
+            await asyncio.sleep(random.uniform(0, HTTP_RETRY_BACKOFF * 2 ** attempt))
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def snapshot(self) -> dict:
+        """Breaker state, counters and latency per upstream"""
+        return {
+            name: {"state": u.breaker.state, **u.stats, "latency": u.latency.snapshot()}
+            for name, u in self.upstreams.items()
+        }
+
+    async def start(self):
+        """Open the connection pool (call on application startup)"""
+        self._client = self._create_client()
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+http_client = HTTPClient()
@@ -0,0 +1,289 @@
+"""
+License state and signed offline license tokens
+
+The desktop app asks for a license token once and then verifies it locally
+with the public key (GET /api/public/license/public-key) instead of calling
+the license endpoints on every check. Tokens are RS256 JWTs carrying the
+tier, status, subscription end and edition; they expire after
+LICENSE_TOKEN_TTL seconds (or at subscription end, if sooner) and carry a
+`refresh_after` time after which the client should fetch a fresh one, which
+is how revocations and plan changes reach offline installs.
+
+`users.license_valid` holds precomputed validity. ORM writes to a user keep it
+in step, and a background sweeper walks the subscription_end index every
+LICENSE_SWEEP_INTERVAL seconds to flip subscriptions that ran out to
+`expired` in batches of LICENSE_SWEEP_BATCH.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from jose import jwt
+from sqlalchemy import and_, case, event, or_, update
+from app.database import SessionLocal
+from app.models import User
+import asyncio
+import base64
+import hashlib
+import os
+import time
+
+LICENSE_TOKEN_TTL = int(os.getenv("LICENSE_TOKEN_TTL", str(7 * 24 * 3600)))
+LICENSE_REFRESH_INTERVAL = int(os.getenv("LICENSE_REFRESH_INTERVAL", str(24 * 3600)))
+LICENSE_TOKEN_ISSUER = os.getenv("LICENSE_TOKEN_ISSUER", "androama")
+LICENSE_TOKEN_AUDIENCE = "androama-desktop"
+LICENSE_TOKEN_ALGORITHM = "RS256"
+# Development only: sign with a per-process throwaway key when none is configured
+LICENSE_EPHEMERAL_KEY = os.getenv("LICENSE_EPHEMERAL_KEY", "false").lower() == "true"
+
+# Bulk verification memoizes validity per distinct (status, subscription_end)
+LICENSE_STATE_CACHE_SIZE = int(os.getenv("LICENSE_STATE_CACHE_SIZE", "4096"))
+LICENSE_STATE_CACHE_TTL = float(os.getenv("LICENSE_STATE_CACHE_TTL", "300"))
+
+LICENSE_SWEEP_INTERVAL = float(os.getenv("LICENSE_SWEEP_INTERVAL", "60"))
+LICENSE_SWEEP_BATCH = int(os.getenv("LICENSE_SWEEP_BATCH", "500"))
+
+# Statuses that are invalid regardless of subscription_end
+INVALID_STATUSES = ("expired", "cancelled")
+
+_keys = {}
+_state_cache = OrderedDict()
+_sweep_task: Optional[asyncio.Task] = None
+sweep_stats = {"runs": 0, "expired": 0, "errors": 0, "last_run": None}
+
+def subscription_state(subscription_status: Optional[str], subscription_end: Optional[datetime]) -> Tuple[bool, str]:
+    """Whether a subscription is currently valid, and why not if it isn't"""
+    if subscription_status == "expired":
+        return False, "Subscription expired"
+    if subscription_status == "cancelled":
+        return False, "Subscription cancelled"
+    if subscription_end:
+        end = subscription_end
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) > end:
+            return False, "Subscription expired"
+    return True, ""
+
+def license_state(user: User) -> Tuple[bool, str]:
+    """Whether the user's license is currently valid, and why not if it isn't"""
+    if user.license_valid is False:
+        if user.subscription_status == "cancelled":
+            return False, "Subscription cancelled"
+        return False, "Subscription expired"
+    # A subscription can run out between two sweeps; checking the end date of
+    # the loaded row keeps answers exact without another query
+    return subscription_state(user.subscription_status, user.subscription_end)
+
+@event.listens_for(User, "before_insert")
+@event.listens_for(User, "before_update")
+def _sync_license_valid(mapper, connection, target: User):
+    """Keep the precomputed flag in step with ORM writes to subscription fields"""
+    target.license_valid = subscription_state(target.subscription_status, target.subscription_end)[0]
+
+def cached_subscription_state(subscription_status: Optional[str], subscription_end: Optional[datetime]) -> Tuple[bool, str]:
+    """subscription_state memoized on the subscription fields.
+
+    A valid result is only reused until its subscription_end (and at most
+    LICENSE_STATE_CACHE_TTL seconds), so expiry is never served late.
+    """
+    key = (subscription_status, subscription_end)
+    now = time.time()
+    hit = _state_cache.get(key)
+    if hit is not None and hit[1] > now:
+        _state_cache.move_to_end(key)
+        return hit[0]
+
+    result = subscription_state(subscription_status, subscription_end)
+    expires = now + LICENSE_STATE_CACHE_TTL
+    if result[0] and subscription_end is not None:
+        end = subscription_end if subscription_end.tzinfo else subscription_end.replace(tzinfo=timezone.utc)
+        expires = min(expires, end.timestamp())
+    _state_cache[key] = (result, expires)
+    if len(_state_cache) > LICENSE_STATE_CACHE_SIZE:
+        _state_cache.popitem(last=False)
+    return result
+
+def _load_private_key() -> str:
+    pem = os.getenv("LICENSE_SIGNING_KEY")
+    key_file = os.getenv("LICENSE_SIGNING_KEY_FILE")
+    if not pem and key_file:
+        with open(key_file) as f:
+            pem = f.read()
+    if pem:
+        return pem.replace("\\n", "\n")
+
+    # Every worker would sign with (and publish) a different key, and all
+    # licenses would break on restart: refuse unless explicitly in development
+    if not LICENSE_EPHEMERAL_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="License signing is not configured"
+        )
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    print("⚠️ Warning: LICENSE_EPHEMERAL_KEY set, using a throwaway license signing key (development only)")
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+
+def _signing_keys() -> dict:
+    if not _keys:
+        from cryptography.hazmat.primitives import serialization
+        private_pem = _load_private_key()
+        private_key = serialization.load_pem_private_key(private_pem.encode(), password=None)
+        public_der = private_key.public_key().public_bytes(
+            serialization.Encoding.DER,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        _keys.update(
+            private=private_pem,
+            public=private_key.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode(),
+            kid=base64.urlsafe_b64encode(hashlib.sha256(public_der).digest()[:12]).decode().rstrip("="),
+        )
+    return _keys
+
+def public_key() -> dict:
+    """Public verification key for desktop clients"""
+    keys = _signing_keys()
+    return {"algorithm": LICENSE_TOKEN_ALGORITHM, "kid": keys["kid"], "public_key": keys["public"]}
+
+def issue_license_token(user: User, now: Optional[datetime] = None) -> dict:
+    """Sign a time-bounded license assertion for the user"""
+    now = now or datetime.now(timezone.utc)
+    is_valid, reason = license_state(user)
+    expires = now + timedelta(seconds=LICENSE_TOKEN_TTL)
+    refresh_after = now + timedelta(seconds=min(LICENSE_REFRESH_INTERVAL, LICENSE_TOKEN_TTL))
+
+    subscription_end = user.subscription_end
+    if subscription_end is not None and subscription_end.tzinfo is None:
+        subscription_end = subscription_end.replace(tzinfo=timezone.utc)
+    # A token never outlives the subscription it vouches for
+    if is_valid and subscription_end is not None:
+        expires = min(expires, subscription_end)
+        refresh_after = min(refresh_after, expires)
+
+    claims = {
+        "iss": LICENSE_TOKEN_ISSUER,
+        "aud": LICENSE_TOKEN_AUDIENCE,
+        "sub": str(user.id),
+        "license_key": user.license_key,
+        "tier": user.subscription_tier or "beta",
+        "status": "valid" if is_valid else "expired",
+        "valid": is_valid,
+        "reason": reason,
+        "payment_status": user.subscription_status or "active",
+        "subscription_end": subscription_end.isoformat() if subscription_end else None,
+        "edition": user.edition or "monitor",
+        "iat": int(now.timestamp()),
+        "exp": int(expires.timestamp()),
+        "refresh_after": int(refresh_after.timestamp()),
+    }
+    keys = _signing_keys()
+    token = jwt.encode(claims, keys["private"], algorithm=LICENSE_TOKEN_ALGORITHM, headers={"kid": keys["kid"]})
+    return {
+        "success": True,
+        "token": token,
+        "algorithm": LICENSE_TOKEN_ALGORITHM,
+        "kid": keys["kid"],
+        "expires_at": expires.isoformat(),
+        "refresh_after": refresh_after.isoformat(),
+    }
+
+def verify_license_token(token: str) -> dict:
+    """Decode and check a license token (what the desktop does locally)"""
+    return jwt.decode(
+        token,
+        _signing_keys()["public"],
+        algorithms=[LICENSE_TOKEN_ALGORITHM],
+        audience=LICENSE_TOKEN_AUDIENCE,
+        issuer=LICENSE_TOKEN_ISSUER
+    )
+
+def _due_filter(now: datetime, backfill: bool = False):
+    status = User.subscription_status
+    # Ran out but still marked as a live subscription (a range scan on ix_users_subscription_end)
+    due = and_(User.subscription_end <= now, or_(status.is_(None), status.notin_(INVALID_STATUSES)))
+    if not backfill:
+        return due
+    return or_(
+        due,
+        # Marked expired/cancelled but the flag hasn't caught up. Only rows
+        # written before the flag existed (or outside the ORM) can be like
+        # this, and the query can't use an index, so only migrations ask for it.
+        and_(User.license_valid.is_(True), status.in_(INVALID_STATUSES)),
+    )
+
+def sweep_expired(now: Optional[datetime] = None, backfill: bool = False) -> int:
+    """Expire every due subscription in batches. Returns the number of rows changed.
+
+    `backfill` also fixes rows whose status is already expired/cancelled but
+    whose license_valid flag is still set (a full scan; see init_db).
+    """
+    now = now or datetime.now(timezone.utc)
+    changed = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = [row.id for row in db.query(User.id).filter(_due_filter(now, backfill)).order_by(
+                User.subscription_end
+            ).limit(LICENSE_SWEEP_BATCH)]
+            if not ids:
+                break
+            db.execute(
+                update(User.__table__)
+                .where(User.__table__.c.id.in_(ids))
+                .values(
+                    license_valid=False,
+                    subscription_status=case(
+                        (User.__table__.c.subscription_status.in_(INVALID_STATUSES), User.__table__.c.subscription_status),
+                        else_="expired"
+                    )
+                )
+            )
+            db.commit()
+            changed += len(ids)
+            if len(ids) < LICENSE_SWEEP_BATCH:
+                break
+        return changed
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def _sweep_loop():
+    while True:
+        try:
+            expired = await run_in_threadpool(sweep_expired)
+            sweep_stats["expired"] += expired
+            sweep_stats["runs"] += 1
+            sweep_stats["last_run"] = datetime.now(timezone.utc).isoformat()
+        except Exception as e:
+            sweep_stats["errors"] += 1
+            print(f"⚠️ Warning: subscription expiry sweep failed: {e}")
+        await asyncio.sleep(LICENSE_SWEEP_INTERVAL)
+
+async def start():
+    """Start the subscription expiry sweeper (call on application startup)"""
+    global _sweep_task
+    if not (os.getenv("LICENSE_SIGNING_KEY") or os.getenv("LICENSE_SIGNING_KEY_FILE") or LICENSE_EPHEMERAL_KEY):
+        print("⚠️ Warning: LICENSE_SIGNING_KEY not set, license tokens will not be issued")
+    _sweep_task = asyncio.create_task(_sweep_loop())
+
+async def stop():
+    global _sweep_task
+    if _sweep_task is not None:
+        _sweep_task.cancel()
+        try:
+            await _sweep_task
+        except asyncio.CancelledError:
+            pass
+        _sweep_task = None
@@ -0,0 +1,114 @@
+"""
+Outgoing email
+
+MAIL_BACKEND=smtp sends through SMTP_HOST/SMTP_PORT. For local development and
+tests point it at a throwaway SMTP server, e.g.
+`python -m aiosmtpd -n -l localhost:1025` with SMTP_HOST=localhost SMTP_PORT=1025.
+MAIL_BACKEND=console just logs messages (it must be chosen explicitly; nothing
+is delivered, so jobs using it never mark anyone as notified).
+"""
+from collections import deque
+from email.message import EmailMessage
+from typing import Deque, Optional
+import os
+import smtplib
+
+MAIL_BACKEND = os.getenv("MAIL_BACKEND", "smtp")
+MAIL_FROM = os.getenv("MAIL_FROM", "ANDROAMA <no-reply@androama.com>")
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Console backend: how many recent messages to keep for inspection
+CONSOLE_OUTBOX_SIZE = int(os.getenv("CONSOLE_OUTBOX_SIZE", "100"))
+
+def build_message(to: str, subject: str, body: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+class MailerConnection:
+    """One open connection to the mail backend (blocking; use from a worker thread)"""
+
+    def send(self, message: EmailMessage):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class Mailer:
+    """Factory for connections; senders hold one connection each and reuse it"""
+
+    # False for backends that only pretend to send
+    delivers = True
+
+    def connect(self) -> MailerConnection:
+        raise NotImplementedError
+
+class SMTPConnection(MailerConnection):
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+
+    def send(self, message: EmailMessage):
+        self.smtp.send_message(message)
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except smtplib.SMTPException:
+            self.smtp.close()
+
+class SMTPMailer(Mailer):
+    def __init__(
+        self,
+        host: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        username: Optional[str] = SMTP_USERNAME,
+        password: Optional[str] = SMTP_PASSWORD,
+        starttls: bool = SMTP_STARTTLS,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+    def connect(self) -> MailerConnection:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or "")
+        return SMTPConnection(smtp)
+
+class ConsoleConnection(MailerConnection):
+    def __init__(self, outbox: Deque[EmailMessage]):
+        self.outbox = outbox
+
+    def send(self, message: EmailMessage):
+        self.outbox.append(message)
+        print(f"📧 {message['To']}: {message['Subject']}")
+
+class ConsoleMailer(Mailer):
+    """Logs instead of sending; keeps the last `outbox_size` messages in `outbox`"""
+
+    delivers = False
+
+    def __init__(self, outbox_size: int = CONSOLE_OUTBOX_SIZE):
+        self.outbox: Deque[EmailMessage] = deque(maxlen=outbox_size)
+
+    def connect(self) -> MailerConnection:
+        return ConsoleConnection(self.outbox)
+
+def get_mailer() -> Mailer:
+    """Mailer selected by MAIL_BACKEND"""
+    if MAIL_BACKEND == "console":
+        return ConsoleMailer()
+    if MAIL_BACKEND != "smtp":
+        print(f"⚠️ Warning: Unknown MAIL_BACKEND '{MAIL_BACKEND}', using SMTP")
+    return SMTPMailer()
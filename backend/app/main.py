@@ -1,9 +1,21 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pathlib import Path
-from app.routers import auth, users, community, public, admin, stripe
+from app.routers import auth, users, community, public, admin, stripe, devices, diagnostics
+from app.storage import get_downloads_dir
+from app import patches, download_stats, notifications, licensing, device_heartbeats, stripe_events, metrics
+from app.download_stats import CountingStaticFiles
+from app.settings import settings
+from app.http_client import http_client
+from app.responses import FastJSONResponse
+from app.compression import CompressionMiddleware
+from app.profiler import ProfilingMiddleware
+from app.admission import AdmissionMiddleware
+from app.database import engine
+from app.waitlist import WAITLIST_BATCHING, waitlist_batcher
+from typing import Optional
 import os
+import secrets
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,7 +23,8 @@ load_dotenv()
 app = FastAPI(
     title="ANDROAMA API",
     description="Backend API for ANDROAMA platform",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS Configuration
@@ -25,6 +38,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Samples the process while serving requests sent with X-Profile-Token
+app.add_middleware(ProfilingMiddleware)
+
+# gzip/brotli for JSON and text bodies; APK downloads are never compressed
+app.add_middleware(CompressionMiddleware)
+
+# Sheds load by priority (health > reads > writes > password hashing) with 503s
+app.add_middleware(AdmissionMiddleware)
+
+# Outermost, so latency includes compression and every other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -32,25 +57,44 @@ app.include_router(community.router)
 app.include_router(public.router)
 app.include_router(admin.router)
 app.include_router(stripe.router)
+app.include_router(devices.router)
+app.include_router(diagnostics.router)
 
 # Mount static files for downloads (served at /downloads/...)
 # This allows direct access to APK files uploaded via Admin Panel
 try:
-    # Get project root (go up from backend/app/main.py: backend/app -> backend -> project root)
-    project_root = Path(__file__).parent.parent.parent
-    public_dir = project_root / "public"
-    if public_dir.exists():
-        downloads_dir = public_dir / "downloads"
-        if downloads_dir.exists():
-            app.mount("/downloads", StaticFiles(directory=str(downloads_dir)), name="downloads")
-            print(f"✅ Static files mounted: /downloads -> {downloads_dir}")
-        else:
-            print(f"⚠️ Warning: Downloads directory not found at {downloads_dir}")
+    downloads_dir = get_downloads_dir()
+    if downloads_dir.exists():
+        app.mount("/downloads", CountingStaticFiles(directory=str(downloads_dir)), name="downloads")
+        print(f"✅ Static files mounted: /downloads -> {downloads_dir}")
     else:
-        print(f"⚠️ Warning: Public directory not found at {public_dir}")
+        print(f"⚠️ Warning: Downloads directory not found at {downloads_dir}")
 except Exception as e:
     print(f"⚠️ Warning: Could not mount static files: {e}")
 
+@app.on_event("startup")
+async def start_background_jobs():
+    await http_client.start()
+    await settings.start()
+    await download_stats.start()
+    await licensing.start()
+    await device_heartbeats.start()
+    await stripe_events.start()
+    if WAITLIST_BATCHING:
+        await waitlist_batcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_background_jobs():
+    await notifications.stop()
+    await stripe_events.stop()
+    await waitlist_batcher.stop()
+    await settings.stop()
+    await licensing.stop()
+    await download_stats.stop()
+    await device_heartbeats.stop()
+    await patches.shutdown()
+    await http_client.stop()
+
 @app.get("/")
 async def root():
     return {"message": "ANDROAMA API", "status": "running"}
@@ -59,3 +103,21 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus scrape endpoint; requires the METRICS_TOKEN bearer token (404 when none is set)"""
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+    # Compared as bytes: compare_digest raises on non-ASCII str, and headers are latin-1
+    if not secrets.compare_digest(
+        (authorization or "").encode(), f"Bearer {metrics.METRICS_TOKEN}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token"
+        )
+    return PlainTextResponse(metrics.render(engine), media_type="text/plain; version=0.0.4")
+
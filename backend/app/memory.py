@@ -0,0 +1,211 @@
+"""
+Memory diagnostics for leak hunting
+
+Wraps tracemalloc: start tracing, take named snapshots, and diff any two of
+them (or a snapshot against the current heap). Results list the biggest
+allocating call sites and the same allocations summed per module, so growth
+can be traced to e.g. app.routers.admin uploads or sqlalchemy.orm
+identity maps.
+
+While tracing is on, ORM instances are also tagged with the route that
+created or loaded them (a weak reference, so tagging never keeps them
+alive). `orm_object_counts()` then reports live instances per model class
+and per route. Tracing slows allocation-heavy code down noticeably; stop it
+when done.
+"""
+from collections import Counter, OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from typing import Dict, Optional
+from app.database import Base
+from app.metrics import current_route
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+import weakref
+
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "25"))
+MEMORY_KEEP_SNAPSHOTS = int(os.getenv("MEMORY_KEEP_SNAPSHOTS", "10"))
+
+# Allocations made by the tracing machinery itself
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+snapshots: "OrderedDict[str, dict]" = OrderedDict()
+_origins: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_tracking = {"started_at": None}
+
+class MemoryTracingOff(RuntimeError):
+    """tracemalloc is not running"""
+
+def _tag_instance(target, *args):
+    _origins[target] = current_route()
+
+def _module_names() -> Dict[str, str]:
+    names = {}
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path:
+            names[os.path.abspath(path)] = name
+    return names
+
+def _module_of(filename: str, names: Dict[str, str]) -> str:
+    return names.get(os.path.abspath(filename), filename)
+
+def status() -> dict:
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "started_at": _tracking["started_at"],
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "peak_traced_bytes": peak,
+        "tracked_orm_objects": len(_origins),
+        "snapshots": [
+            {"id": snapshot_id, "label": s["label"], "taken_at": s["taken_at"], "traced_bytes": s["traced_bytes"]}
+            for snapshot_id, s in snapshots.items()
+        ],
+    }
+
+def start(frames: int = MEMORY_TRACE_FRAMES) -> dict:
+    """Start tracing allocations (and tagging ORM instances by route)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        _tracking["started_at"] = time.time()
+    if not event.contains(Base, "load", _tag_instance):
+        event.listen(Base, "load", _tag_instance, propagate=True)
+        event.listen(Base, "init", _tag_instance, propagate=True)
+    return status()
+
+def stop() -> dict:
+    """Stop tracing; stored snapshots are kept until cleared"""
+    if event.contains(Base, "load", _tag_instance):
+        event.remove(Base, "load", _tag_instance)
+        event.remove(Base, "init", _tag_instance)
+    _origins.clear()
+    tracemalloc.stop()
+    _tracking["started_at"] = None
+    return status()
+
+def take_snapshot(label: Optional[str] = None) -> str:
+    """Store a snapshot of the traced heap; returns its id"""
+    if not tracemalloc.is_tracing():
+        raise MemoryTracingOff("Memory tracing is not started")
+    snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+    snapshot_id = uuid.uuid4().hex[:12]
+    snapshots[snapshot_id] = {
+        "label": label,
+        "taken_at": time.time(),
+        "traced_bytes": tracemalloc.get_traced_memory()[0],
+        "snapshot": snapshot,
+    }
+    while len(snapshots) > MEMORY_KEEP_SNAPSHOTS:
+        snapshots.popitem(last=False)
+    return snapshot_id
+
+def clear_snapshots():
+    snapshots.clear()
+
+def _site(stat, names) -> dict:
+    frame = stat.traceback[0]
+    return {
+        "module": _module_of(frame.filename, names),
+        "file": frame.filename,
+        "line": frame.lineno,
+    }
+
+def summarize(snapshot_id: str, limit: int = 25) -> dict:
+    """Largest allocation sites and modules in one snapshot"""
+    entry = snapshots[snapshot_id]
+    names = _module_names()
+    stats = entry["snapshot"].statistics("lineno")
+    by_module: Counter = Counter()
+    counts: Counter = Counter()
+    for stat in stats:
+        module = _module_of(stat.traceback[0].filename, names)
+        by_module[module] += stat.size
+        counts[module] += stat.count
+    return {
+        "id": snapshot_id,
+        "label": entry["label"],
+        "taken_at": entry["taken_at"],
+        "traced_bytes": entry["traced_bytes"],
+        "by_module": [
+            {"module": module, "size": size, "count": counts[module]}
+            for module, size in by_module.most_common(limit)
+        ],
+        "top_sites": [
+            {**_site(stat, names), "size": stat.size, "count": stat.count}
+            for stat in stats[:limit]
+        ],
+    }
+
+def diff(base_id: str, target_id: Optional[str] = None, limit: int = 25) -> dict:
+    """What grew between two snapshots (`target_id=None` compares against the heap now)"""
+    base = snapshots[base_id]
+    if target_id is None:
+        target_id = take_snapshot("diff")
+    target = snapshots[target_id]
+    names = _module_names()
+    stats = target["snapshot"].compare_to(base["snapshot"], "lineno")
+
+    by_module: Dict[str, Dict[str, int]] = {}
+    for stat in stats:
+        module = _module_of(stat.traceback[0].filename, names)
+        totals = by_module.setdefault(module, {"size_diff": 0, "count_diff": 0, "size": 0})
+        totals["size_diff"] += stat.size_diff
+        totals["count_diff"] += stat.count_diff
+        totals["size"] += stat.size
+    grown = sorted(by_module.items(), key=lambda item: item[1]["size_diff"], reverse=True)
+
+    return {
+        "base": base_id,
+        "target": target_id,
+        "seconds_between": round(target["taken_at"] - base["taken_at"], 3),
+        "traced_bytes_diff": target["traced_bytes"] - base["traced_bytes"],
+        "by_module": [{"module": module, **totals} for module, totals in grown[:limit]],
+        "top_sites": [
+            {
+                **_site(stat, names),
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size": stat.size,
+                "count": stat.count,
+            }
+            for stat in stats[:limit]
+        ],
+    }
+
+def orm_object_counts() -> dict:
+    """Live ORM instances per model class (from the GC), and per route when tracing"""
+    model_classes = {mapper.class_ for mapper in Base.registry.mappers}
+    gc.collect()
+    live: Counter = Counter()
+    sessions = 0
+    identity_map_size = 0
+    for obj in gc.get_objects():
+        cls = type(obj)
+        if cls in model_classes:
+            live[cls.__name__] += 1
+        elif isinstance(obj, Session):
+            sessions += 1
+            identity_map_size += len(obj.identity_map)
+
+    by_route: Dict[str, Counter] = {}
+    for obj, route in list(_origins.items()):
+        by_route.setdefault(route, Counter())[type(obj).__name__] += 1
+
+    return {
+        "by_class": dict(live.most_common()),
+        "sessions": sessions,
+        "identity_map_objects": identity_map_size,
+        "by_route": {route: dict(counts.most_common()) for route, counts in sorted(by_route.items())},
+        "tracking_routes": event.contains(Base, "load", _tag_instance),
+    }
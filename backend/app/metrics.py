@@ -0,0 +1,336 @@
+"""
+Prometheus metrics
+
+MetricsMiddleware times every request per route template and, through
+SQLAlchemy cursor events on the engine, counts the queries each request ran
+and the time they took (a context variable carries the per-request totals
+into threadpool-run dependencies). TimedQueuePool records how long each
+connection checkout waited, and the pool's size/overflow usage is exported
+as gauges, so pool_size/max_overflow can be sized from what is observed.
+
+`render()` produces the Prometheus text format served on /metrics, including
+the counters kept by the background services (download stats, heartbeats,
+Stripe, outbound HTTP, ...) and the password hashing pool.
+"""
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, Iterable, List, Tuple
+from app.http_client import LatencyHistogram
+from app import admission, ratelimit, singleflight
+import contextvars
+import os
+import threading
+import time
+
+# /metrics requires `Authorization: Bearer <METRICS_TOKEN>`; without a token it is not served
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+PREFIX = "androama"
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_lock = threading.Lock()
+# (queries, seconds) run by the current request
+_request_db: contextvars.ContextVar = contextvars.ContextVar("request_db", default=None)
+_request_scope: contextvars.ContextVar = contextvars.ContextVar("request_scope", default=None)
+
+request_latency: Dict[Tuple[str, str], LatencyHistogram] = {}
+request_db_time: Dict[Tuple[str, str], LatencyHistogram] = {}
+request_db_queries: Dict[Tuple[str, str], LatencyHistogram] = {}
+responses: Dict[Tuple[str, str, int], int] = {}
+db_stats = {"queries": 0, "seconds": 0.0, "errors": 0}
+pool_checkout_wait = LatencyHistogram()
+pool_stats = {"checkouts": 0, "timeouts": 0}
+in_flight = {"requests": 0}
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (including connecting)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with _lock:
+                pool_stats["timeouts"] += 1
+            raise
+        finally:
+            with _lock:
+                pool_stats["checkouts"] += 1
+                pool_checkout_wait.observe(time.perf_counter() - started)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_query(context)
+
+def _handle_error(exception_context):
+    with _lock:
+        db_stats["errors"] += 1
+    if exception_context.execution_context is not None:
+        _record_query(exception_context.execution_context)
+
+def _record_query(context):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    context._metrics_started = None
+    elapsed = time.perf_counter() - started
+    with _lock:
+        db_stats["queries"] += 1
+        db_stats["seconds"] += elapsed
+    usage = _request_db.get()
+    if usage is not None:
+        usage[0] += 1
+        usage[1] += elapsed
+
+def instrument_engine(engine):
+    """Attach the query timing hooks to `engine` (idempotent)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+def route_label(scope: Scope) -> str:
+    """Route template (e.g. /api/users/{user_id}) so labels stay low-cardinality"""
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unmatched")
+    if scope.get("root_path"):
+        # Mounted app such as /downloads
+        return scope["root_path"] + "/*"
+    return "unmatched"
+
+def current_route() -> str:
+    """Route of the request being served in this context ("background" outside requests)"""
+    scope = _request_scope.get()
+    return route_label(scope) if scope is not None else "background"
+
+def observe_request(method: str, route: str, status_code: int, seconds: float, queries: int, db_seconds: float):
+    key = (method, route)
+    with _lock:
+        request_latency.setdefault(key, LatencyHistogram()).observe(seconds)
+        request_db_time.setdefault(key, LatencyHistogram()).observe(db_seconds)
+        request_db_queries.setdefault(key, LatencyHistogram(QUERY_COUNT_BUCKETS)).observe(queries)
+        responses[(method, route, status_code)] = responses.get((method, route, status_code), 0) + 1
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        usage = [0, 0.0]
+        token = _request_db.set(usage)
+        scope_token = _request_scope.set(scope)
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight["requests"] += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight["requests"] -= 1
+            _request_db.reset(token)
+            _request_scope.reset(scope_token)
+            observe_request(
+                scope["method"], route_label(scope), status_code,
+                time.perf_counter() - started, usage[0], usage[1]
+            )
+
+# -- Prometheus text format --
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _number(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def metric(self, name: str, kind: str, help_text: str, samples: Iterable[Tuple[dict, float]]):
+        samples = list(samples)
+        if not samples:
+            return
+        name = f"{PREFIX}_{name}"
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name: str, help_text: str, series: Iterable[Tuple[dict, dict]]):
+        """`series` holds (labels, LatencyHistogram.snapshot()) pairs"""
+        series = list(series)
+        if not series:
+            return
+        name = f"{PREFIX}_{name}"
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, snap in series:
+            for bound, count in snap["buckets"].items():
+                self.lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {_number(float(snap['sum']))}")
+            self.lines.append(f"{name}_count{_labels(labels)} {snap['count']}")
+
+    def stats(self, component: str, stats: dict, gauges: Iterable[str] = ()):
+        """Export a module's stats dict: numeric values become counters unless listed in `gauges`"""
+        for key, value in stats.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if key in gauges:
+                self.metric(f"{component}_{key}", "gauge", f"{component} {key}", [({}, value)])
+            else:
+                self.metric(f"{component}_{key}_total", "counter", f"{component} {key}", [({}, value)])
+
+def _route_series(histograms: Dict[Tuple[str, str], LatencyHistogram]):
+    return [({"method": m, "route": r}, h.snapshot()) for (m, r), h in sorted(histograms.items())]
+
+def _pool_gauges(engine) -> List[Tuple[str, str, float]]:
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return []
+    return [
+        ("db_pool_size", "Configured pool_size", pool.size()),
+        ("db_pool_max_overflow", "Configured max_overflow", pool._max_overflow),
+        ("db_pool_checked_out", "Connections currently checked out", pool.checkedout()),
+        ("db_pool_checked_in", "Idle connections in the pool", pool.checkedin()),
+        ("db_pool_overflow", "Connections open beyond pool_size (negative while the pool is filling)", pool.overflow()),
+    ]
+
+def render(engine=None) -> str:
+    """Current metrics in the Prometheus text exposition format"""
+    # Imported here: these modules import app.database, which imports this module
+    from app import auth, download_stats, device_heartbeats, licensing, stripe_client, stripe_events
+    from app.google_jwks import jwks_cache
+    from app.http_client import http_client
+    from app.waitlist import waitlist_batcher
+
+    w = _Writer()
+    with _lock:
+        latency = _route_series(request_latency)
+        db_time = _route_series(request_db_time)
+        db_queries = _route_series(request_db_queries)
+        response_counts = sorted(responses.items())
+        checkout_wait = pool_checkout_wait.snapshot()
+        db_totals = dict(db_stats)
+        pool_counts = dict(pool_stats)
+
+    w.histogram("http_request_duration_seconds", "Request latency by route", latency)
+    w.metric("http_responses_total", "counter", "Responses by route and status",
+             [({"method": m, "route": r, "status": s}, n) for (m, r, s), n in response_counts])
+    w.metric("http_requests_in_flight", "gauge", "Requests being served", [({}, in_flight["requests"])])
+    w.histogram("request_db_seconds", "Database time per request by route", db_time)
+    w.histogram("request_db_queries", "Database queries per request by route", db_queries)
+
+    w.metric("db_queries_total", "counter", "Queries executed", [({}, db_totals["queries"])])
+    w.metric("db_query_seconds_total", "counter", "Time spent executing queries", [({}, db_totals["seconds"])])
+    w.metric("db_errors_total", "counter", "Queries that raised", [({}, db_totals["errors"])])
+    w.histogram("db_pool_checkout_wait_seconds", "Time waiting for a pooled connection", [({}, checkout_wait)])
+    w.metric("db_pool_checkouts_total", "counter", "Pool checkouts", [({}, pool_counts["checkouts"])])
+    w.metric("db_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection",
+             [({}, pool_counts["timeouts"])])
+    if engine is not None:
+        for name, help_text, value in _pool_gauges(engine):
+            w.metric(name, "gauge", help_text, [({}, value)])
+
+    hashing = auth.hash_pool_snapshot()
+    w.metric("password_hash_pool_workers", "gauge", "Password hashing threads", [({}, hashing["workers"])])
+    w.metric("password_hash_queued", "gauge", "Hash/verify calls waiting for a thread", [({}, hashing["queued"])])
+    w.metric("password_hash_running", "gauge", "Hash/verify calls running", [({}, hashing["running"])])
+    w.metric("password_hash_completed_total", "counter", "Hash/verify calls completed", [({}, hashing["completed"])])
+    w.histogram("password_hash_queue_wait_seconds", "Time a hash/verify call waited for a thread",
+                [({}, hashing["queue_wait"])])
+    w.histogram("password_hash_duration_seconds", "Hash/verify call duration", [({}, hashing["duration"])])
+
+    w.stats("download_stats", download_stats.stats)
+    w.metric("download_stats_queued", "gauge", "Download events waiting to be flushed",
+             [({}, len(download_stats._queue))])
+    w.stats("device_heartbeats", device_heartbeats.stats)
+    w.metric("device_heartbeats_pending", "gauge", "Devices with unflushed heartbeats",
+             [({}, len(device_heartbeats._pending))])
+    w.stats("waitlist_batcher", waitlist_batcher.stats, gauges=("largest_batch",))
+    w.stats("license_sweep", licensing.sweep_stats)
+    w.stats("stripe_events", stripe_events.stats)
+
+    stripe_api = stripe_client.snapshot()
+    w.stats("stripe_api", {k: v for k, v in stripe_api.items() if k != "latency"}, gauges=("in_flight",))
+    w.histogram("stripe_api_duration_seconds", "Stripe API call latency by operation",
+                [({"operation": op}, snap) for op, snap in sorted(stripe_api["latency"].items())])
+
+    upstreams = http_client.snapshot()
+    for counter in ("requests", "failures", "retries", "rejected"):
+        w.metric(f"http_upstream_{counter}_total", "counter", f"Outbound HTTP {counter} by upstream",
+                 [({"upstream": name}, u[counter]) for name, u in sorted(upstreams.items())])
+    w.metric("http_upstream_circuit_open", "gauge", "1 while the upstream's circuit breaker is not closed",
+             [({"upstream": name}, int(u["state"] != "closed")) for name, u in sorted(upstreams.items())])
+    w.histogram("http_upstream_duration_seconds", "Outbound HTTP latency by upstream",
+                [({"upstream": name}, u["latency"]) for name, u in sorted(upstreams.items())])
+    w.stats("google_jwks", jwks_cache.stats)
+
+    admission_state = admission.controller.snapshot()
+    classes = sorted(admission_state["classes"].items())
+    w.metric("admission_shared_active", "gauge", "Requests holding one of the shared admission slots",
+             [({}, admission_state["shared_active"])])
+    w.metric("admission_shared_limit", "gauge", "ADMISSION_MAX_CONCURRENCY", [({}, admission_state["max_concurrency"])])
+    for gauge, help_text in (
+        ("active", "Requests running per priority class"),
+        ("waiting", "Requests queued per priority class"),
+        ("limit", "Concurrency limit per priority class"),
+        ("queue_size", "Queue bound per priority class"),
+    ):
+        w.metric(f"admission_{gauge}", "gauge", help_text,
+                 [({"class": name}, c[gauge]) for name, c in classes])
+    for counter, help_text in (
+        ("admitted", "Requests admitted"),
+        ("queued", "Requests that had to wait"),
+        ("rejected", "Requests shed because the queue was full"),
+        ("timeouts", "Requests shed after waiting too long"),
+    ):
+        w.metric(f"admission_{counter}_total", "counter", help_text,
+                 [({"class": name}, c[counter]) for name, c in classes])
+    w.histogram("admission_queue_wait_seconds", "Time waiting for admission",
+                [({"class": name}, c["queue_wait"]) for name, c in classes])
+
+    flights = sorted(singleflight.groups.items())
+    for counter, help_text in (
+        ("calls", "Calls to the single-flight group"),
+        ("executions", "Computations actually run"),
+        ("shared", "Calls that joined an in-flight computation"),
+        ("errors", "Computations that raised"),
+        ("timeouts", "Calls that gave up waiting"),
+    ):
+        w.metric(f"singleflight_{counter}_total", "counter", help_text,
+                 [({"group": name}, group.stats[counter]) for name, group in flights])
+    w.metric("singleflight_in_flight", "gauge", "Computations running now",
+             [({"group": name}, group.in_flight) for name, group in flights])
+
+    limits = ratelimit.limiter.snapshot()
+    w.metric("ratelimit_checks_total", "counter", "Rate limit checks by rule, key kind and result",
+             [({"rule": c["rule"], "key": c["key"], "result": c["result"]}, c["count"]) for c in limits["checks"]])
+    if limits["tracked_keys"] >= 0:
+        w.metric("ratelimit_tracked_keys", "gauge", "Keys held by the rate limit backend", [({}, limits["tracked_keys"])])
+    w.metric("ratelimit_evictions_total", "counter", "Keys dropped to keep rate limit memory bounded, by rule and key kind",
+             [({"rule": e["rule"], "key": e["key"]}, e["count"]) for e in limits["evictions"]])
+
+    return "\n".join(w.lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, DateTime, Integer, ForeignKey, Text, DECIMAL, TypeDecorator
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, ForeignKey, Text, DECIMAL, TypeDecorator, Index
 from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -49,7 +49,8 @@ class User(Base):
     subscription_status = Column(String(50), default='none')  # none, active, expired, cancelled, lifetime (matches desktop)
     subscription_tier = Column(String(50), default='beta')  # beta, lifetime (both functionally the same)
     license_key = Column(String(255), unique=True, nullable=True, index=True)  # License key for desktop app
-    subscription_end = Column(DateTime(timezone=True), nullable=True)  # When subscription expires
+    subscription_end = Column(DateTime(timezone=True), nullable=True, index=True)  # When subscription expires
+    license_valid = Column(Boolean, default=True, nullable=False)  # Precomputed from status/end, kept current by the expiry sweeper
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     last_login = Column(DateTime(timezone=True), nullable=True)
@@ -129,6 +130,11 @@ class UserDevice(Base):
     
     # Relationships
     user = relationship("User", back_populates="devices")
+    
+    # One row per device per user; heartbeats upsert on it
+    __table_args__ = (
+        Index("uq_user_devices_user_device", "user_id", "device_id", unique=True),
+    )
 
 class CommunityPost(Base):
     __tablename__ = "community_posts"
@@ -220,3 +226,23 @@ class AppSettings(Base):
     description = Column(Text, nullable=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     updated_by = Column(GUID(), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+
+class StripeEvent(Base):
+    __tablename__ = "stripe_events"
+    
+    id = Column(String(255), primary_key=True)  # Stripe event ID (evt_...), so redeliveries dedupe
+    type = Column(String(100), nullable=False, index=True)
+    ordering_key = Column(String(255), nullable=False, index=True)  # Stripe customer (or user) the event belongs to
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)  # Lease of the worker processing it
+    last_error = Column(Text, nullable=True)
+    stripe_created = Column(DateTime(timezone=True), nullable=False)  # When Stripe created the event
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_stripe_events_status_created", "status", "stripe_created"),
+    )
@@ -0,0 +1,252 @@
+"""
+Batched beta waitlist notification
+
+An admin starts a job that walks every un-notified waitlist entry in
+(created_at, id) order using keyset pagination, sends each one the
+announcement through the configured mailer with NOTIFY_CONCURRENCY parallel
+senders (each holding its own mailer connection), optionally paced to
+NOTIFY_MAX_RATE messages per second, and marks delivered rows notified in
+batched UPDATEs. Failed deliveries stay un-notified so a later run retries them.
+With a mailer that does not deliver (MAIL_BACKEND=console) the run is a dry
+run: messages are logged and no row is marked notified.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import tuple_, update, func
+from datetime import datetime, timezone
+from typing import List, Optional
+from app.database import SessionLocal
+from app.models import BetaWaitlist
+from app.mailer import Mailer, build_message, get_mailer
+import asyncio
+import os
+import smtplib
+import time
+
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))
+NOTIFY_PAGE_SIZE = int(os.getenv("NOTIFY_PAGE_SIZE", "500"))
+NOTIFY_UPDATE_BATCH = int(os.getenv("NOTIFY_UPDATE_BATCH", "200"))
+# Messages per second across all senders; 0 means unlimited
+NOTIFY_MAX_RATE = float(os.getenv("NOTIFY_MAX_RATE", "0"))
+
+def _count_pending() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.count(BetaWaitlist.id)).filter(BetaWaitlist.notified.isnot(True)).scalar() or 0
+    finally:
+        db.close()
+
+def _fetch_page(after: Optional[tuple], limit: int) -> list:
+    """Next page of un-notified entries strictly after the (created_at, id) key"""
+    db = SessionLocal()
+    try:
+        query = db.query(BetaWaitlist.id, BetaWaitlist.email, BetaWaitlist.created_at).filter(
+            BetaWaitlist.notified.isnot(True)
+        )
+        if after is not None:
+            query = query.filter(tuple_(BetaWaitlist.created_at, BetaWaitlist.id) > after)
+        return query.order_by(BetaWaitlist.created_at, BetaWaitlist.id).limit(limit).all()
+    finally:
+        db.close()
+
+def _mark_notified(ids: list):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(BetaWaitlist)
+            .where(BetaWaitlist.id.in_(ids))
+            .values(notified=True, notified_at=datetime.now(timezone.utc))
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+class NotificationJob:
+    """One run over the waitlist; `status()` reports progress while it runs"""
+
+    def __init__(
+        self,
+        subject: str,
+        body: str,
+        mailer: Optional[Mailer] = None,
+        concurrency: int = NOTIFY_CONCURRENCY,
+        max_rate: float = NOTIFY_MAX_RATE,
+    ):
+        self.subject = subject
+        self.body = body
+        self.mailer = mailer or get_mailer()
+        self.concurrency = max(1, concurrency)
+        self.max_rate = max_rate
+        self.state = "pending"
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.marked = 0
+        self.last_error: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._started = 0.0
+        self._elapsed = 0.0
+        self._delivered: List = []
+        self._mark_lock = asyncio.Lock()
+        self._next_slot = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def status(self) -> dict:
+        elapsed = time.monotonic() - self._started if self.running else self._elapsed
+        rate = self.sent / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.sent - self.failed, 0)
+        return {
+            "state": self.state,
+            "subject": self.subject,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "marked_notified": self.marked,
+            "remaining": remaining,
+            "elapsed_seconds": round(elapsed, 2),
+            "rate_per_second": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 and self.running else None,
+            "dry_run": not self.mailer.delivers,
+            "concurrency": self.concurrency,
+            "max_rate": self.max_rate or None,
+            "last_error": self.last_error,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    async def _in_thread(self, fn, *args):
+        # Own pool so a long send doesn't starve request handlers of threads
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _pace(self):
+        if not self.max_rate:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.max_rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _flush_marks(self, force: bool = False):
+        async with self._mark_lock:
+            while self._delivered and (force or len(self._delivered) >= NOTIFY_UPDATE_BATCH):
+                ids = self._delivered[:NOTIFY_UPDATE_BATCH]
+                del self._delivered[:NOTIFY_UPDATE_BATCH]
+                await self._in_thread(_mark_notified, ids)
+                self.marked += len(ids)
+
+    async def _produce(self, queue: asyncio.Queue):
+        after = None
+        while True:
+            page = await self._in_thread(_fetch_page, after, NOTIFY_PAGE_SIZE)
+            for row in page:
+                await queue.put(row)
+            if len(page) < NOTIFY_PAGE_SIZE:
+                break
+            after = (page[-1].created_at, page[-1].id)
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _work(self, queue: asyncio.Queue):
+        connection = await self._in_thread(self.mailer.connect)
+        try:
+            while True:
+                row = await queue.get()
+                if row is None:
+                    return
+                await self._pace()
+                message = build_message(row.email, self.subject, self.body)
+                try:
+                    try:
+                        await self._in_thread(connection.send, message)
+                    except smtplib.SMTPServerDisconnected:
+                        # Servers drop idle or long-lived sessions; reconnect once
+                        connection = await self._in_thread(self.mailer.connect)
+                        await self._in_thread(connection.send, message)
+                except (smtplib.SMTPException, OSError) as e:
+                    self.failed += 1
+                    self.last_error = f"{row.email}: {e}"
+                    continue
+                self.sent += 1
+                if not self.mailer.delivers:
+                    continue  # dry run: nobody actually got the message
+                self._delivered.append(row.id)
+                if len(self._delivered) >= NOTIFY_UPDATE_BATCH:
+                    await self._flush_marks()
+        finally:
+            await self._in_thread(connection.close)
+
+    async def _run(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency + 1, thread_name_prefix="waitlist-notify"
+        )
+        tasks = []
+        try:
+            self.total = await self._in_thread(_count_pending)
+            queue = asyncio.Queue(maxsize=self.concurrency * 4)
+            tasks = [asyncio.create_task(self._produce(queue))]
+            tasks += [asyncio.create_task(self._work(queue)) for _ in range(self.concurrency)]
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            errors = [t.exception() for t in done if t.exception() is not None]
+            if errors:
+                raise errors[0]
+            self.state = "completed"
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+        except Exception as e:
+            self.state = "failed"
+            self.last_error = str(e)
+            print(f"⚠️ Warning: waitlist notification job failed: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await self._flush_marks(force=True)
+            except Exception as e:
+                self.last_error = f"could not mark delivered rows notified: {e}"
+                print(f"⚠️ Warning: {self.last_error}")
+            self._executor.shutdown(wait=False)
+            self._elapsed = time.monotonic() - self._started
+            self.finished_at = datetime.now(timezone.utc)
+
+    def start(self):
+        self.state = "running"
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def cancel(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+_job: Optional[NotificationJob] = None
+
+def current_job() -> Optional[NotificationJob]:
+    return _job
+
+def start_job(subject: str, body: str) -> NotificationJob:
+    """Start a notification run; raises RuntimeError if one is already running"""
+    global _job
+    if _job is not None and _job.running:
+        raise RuntimeError("A notification job is already running")
+    _job = NotificationJob(subject, body)
+    _job.start()
+    return _job
+
+async def stop():
+    """Cancel a running job, keeping what was delivered marked (call on shutdown)"""
+    if _job is not None:
+        await _job.cancel()
@@ -6,6 +6,8 @@ from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 from app.models import User
 from app.auth import create_access_token, get_user_by_email
+from app.http_client import http_client
+from app.google_jwks import verify_id_token, TokenVerificationError, KeySourceError
 from datetime import timedelta, datetime
 import os
 from dotenv import load_dotenv
@@ -15,60 +17,17 @@ load_dotenv()
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# "local" verifies ID tokens against Google's JWKS; "tokeninfo" always asks Google
+GOOGLE_TOKEN_VERIFICATION = os.getenv("GOOGLE_TOKEN_VERIFICATION", "local")
 
-async def verify_google_token(token: str) -> dict:
-    """Verify Google Identity Services JWT token and get user info"""
-    if not GOOGLE_CLIENT_ID:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Google OAuth not configured"
-        )
-    
+async def _verify_with_tokeninfo(token: str) -> dict:
+    """Ask Google's tokeninfo endpoint to verify the token (fallback path)"""
     try:
-        # Google Identity Services provides a JWT credential token (ID token)
-        # We'll use Google's tokeninfo endpoint to verify and decode it
-        async with httpx.AsyncClient() as client:
-            tokeninfo_response = await client.get(
-                "https://oauth2.googleapis.com/tokeninfo",
-                params={"id_token": token},
-                timeout=10.0
-            )
-            
-            if tokeninfo_response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid Google token"
-                )
-            
-            token_info = tokeninfo_response.json()
-            
-            # Verify the token is for our client
-            if token_info.get("aud") != GOOGLE_CLIENT_ID:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token audience mismatch"
-                )
-            
-            # Extract user info from token
-            user_info = {
-                "id": token_info.get("sub"),
-                "email": token_info.get("email"),
-                "verified_email": token_info.get("email_verified", False),
-                "name": token_info.get("name"),
-                "picture": token_info.get("picture"),
-                "given_name": token_info.get("given_name"),
-                "family_name": token_info.get("family_name")
-            }
-            
-            # Verify email is verified
-            if not user_info.get("verified_email"):
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email not verified with Google"
-                )
-            
-            return user_info
-            
+        tokeninfo_response = await http_client.get(
+            "https://oauth2.googleapis.com/tokeninfo",
+            upstream="google-tokeninfo",
+            params={"id_token": token}
+        )
     except httpx.TimeoutException:
         raise HTTPException(
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
@@ -79,11 +38,73 @@ async def verify_google_token(token: str) -> dict:
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail=f"Error verifying Google token: {str(e)}"
         )
-    except Exception as e:
+    
+    if tokeninfo_response.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid Google token"
+        )
+    
+    try:
+        token_info = tokeninfo_response.json()
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid Google token"
+        )
+    
+    # Verify the token is for our client
+    if token_info.get("aud") != GOOGLE_CLIENT_ID:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid Google token: {str(e)}"
+            detail="Token audience mismatch"
+        )
+    return token_info
+
+async def verify_google_token(token: str) -> dict:
+    """Verify Google Identity Services JWT token and get user info"""
+    if not GOOGLE_CLIENT_ID:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Google OAuth not configured"
         )
+    
+    # Google Identity Services provides a JWT credential token (ID token).
+    # Verify it locally against Google's cached signing keys; only fall back
+    # to the tokeninfo round trip when the keys can't be loaded.
+    claims = None
+    if GOOGLE_TOKEN_VERIFICATION == "local":
+        try:
+            claims = await verify_id_token(token, GOOGLE_CLIENT_ID)
+        except TokenVerificationError as e:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Invalid Google token: {str(e)}"
+            )
+        except KeySourceError as e:
+            print(f"⚠️ Warning: Google signing keys unavailable, using tokeninfo: {e}")
+    if claims is None:
+        claims = await _verify_with_tokeninfo(token)
+    
+    # Extract user info from token (tokeninfo returns booleans as strings)
+    user_info = {
+        "id": claims.get("sub"),
+        "email": claims.get("email"),
+        "verified_email": str(claims.get("email_verified", False)).lower() == "true",
+        "name": claims.get("name"),
+        "picture": claims.get("picture"),
+        "given_name": claims.get("given_name"),
+        "family_name": claims.get("family_name")
+    }
+    
+    # Verify email is verified
+    if not user_info.get("verified_email"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email not verified with Google"
+        )
+    
+    return user_info
 
 async def get_or_create_google_user(db: Session, google_user_info: dict) -> User:
     """Get existing user or create new user from Google OAuth"""
@@ -0,0 +1,132 @@
+"""
+Binary delta patches between APK versions
+
+When an admin releases a new build of an existing app, bsdiff patches from
+the previous APK_PATCH_HISTORY versions to the new one are generated in a
+background process pool. Finished patches are published on the catalog entry
+(`patches`) so clients can download a few MB instead of the full APK.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+from app.catalog import update_app_entry
+from app.downloads import forget_file
+from app.storage import blob_path, get_downloads_dir
+import asyncio
+import hashlib
+import multiprocessing
+import os
+
+# bsdiff4 is optional: without it releases still work, just without patches
+try:
+    import bsdiff4
+except ImportError:
+    bsdiff4 = None
+    print("⚠️ Warning: bsdiff4 not installed, APK delta patches are disabled")
+
+APK_PATCH_HISTORY = int(os.getenv("APK_PATCH_HISTORY", "3"))
+APK_PATCH_WORKERS = int(os.getenv("APK_PATCH_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_tasks = set()
+
+def patch_relative_path(from_sha256: str, to_sha256: str) -> str:
+    """Patch path relative to the downloads directory"""
+    return f"patches/{to_sha256[:2]}/{from_sha256}-{to_sha256}.bsdiff"
+
+def patch_path(from_sha256: str, to_sha256: str) -> Path:
+    """Get path of the patch turning one blob into another"""
+    return get_downloads_dir() / patch_relative_path(from_sha256, to_sha256)
+
+def patch_url(base_url: str, app_id: str, from_version: str, to_version: str) -> str:
+    """Public URL of a from_version -> to_version patch"""
+    return f"{base_url}/api/public/apps/{app_id}/patches/{from_version}/{to_version}"
+
+def _build_patch(old_path: str, new_path: str, out_path: str) -> dict:
+    """Runs in a worker process: write the bsdiff patch and return its checksum"""
+    tmp_path = f"{out_path}.tmp"
+    bsdiff4.file_diff(old_path, new_path, tmp_path)
+    digest = hashlib.sha256()
+    with open(tmp_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    os.replace(tmp_path, out_path)
+    return {"sha256": digest.hexdigest(), "size": os.path.getsize(out_path)}
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and DB pool is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=APK_PATCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+async def _generate_patch(app_id: str, base_url: str, source: dict, to_version: str, to_sha256: str):
+    out_path = patch_path(source["sha256"], to_sha256)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            _get_pool(),
+            _build_patch,
+            str(blob_path(source["sha256"])),
+            str(blob_path(to_sha256)),
+            str(out_path)
+        )
+    except Exception as e:
+        print(f"⚠️ Warning: patch {app_id} {source['version']} -> {to_version} failed: {e}")
+        return
+
+    patch = {
+        "fromVersion": source["version"],
+        "fromSha256": source["sha256"],
+        "sha256": result["sha256"],
+        "size": result["size"],
+        "url": patch_url(base_url, app_id, source["version"], to_version),
+    }
+
+    def publish(app: dict) -> bool:
+        # The app may have been released again while we were diffing
+        if app.get("sha256") != to_sha256:
+            return False
+        patches = [p for p in app.get("patches", []) if p.get("fromSha256") != source["sha256"]]
+        app["patches"] = patches + [patch]
+        return True
+
+    update_app_entry(app_id, publish)
+
+def schedule_patches(app_id: str, base_url: str, history: List[dict], to_version: str, to_sha256: str) -> int:
+    """Queue patch generation from each previous version in `history`.
+
+    Returns the number of patches scheduled (0 if bsdiff4 is unavailable).
+    """
+    if bsdiff4 is None:
+        return 0
+    scheduled = 0
+    for source in history:
+        if source.get("sha256") in (None, to_sha256):
+            continue
+        task = asyncio.create_task(_generate_patch(app_id, base_url, source, to_version, to_sha256))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+        scheduled += 1
+    return scheduled
+
+def remove_patches(app: dict):
+    """Delete the patch files published on a catalog entry"""
+    for patch in app.get("patches", []):
+        path = patch_path(patch["fromSha256"], app["sha256"])
+        if path.exists():
+            path.unlink()
+        forget_file(path)
+
+async def shutdown():
+    """Wait for running patch jobs and stop the worker processes"""
+    global _pool
+    if _tasks:
+        await asyncio.gather(*_tasks, return_exceptions=True)
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
@@ -0,0 +1,188 @@
+"""
+In-process sampling profiler
+
+A background thread snapshots every thread's stack with
+`sys._current_frames()` PROFILE_INTERVAL seconds apart and counts identical
+stacks. Reports use the collapsed-stack format (`frame;frame;frame count`,
+root first) that flamegraph.pl, speedscope and inferno read directly. Stacks
+of threads that are just waiting (idle event loop, idle threadpool workers)
+are dropped unless asked for.
+
+Profiles run on demand from the admin diagnostics endpoints, or for a single
+request sent with `X-Profile-Token: <PROFILE_TOKEN>`. The response then
+carries an `X-Profile-Id` header naming the report to fetch. Other requests
+served meanwhile show up in that report too.
+"""
+from collections import Counter, OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import List, Optional
+import asyncio
+import os
+import secrets
+import sys
+import threading
+import time
+import uuid
+
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# Per-request profiling is off unless a token is configured
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_KEEP_REPORTS = int(os.getenv("PROFILE_KEEP_REPORTS", "20"))
+PROFILE_MAX_DEPTH = 128
+
+# Leaf frames of threads that are blocked waiting for work
+IDLE_FRAMES = {
+    ("selectors", "select"),
+    ("threading", "wait"),
+    ("queue", "get"),
+    ("concurrent.futures.thread", "_worker"),
+}
+
+_active_lock = threading.Lock()
+_active: Optional["SamplingProfiler"] = None
+reports: "OrderedDict[str, dict]" = OrderedDict()
+
+class ProfilerBusy(RuntimeError):
+    """Another profile is already running in this process"""
+
+def _frame_label(frame) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _is_idle(self, frame) -> bool:
+        module = frame.f_globals.get("__name__", "")
+        return (module, frame.f_code.co_name) in IDLE_FRAMES
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if not self.include_idle and self._is_idle(frame):
+                continue
+            labels: List[str] = []
+            while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(f"thread:{names.get(ident, ident)}")
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            self.sample()
+            self._stop.wait(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def start(self):
+        global _active
+        with _active_lock:
+            if _active is not None:
+                raise ProfilerBusy("A profile is already running")
+            _active = self
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> dict:
+        global _active
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with _active_lock:
+            if _active is self:
+                _active = None
+        self.duration = time.time() - self.started_at
+        return self.report()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def report(self, top: int = 30) -> dict:
+        """Summary plus the collapsed stacks; `top_functions` counts samples with the function on top"""
+        leaves: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                leaves[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+        return {
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration, 3),
+            "interval_seconds": self.interval,
+            "samples": self.samples,
+            "stacks_sampled": sum(self.stacks.values()),
+            "top_functions": [{"function": f, "samples": n} for f, n in leaves.most_common(top)],
+            "top_cumulative": [{"function": f, "samples": n} for f, n in inclusive.most_common(top)],
+            "collapsed": self.collapsed(),
+        }
+
+def is_running() -> bool:
+    return _active is not None
+
+async def profile(seconds: float, interval: float = PROFILE_INTERVAL, include_idle: bool = False) -> dict:
+    """Sample the whole process for `seconds`; raises ProfilerBusy if a profile is running"""
+    profiler = SamplingProfiler(interval, include_idle)
+    profiler.start()
+    try:
+        await asyncio.sleep(min(seconds, PROFILE_MAX_SECONDS))
+    finally:
+        report = profiler.stop()
+    return report
+
+def store_report(report: dict, profile_id: Optional[str] = None, **info) -> str:
+    """Keep a report for later retrieval (the last PROFILE_KEEP_REPORTS are kept)"""
+    profile_id = profile_id or uuid.uuid4().hex
+    reports[profile_id] = {**info, **report}
+    while len(reports) > PROFILE_KEEP_REPORTS:
+        reports.popitem(last=False)
+    return profile_id
+
+class ProfilingMiddleware:
+    """Profiles requests that carry a valid X-Profile-Token header"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not PROFILE_TOKEN:
+            await self.app(scope, receive, send)
+            return
+        token = Headers(scope=scope).get("x-profile-token")
+        if token is None or not secrets.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler()
+        try:
+            profiler.start()
+        except ProfilerBusy:
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_profile_id(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["x-profile-id"] = profile_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            store_report(profiler.stop(), profile_id, method=scope["method"], path=scope["path"])
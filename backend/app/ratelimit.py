@@ -0,0 +1,312 @@
+"""
+Sliding-window rate limiting for auth and public write endpoints
+
+Each rule allows `limit` requests per `window` seconds per key, where the key
+is the client IP or the email in the JSON body, prefixed with the rule name
+(so login and register attempts from one IP are counted separately). Routes
+opt in with a dependency:
+
+    @router.post("/login", dependencies=[Depends(login_rate_limit)])
+
+Counts use the sliding-window counter approximation: per key only the
+current and previous fixed windows are kept, and the previous one is
+weighted by how much of it still overlaps the sliding window. A check is
+O(1) and a key costs a few integers.
+
+Backends:
+    MemoryBackend  - default; per-process counters split over shards, each an
+                     LRU capped at RATE_LIMIT_MAX_KEYS / shards keys (the
+                     least recently seen key is forgotten first). IP and
+                     email keys live in separate shard sets, so rotating
+                     through made-up emails can never evict IP counters
+    SharedBackend  - the same algorithm over a CounterStore (get_many/incr
+                     with a TTL, i.e. what Redis INCR + EXPIRE gives), so
+                     every worker shares the counts. LocalCounterStore is an
+                     in-process stand-in for tests and single-worker setups
+                     (RATE_LIMIT_BACKEND=local).
+
+Behind a reverse proxy set RATE_LIMIT_TRUSTED_PROXIES to the number of proxies
+that append to X-Forwarded-For; otherwise the socket peer address is used.
+"""
+from collections import Counter, OrderedDict
+from fastapi import HTTPException, Request, status
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import math
+import os
+import threading
+import time
+
+RATE_LIMITING = os.getenv("RATE_LIMITING", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+
+def _limit(name: str, default: str) -> Tuple[int, float]:
+    """"<requests>/<seconds>" from RATE_LIMIT_<NAME>; 0 requests disables the rule"""
+    count, _, seconds = os.getenv(f"RATE_LIMIT_{name}", default).partition("/")
+    return int(count), float(seconds or 60)
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+def _sliding_window(previous: int, current: int, limit: int, window: float, now: float) -> Decision:
+    """Decide one hit given the previous and current fixed-window counts"""
+    elapsed = now % window
+    weight = 1 - elapsed / window
+    estimate = previous * weight + current
+    if estimate + 1 <= limit:
+        return Decision(True, int(limit - estimate - 1), 0.0)
+    if current + 1 > limit or previous == 0:
+        # Nothing frees up before the next window starts
+        return Decision(False, 0, window - elapsed)
+    # Wait until enough of the previous window has slid out
+    free_at = window * (1 - (limit - 1 - current) / previous)
+    return Decision(False, 0, max(free_at - elapsed, 0.001))
+
+class RateLimitBackend:
+    """Counts hits per key; only allowed hits are counted"""
+
+    async def hit(self, key: str, limit: int, window: float, partition: str = "") -> Decision:
+        """`partition` (the key kind) lets a backend keep kinds apart"""
+        raise NotImplementedError
+
+    def size(self) -> int:
+        """Keys currently tracked (-1 if unknown)"""
+        return -1
+
+    def evictions(self) -> Dict[Tuple[str, str], int]:
+        """Keys dropped to bound memory, per (rule, partition)"""
+        return {}
+
+class _Shard:
+    __slots__ = ("lock", "entries")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [window index, current count, previous count]
+        self.entries: "OrderedDict[str, List[int]]" = OrderedDict()
+
+class MemoryBackend(RateLimitBackend):
+    """Sharded in-process counters; each partition gets `shards` shards and `max_keys` keys"""
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, max_keys: int = RATE_LIMIT_MAX_KEYS, clock=time.time):
+        self.shard_count = max(shards, 1)
+        self.max_keys_per_shard = max(max_keys // self.shard_count, 1)
+        self.clock = clock
+        self.partitions: Dict[str, List[_Shard]] = {}
+        self._partitions_lock = threading.Lock()
+        self._evictions: Counter = Counter()
+
+    def _shards(self, partition: str) -> List[_Shard]:
+        shards = self.partitions.get(partition)
+        if shards is None:
+            with self._partitions_lock:
+                shards = self.partitions.setdefault(partition, [_Shard() for _ in range(self.shard_count)])
+        return shards
+
+    async def hit(self, key: str, limit: int, window: float, partition: str = "") -> Decision:
+        return self.hit_sync(key, limit, window, partition)
+
+    def hit_sync(self, key: str, limit: int, window: float, partition: str = "") -> Decision:
+        now = self.clock()
+        index = int(now // window)
+        shards = self._shards(partition)
+        shard = shards[hash(key) % len(shards)]
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                entry = [index, 0, 0]
+                shard.entries[key] = entry
+                if len(shard.entries) > self.max_keys_per_shard:
+                    evicted, _ = shard.entries.popitem(last=False)
+                    self._evictions[(evicted.split(":", 1)[0], partition)] += 1
+            else:
+                shard.entries.move_to_end(key)
+                if entry[0] != index:
+                    entry[2] = entry[1] if entry[0] == index - 1 else 0
+                    entry[1] = 0
+                    entry[0] = index
+            decision = _sliding_window(entry[2], entry[1], limit, window, now)
+            if decision.allowed:
+                entry[1] += 1
+        return decision
+
+    def size(self) -> int:
+        return sum(len(shard.entries) for shards in list(self.partitions.values()) for shard in shards)
+
+    def evictions(self) -> Dict[Tuple[str, str], int]:
+        return dict(self._evictions)
+
+class CounterStore:
+    """Shared counters with expiry, e.g. Redis GET/INCR/EXPIRE"""
+
+    async def get_many(self, keys: Sequence[str]) -> List[int]:
+        raise NotImplementedError
+
+    async def incr(self, key: str, ttl: float) -> int:
+        raise NotImplementedError
+
+class LocalCounterStore(CounterStore):
+    """In-process CounterStore (oldest keys dropped past `max_keys`)"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, clock=time.time):
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [count, expires at]
+        self._counters: "OrderedDict[str, List[float]]" = OrderedDict()
+        # (rule, key kind) -> counters dropped past max_keys
+        self.evictions: Counter = Counter()
+
+    def _get(self, key: str, now: float) -> Optional[List[float]]:
+        counter = self._counters.get(key)
+        if counter is not None and counter[1] <= now:
+            del self._counters[key]
+            return None
+        return counter
+
+    async def get_many(self, keys: Sequence[str]) -> List[int]:
+        now = self.clock()
+        counters = [self._get(key, now) for key in keys]
+        return [int(counter[0]) if counter else 0 for counter in counters]
+
+    async def incr(self, key: str, ttl: float) -> int:
+        now = self.clock()
+        counter = self._get(key, now)
+        if counter is None:
+            counter = [0, now + ttl]
+            self._counters[key] = counter
+            while len(self._counters) > self.max_keys:
+                evicted, _ = self._counters.popitem(last=False)
+                rule, _, rest = evicted.partition(":")
+                self.evictions[(rule, rest.partition(":")[0])] += 1
+        counter[0] += 1
+        return int(counter[0])
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+class SharedBackend(RateLimitBackend):
+    """Sliding-window counts kept in a CounterStore shared by all workers"""
+
+    def __init__(self, store: CounterStore, clock=time.time):
+        self.store = store
+        self.clock = clock
+
+    async def hit(self, key: str, limit: int, window: float, partition: str = "") -> Decision:
+        now = self.clock()
+        index = int(now // window)
+        current_key = f"{key}:{index}"
+        previous, current = await self.store.get_many([f"{key}:{index - 1}", current_key])
+        decision = _sliding_window(previous, current, limit, window, now)
+        if decision.allowed:
+            # Two windows: the count is still needed as "previous" in the next one
+            await self.store.incr(current_key, window * 2)
+        return decision
+
+    def size(self) -> int:
+        return len(self.store) if isinstance(self.store, LocalCounterStore) else -1
+
+    def evictions(self) -> Dict[Tuple[str, str], int]:
+        return dict(self.store.evictions) if isinstance(self.store, LocalCounterStore) else {}
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+        # (rule, key kind, "allowed"/"limited") -> count
+        self.checks: Counter = Counter()
+
+    def set_backend(self, backend: RateLimitBackend):
+        """Swap the backend, e.g. for a SharedBackend over Redis at startup"""
+        self.backend = backend
+
+    async def check(self, rule: str, kind: str, value: str, limit: int, window: float) -> Decision:
+        decision = await self.backend.hit(f"{rule}:{kind}:{value}", limit, window, partition=kind)
+        self.checks[(rule, kind, "allowed" if decision.allowed else "limited")] += 1
+        return decision
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "tracked_keys": self.backend.size(),
+            "evictions": [
+                {"rule": rule, "key": kind, "count": count}
+                for (rule, kind), count in sorted(self.backend.evictions().items())
+            ],
+            "checks": [
+                {"rule": rule, "key": kind, "result": result, "count": count}
+                for (rule, kind, result), count in sorted(self.checks.items())
+            ],
+        }
+
+def _build_backend() -> RateLimitBackend:
+    if RATE_LIMIT_BACKEND == "local":
+        return SharedBackend(LocalCounterStore())
+    if RATE_LIMIT_BACKEND != "memory":
+        print(f"⚠️ Warning: Unknown RATE_LIMIT_BACKEND '{RATE_LIMIT_BACKEND}', using in-memory counters")
+    return MemoryBackend()
+
+limiter = RateLimiter(_build_backend())
+
+def client_ip(request: Request) -> str:
+    """Client address, taken from X-Forwarded-For when behind trusted proxies"""
+    if RATE_LIMIT_TRUSTED_PROXIES > 0:
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if hops:
+            # Each trusted proxy appends the address it received from
+            return hops[-min(RATE_LIMIT_TRUSTED_PROXIES, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+_email_adapter = TypeAdapter(EmailStr)
+
+async def _body_email(request: Request) -> Optional[str]:
+    """The body's email if it is a valid address (requests with an invalid one get a 422 anyway)"""
+    try:
+        body = await request.json()
+    except Exception:
+        return None
+    email = body.get("email") if isinstance(body, dict) else None
+    if not isinstance(email, str):
+        return None
+    try:
+        return _email_adapter.validate_python(email.strip()).lower()
+    except ValidationError:
+        return None
+
+class RateLimit:
+    """
+    Dependency enforcing per-IP and/or per-email limits for one rule.
+    Raises 429 with Retry-After when any of them is exceeded.
+    """
+
+    def __init__(self, rule: str, per_ip: Optional[Tuple[int, float]] = None,
+                 per_email: Optional[Tuple[int, float]] = None, limiter: RateLimiter = limiter):
+        self.rule = rule
+        self.limits: Dict[str, Tuple[int, float]] = {
+            kind: limit for kind, limit in (("ip", per_ip), ("email", per_email))
+            if limit is not None and limit[0] > 0
+        }
+        self.limiter = limiter
+
+    async def __call__(self, request: Request):
+        if not RATE_LIMITING:
+            return
+        for kind, (limit, window) in self.limits.items():
+            value = client_ip(request) if kind == "ip" else await _body_email(request)
+            if value is None:
+                continue
+            decision = await self.limiter.check(self.rule, kind, value, limit, window)
+            if not decision.allowed:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests, please try again later",
+                    headers={"Retry-After": str(max(math.ceil(decision.retry_after), 1))}
+                )
+
+login_rate_limit = RateLimit("login", per_ip=_limit("LOGIN_IP", "30/60"), per_email=_limit("LOGIN_EMAIL", "10/300"))
+register_rate_limit = RateLimit("register", per_ip=_limit("REGISTER_IP", "10/3600"))
+google_login_rate_limit = RateLimit("google_login", per_ip=_limit("GOOGLE_IP", "30/60"))
+waitlist_rate_limit = RateLimit("beta_waitlist", per_ip=_limit("WAITLIST_IP", "10/600"), per_email=_limit("WAITLIST_EMAIL", "3/3600"))
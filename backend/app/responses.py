@@ -0,0 +1,51 @@
+"""
+Default JSON response class
+
+Bodies are encoded with orjson, which handles UUIDs (GUID columns) and
+datetimes natively; Decimals (App.rating) become floats, as they do through
+FastAPI's own encoder. Without orjson the stdlib encoder is used with the
+same conversions and Starlette's output format.
+"""
+from decimal import Decimal
+from typing import Any
+from fastapi.responses import JSONResponse
+from datetime import date, datetime, time
+import json
+import uuid
+
+# orjson is optional: without it responses fall back to the stdlib encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    print("⚠️ Warning: orjson not installed, using the standard library JSON encoder")
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Encode content the way API responses are encoded"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when available"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,18 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from sqlalchemy import func
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
 from datetime import datetime, timedelta
-from app.database import get_db
-from app.models import User, BetaWaitlist, CommunityPost, CommunityReply, AppSettings
+from app.database import get_db, SessionLocal
+from app.models import User, BetaWaitlist, CommunityPost, CommunityReply, App, UserAppDownload
 from app.auth import get_current_active_user
 from app.schemas import UserResponse, BetaWaitlistResponse
+from app.catalog import load_apps_list, update_catalog
+from app.settings import settings
+from app.singleflight import SingleFlight
+from app import notifications
+from app.storage import (
+    get_downloads_dir,
+    store_upload,
+    link_friendly_name,
+    unlink_friendly_name,
+    remove_blob,
+    friendly_filename,
+)
+from app.patches import APK_PATCH_HISTORY, schedule_patches, remove_patches, patch_url
 from pydantic import BaseModel
 import uuid
 import os
-import json
 import shutil
-from pathlib import Path
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -37,54 +49,62 @@ class AdminStatsResponse(BaseModel):
     posts_last_7_days: int
     users_with_downloads: int
 
+# Several admins opening the dashboard at once share one set of count queries
+admin_stats_flight = SingleFlight("admin_stats")
+
+def compute_admin_stats() -> AdminStatsResponse:
+    """Dashboard counts (runs in a worker thread with its own session)"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        seven_days_ago = now - timedelta(days=7)
+        thirty_days_ago = now - timedelta(days=30)
+    
+        # User statistics
+        total_users = db.query(func.count(User.id)).scalar() or 0
+        active_users = db.query(func.count(User.id)).filter(User.is_active == True).scalar() or 0
+        users_last_7_days = db.query(func.count(User.id)).filter(
+            User.created_at >= seven_days_ago
+        ).scalar() or 0
+        users_last_30_days = db.query(func.count(User.id)).filter(
+            User.created_at >= thirty_days_ago
+        ).scalar() or 0
+        users_with_downloads = db.query(func.count(User.id)).filter(
+            User.has_downloaded == True
+        ).scalar() or 0
+    
+        # Waitlist statistics
+        total_waitlist = db.query(func.count(BetaWaitlist.id)).scalar() or 0
+        waitlist_notified = db.query(func.count(BetaWaitlist.id)).filter(
+            BetaWaitlist.notified == True
+        ).scalar() or 0
+    
+        # Community statistics
+        total_posts = db.query(func.count(CommunityPost.id)).scalar() or 0
+        total_replies = db.query(func.count(CommunityReply.id)).scalar() or 0
+        posts_last_7_days = db.query(func.count(CommunityPost.id)).filter(
+            CommunityPost.created_at >= seven_days_ago
+        ).scalar() or 0
+    
+        return AdminStatsResponse(
+            total_users=total_users,
+            active_users=active_users,
+            total_waitlist=total_waitlist,
+            waitlist_notified=waitlist_notified,
+            total_posts=total_posts,
+            total_replies=total_replies,
+            users_last_7_days=users_last_7_days,
+            users_last_30_days=users_last_30_days,
+            posts_last_7_days=posts_last_7_days,
+            users_with_downloads=users_with_downloads
+        )
+    finally:
+        db.close()
+
 @router.get("/stats", response_model=AdminStatsResponse)
-async def get_admin_stats(
-    current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
+async def get_admin_stats(current_user: User = Depends(get_current_admin)):
     """Get admin dashboard statistics"""
-    now = datetime.utcnow()
-    seven_days_ago = now - timedelta(days=7)
-    thirty_days_ago = now - timedelta(days=30)
-    
-    # User statistics
-    total_users = db.query(func.count(User.id)).scalar() or 0
-    active_users = db.query(func.count(User.id)).filter(User.is_active == True).scalar() or 0
-    users_last_7_days = db.query(func.count(User.id)).filter(
-        User.created_at >= seven_days_ago
-    ).scalar() or 0
-    users_last_30_days = db.query(func.count(User.id)).filter(
-        User.created_at >= thirty_days_ago
-    ).scalar() or 0
-    users_with_downloads = db.query(func.count(User.id)).filter(
-        User.has_downloaded == True
-    ).scalar() or 0
-    
-    # Waitlist statistics
-    total_waitlist = db.query(func.count(BetaWaitlist.id)).scalar() or 0
-    waitlist_notified = db.query(func.count(BetaWaitlist.id)).filter(
-        BetaWaitlist.notified == True
-    ).scalar() or 0
-    
-    # Community statistics
-    total_posts = db.query(func.count(CommunityPost.id)).scalar() or 0
-    total_replies = db.query(func.count(CommunityReply.id)).scalar() or 0
-    posts_last_7_days = db.query(func.count(CommunityPost.id)).filter(
-        CommunityPost.created_at >= seven_days_ago
-    ).scalar() or 0
-    
-    return AdminStatsResponse(
-        total_users=total_users,
-        active_users=active_users,
-        total_waitlist=total_waitlist,
-        waitlist_notified=waitlist_notified,
-        total_posts=total_posts,
-        total_replies=total_replies,
-        users_last_7_days=users_last_7_days,
-        users_last_30_days=users_last_30_days,
-        posts_last_7_days=posts_last_7_days,
-        users_with_downloads=users_with_downloads
-    )
+    return await admin_stats_flight.do("stats", lambda: run_in_threadpool(compute_admin_stats))
 
 @router.get("/waitlist", response_model=List[BetaWaitlistResponse])
 async def get_waitlist(
@@ -99,6 +119,51 @@ async def get_waitlist(
     ).offset(skip).limit(limit).all()
     return waitlist
 
+class WaitlistNotifyRequest(BaseModel):
+    subject: str
+    body: str
+
+@router.post("/waitlist/notify", status_code=status.HTTP_202_ACCEPTED)
+async def start_waitlist_notification(
+    notify_data: WaitlistNotifyRequest,
+    current_user: User = Depends(get_current_admin)
+):
+    """Email every un-notified waitlist entry in the background"""
+    if not notify_data.subject.strip() or not notify_data.body.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Subject and body are required"
+        )
+    try:
+        job = notifications.start_job(notify_data.subject, notify_data.body)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return job.status()
+
+@router.get("/waitlist/notify")
+async def get_waitlist_notification_status(
+    current_user: User = Depends(get_current_admin)
+):
+    """Progress and throughput of the current (or last) notification job"""
+    job = notifications.current_job()
+    if job is None:
+        return {"state": "idle"}
+    return job.status()
+
+@router.post("/waitlist/notify/cancel")
+async def cancel_waitlist_notification(
+    current_user: User = Depends(get_current_admin)
+):
+    """Stop the running notification job; already delivered entries stay notified"""
+    job = notifications.current_job()
+    if job is None or not job.running:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No notification job is running"
+        )
+    await job.cancel()
+    return job.status()
+
 @router.get("/users", response_model=List[UserResponse])
 async def get_all_users(
     skip: int = 0,
@@ -171,25 +236,10 @@ class BetaPasswordUpdate(BaseModel):
 
 @router.get("/beta-password")
 async def get_beta_password(
-    current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_admin)
 ):
     """Get current BetaGate password"""
-    setting = db.query(AppSettings).filter(AppSettings.key == "beta_access_password").first()
-    if not setting:
-        # Return default if not set
-        default_password = "androama2025beta"
-        # Create it
-        setting = AppSettings(
-            key="beta_access_password",
-            value=default_password,
-            description="Beta access password for ANDROAMA",
-            updated_by=current_user.id
-        )
-        db.add(setting)
-        db.commit()
-        db.refresh(setting)
-    return {"password": setting.value}
+    return {"password": settings.beta_access_password}
 
 @router.put("/beta-password")
 async def update_beta_password(
@@ -204,69 +254,32 @@ async def update_beta_password(
             detail="Password must be at least 3 characters long"
         )
     
-    setting = db.query(AppSettings).filter(AppSettings.key == "beta_access_password").first()
-    if setting:
-        setting.value = password_data.password
-        setting.updated_by = current_user.id
-        setting.updated_at = datetime.utcnow()
-    else:
-        setting = AppSettings(
-            key="beta_access_password",
-            value=password_data.password,
-            description="Beta access password for ANDROAMA",
-            updated_by=current_user.id
-        )
-        db.add(setting)
-    
-    db.commit()
-    db.refresh(setting)
-    return {"message": "Beta password updated successfully", "password": setting.value}
+    # Other workers pick the change up via NOTIFY (PostgreSQL) or polling
+    settings.set(db, "beta_access_password", password_data.password, updated_by=current_user.id)
+    return {"message": "Beta password updated successfully", "password": settings.beta_access_password}
 
 # ==================== APP MANAGEMENT ====================
 
-def get_apps_list_path() -> Path:
-    """Get path to apps list JSON file"""
-    backend_dir = Path(__file__).parent.parent.parent
-    apps_file = backend_dir / "apps_list.json"
-    return apps_file
+def download_urls(filename: str, sha256: Optional[str] = None) -> dict:
+    """Catalog URL fields for a friendly filename and (optionally) its blob"""
+    base_url = os.getenv("FRONTEND_URL", "https://androama.com")
+    urls = {"downloadUrl": f"{base_url}/api/public/downloads/{filename}"}
+    if sha256:
+        urls["blobUrl"] = f"{base_url}/api/public/blobs/{sha256}"
+    return urls
 
-def get_downloads_dir() -> Path:
-    """Get path to downloads directory"""
-    # Try to get from environment or use default
-    downloads_path = os.getenv("APPS_DOWNLOADS_DIR", "/var/www/androama/downloads")
-    return Path(downloads_path)
+def find_catalog_app(apps_data: dict, app_id: str) -> Optional[dict]:
+    """The catalog entry with `app_id`, or None"""
+    return next((app for app in apps_data["apps"] if app.get("id") == app_id), None)
 
-def load_apps_list() -> dict:
-    """Load apps list from JSON file"""
-    apps_file = get_apps_list_path()
-    if not apps_file.exists():
-        # Return default structure
-        return {
-            "apps": [],
-            "lastUpdated": datetime.utcnow().isoformat() + "Z"
-        }
-    
-    try:
-        with open(apps_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to load apps list: {str(e)}"
-        )
-
-def save_apps_list(apps_data: dict):
-    """Save apps list to JSON file"""
-    apps_file = get_apps_list_path()
-    try:
-        apps_data["lastUpdated"] = datetime.utcnow().isoformat() + "Z"
-        with open(apps_file, 'w', encoding='utf-8') as f:
-            json.dump(apps_data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to save apps list: {str(e)}"
-        )
+def referenced_blobs(apps) -> set:
+    """SHA-256s of all blobs (current and historical) used by catalog entries"""
+    shas = set()
+    for app in apps:
+        if app.get("sha256"):
+            shas.add(app["sha256"])
+        shas.update(h["sha256"] for h in app.get("history", []) if h.get("sha256"))
+    return shas
 
 class AppCreate(BaseModel):
     name: str
@@ -307,22 +320,12 @@ async def upload_app(
             detail="Only APK files are allowed"
         )
     
-    # Validate file size (max 100MB)
-    file_content = await file.read()
-    if len(file_content) > 100 * 1024 * 1024:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File size exceeds 100MB limit"
-        )
-    
     # Generate app ID from name
     app_id = name.lower().replace(' ', '_').replace('-', '_')
     app_id = ''.join(c for c in app_id if c.isalnum() or c == '_')
     
-    # Check if app ID already exists
-    apps_data = load_apps_list()
-    existing_app = next((app for app in apps_data["apps"] if app.get("id") == app_id), None)
-    if existing_app:
+    # Check if app ID already exists (checked again once the upload is stored)
+    if find_catalog_app(load_apps_list(), app_id) is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"App with ID '{app_id}' already exists"
@@ -332,23 +335,19 @@ async def upload_app(
     downloads_dir = get_downloads_dir()
     downloads_dir.mkdir(parents=True, exist_ok=True)
     
-    # Generate filename
-    safe_filename = f"{app_id}-v{version}.apk"
-    file_path = downloads_dir / safe_filename
-    
-    # Save file
+    # Stream into the content-addressed store (max 100MB), deduplicating identical APKs
     try:
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        blob = await store_upload(file)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to save file: {str(e)}"
         )
     
-    # Generate download URL (use API endpoint for reliability)
     base_url = os.getenv("FRONTEND_URL", "https://androama.com")
-    download_url = f"{base_url}/api/public/downloads/{safe_filename}"
+    safe_filename = friendly_filename(app_id, version)
     
     # Create app entry
     app_entry = {
@@ -357,21 +356,183 @@ async def upload_app(
         "description": description,
         "version": version,
         "packageName": package_name,
-        "downloadUrl": download_url,
+        **download_urls(safe_filename, blob.sha256),
+        "sha256": blob.sha256,
+        "size": blob.size,
         "iconUrl": icon_url or f"{base_url}/images/default-app-icon.png",
         "category": category,
         "isEssential": is_essential
     }
     
-    # Add to apps list
-    apps_data["apps"].append(app_entry)
-    save_apps_list(apps_data)
+    # Add to apps list (load, check, link and save in one step: no await in between)
+    def add(apps_data: dict) -> list:
+        if find_catalog_app(apps_data, app_id) is not None:
+            if not blob.deduplicated and blob.sha256 not in referenced_blobs(apps_data["apps"]):
+                remove_blob(blob.sha256)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"App with ID '{app_id}' already exists"
+            )
+        try:
+            link_friendly_name(blob.sha256, safe_filename)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to save file: {str(e)}"
+            )
+        apps_data["apps"].append(app_entry)
+        return [("add", app_id)]
+    
+    update_catalog(add)
     
     return {
         "message": "App uploaded successfully",
         "app": app_entry
     }
 
+@router.post("/apps/{app_id}/release")
+async def release_app_version(
+    app_id: str,
+    file: UploadFile = File(...),
+    version: str = Form(...),
+    description: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_admin)
+):
+    """Upload a new build of an existing app.
+    
+    The previous build is kept in the app's history and delta patches from the
+    last APK_PATCH_HISTORY versions are generated in the background.
+    """
+    if not file.filename.endswith('.apk'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only APK files are allowed"
+        )
+    
+    def check(apps_data: dict) -> dict:
+        app = find_catalog_app(apps_data, app_id)
+        if app is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"App with ID '{app_id}' not found"
+            )
+        if version == app.get("version"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Version {version} is already the current version"
+            )
+        return app
+    
+    # Fail fast before reading the upload; checked again once it is stored
+    check(load_apps_list())
+    
+    get_downloads_dir().mkdir(parents=True, exist_ok=True)
+    try:
+        blob = await store_upload(file)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to save file: {str(e)}"
+        )
+    safe_filename = friendly_filename(app_id, version)
+    released = {}
+    
+    # Load, update and save in one step (no await in between) so patches
+    # published and edits made during the upload are not overwritten
+    def release(apps_data: dict) -> list:
+        app = check(apps_data)
+        try:
+            link_friendly_name(blob.sha256, safe_filename)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to save file: {str(e)}"
+            )
+        
+        # Keep the previous build around as a patch source
+        history = list(app.get("history", []))
+        if app.get("sha256"):
+            history.insert(0, {"version": app.get("version"), "sha256": app["sha256"], "size": app.get("size")})
+            # Its patches and friendly name go once the new version is saved
+            released["previous"] = {
+                "sha256": app["sha256"],
+                "patches": list(app.get("patches", [])),
+                "filename": friendly_filename(app_id, app.get("version", "1.0")),
+            }
+        history = [h for h in history if h.get("sha256") != blob.sha256][:APK_PATCH_HISTORY]
+        released["dropped"] = referenced_blobs([app]) - referenced_blobs([{"sha256": blob.sha256, "history": history}])
+        
+        app.update(download_urls(safe_filename, blob.sha256))
+        app.update({
+            "version": version,
+            "sha256": blob.sha256,
+            "size": blob.size,
+            "history": history,
+            "patches": [],
+        })
+        if description is not None:
+            app["description"] = description
+        released["app"] = app
+        return [("update", app_id)]
+    
+    def remove_replaced_files(apps_data: dict):
+        # Only after the save, so the catalog never points at deleted files
+        previous = released.get("previous")
+        if previous is not None:
+            try:
+                remove_patches(previous)
+                if previous["filename"] != safe_filename:
+                    unlink_friendly_name(previous["filename"])
+            except OSError:
+                pass  # Stale patches and friendly names are harmless
+        # Blobs that fell out of the history window and are not used elsewhere
+        still_referenced = referenced_blobs(apps_data["apps"])
+        for sha256 in released["dropped"] - still_referenced:
+            try:
+                remove_blob(sha256)
+            except OSError:
+                pass
+    
+    update_catalog(release, after_save=remove_replaced_files)
+    app = released["app"]
+    history = app["history"]
+    
+    base_url = os.getenv("FRONTEND_URL", "https://androama.com")
+    scheduled = schedule_patches(app_id, base_url, history, version, blob.sha256)
+    
+    return {
+        "message": "App version released successfully",
+        "app": app,
+        "patches_scheduled": scheduled
+    }
+
+@router.get("/apps/downloads")
+async def get_app_download_stats(
+    days: int = 30,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Download totals per app plus per-day counts of signed-in downloads"""
+    since = datetime.utcnow() - timedelta(days=days)
+    day = func.date(UserAppDownload.downloaded_at)
+    daily = db.query(
+        App.package_name, day.label("day"), func.count(UserAppDownload.id)
+    ).join(UserAppDownload, UserAppDownload.app_id == App.id).filter(
+        UserAppDownload.downloaded_at >= since
+    ).group_by(App.package_name, day).order_by(day).all()
+    
+    totals = db.query(App.package_name, App.name, App.download_count).all()
+    apps = {
+        package_name: {"package_name": package_name, "name": name, "total": count or 0, "daily": []}
+        for package_name, name, count in totals
+    }
+    for package_name, day_value, count in daily:
+        apps[package_name]["daily"].append({"date": str(day_value), "downloads": count})
+    
+    return {"days": days, "apps": list(apps.values())}
+
 @router.get("/apps/list")
 async def get_admin_apps_list(
     current_user: User = Depends(get_current_admin)
@@ -387,51 +548,65 @@ async def update_app(
     current_user: User = Depends(get_current_admin)
 ):
     """Update app details"""
-    apps_data = load_apps_list()
-    
-    app_index = next((i for i, app in enumerate(apps_data["apps"]) if app.get("id") == app_id), None)
-    if app_index is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"App with ID '{app_id}' not found"
-        )
-    
-    app = apps_data["apps"][app_index]
-    
-    # Update fields
-    if app_update.name is not None:
-        app["name"] = app_update.name
-    if app_update.description is not None:
-        app["description"] = app_update.description
-    if app_update.version is not None:
-        app["version"] = app_update.version
-        # Update filename if version changed
-        old_filename = f"{app_id}-v{app.get('version', '1.0')}.apk"
-        new_filename = f"{app_id}-v{app_update.version}.apk"
-        downloads_dir = get_downloads_dir()
-        old_path = downloads_dir / old_filename
-        new_path = downloads_dir / new_filename
-        if old_path.exists() and not new_path.exists():
+    updated = {}
+    
+    def update(apps_data: dict) -> list:
+        app = find_catalog_app(apps_data, app_id)
+        if app is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"App with ID '{app_id}' not found"
+            )
+        
+        # Update fields
+        if app_update.name is not None:
+            app["name"] = app_update.name
+        if app_update.description is not None:
+            app["description"] = app_update.description
+        if app_update.version is not None and app_update.version != app.get("version"):
+            # Point a new friendly filename at the same APK
+            old_filename = friendly_filename(app_id, app.get("version", "1.0"))
+            new_filename = friendly_filename(app_id, app_update.version)
+            downloads_dir = get_downloads_dir()
             try:
-                shutil.move(str(old_path), str(new_path))
-                base_url = os.getenv("FRONTEND_URL", "https://androama.com")
-                app["downloadUrl"] = f"{base_url}/downloads/{new_filename}"
+                if app.get("sha256"):
+                    link_friendly_name(app["sha256"], new_filename)
+                    if new_filename != old_filename:
+                        updated["old_filename"] = old_filename
+                    app.update(download_urls(new_filename, app["sha256"]))
+                elif (downloads_dir / old_filename).exists() and not (downloads_dir / new_filename).exists():
+                    # Legacy entry stored before content addressing
+                    shutil.move(str(downloads_dir / old_filename), str(downloads_dir / new_filename))
+                    app.update(download_urls(new_filename))
             except Exception as e:
-                pass  # If move fails, keep old URL
-    if app_update.package_name is not None:
-        app["packageName"] = app_update.package_name
-    if app_update.category is not None:
-        app["category"] = app_update.category
-    if app_update.icon_url is not None:
-        app["iconUrl"] = app_update.icon_url
-    if app_update.is_essential is not None:
-        app["isEssential"] = app_update.is_essential
-    
-    save_apps_list(apps_data)
+                pass  # If relinking fails, keep old URL
+            app["version"] = app_update.version
+            base_url = os.getenv("FRONTEND_URL", "https://androama.com")
+            for patch in app.get("patches", []):
+                patch["url"] = patch_url(base_url, app_id, patch["fromVersion"], app_update.version)
+        if app_update.package_name is not None:
+            app["packageName"] = app_update.package_name
+        if app_update.category is not None:
+            app["category"] = app_update.category
+        if app_update.icon_url is not None:
+            app["iconUrl"] = app_update.icon_url
+        if app_update.is_essential is not None:
+            app["isEssential"] = app_update.is_essential
+        updated["app"] = app
+        return [("update", app_id)]
+    
+    def remove_old_filename(apps_data: dict):
+        if "old_filename" in updated:
+            try:
+                unlink_friendly_name(updated["old_filename"])
+            except OSError:
+                pass  # Stale friendly name is harmless
+    
+    update_catalog(update, after_save=remove_old_filename)
     
     return {
         "message": "App updated successfully",
-        "app": app
+        "app": updated["app"]
     }
 
 @router.delete("/apps/{app_id}")
@@ -440,34 +615,33 @@ async def delete_app(
     current_user: User = Depends(get_current_admin)
 ):
     """Delete an app and its APK file"""
-    apps_data = load_apps_list()
-    
-    app_index = next((i for i, app in enumerate(apps_data["apps"]) if app.get("id") == app_id), None)
-    if app_index is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"App with ID '{app_id}' not found"
-        )
-    
-    app = apps_data["apps"][app_index]
-    
-    # Delete APK file
-    downloads_dir = get_downloads_dir()
-    version = app.get("version", "1.0")
-    filename = f"{app_id}-v{version}.apk"
-    file_path = downloads_dir / filename
-    
-    if file_path.exists():
+    deleted = {}
+    
+    def delete(apps_data: dict) -> list:
+        app = find_catalog_app(apps_data, app_id)
+        if app is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"App with ID '{app_id}' not found"
+            )
+        apps_data["apps"].remove(app)
+        deleted["app"] = app
+        return [("delete", app_id)]
+    
+    def remove_files(apps_data: dict):
+        # Delete APK files and patches (blobs only once no other app references them)
+        app = deleted["app"]
         try:
-            file_path.unlink()
+            unlink_friendly_name(friendly_filename(app_id, app.get("version", "1.0")))
+            if app.get("sha256"):
+                remove_patches(app)
+            for sha256 in referenced_blobs([app]) - referenced_blobs(apps_data["apps"]):
+                remove_blob(sha256)
         except Exception as e:
             pass  # Continue even if file deletion fails
     
-    # Remove from apps list
-    apps_data["apps"].pop(app_index)
-    save_apps_list(apps_data)
+    update_catalog(delete, after_save=remove_files)
     
     return {
         "message": "App deleted successfully"
     }
-
@@ -14,9 +14,11 @@ from app.auth import (
     get_user_by_email,
     get_current_active_user,
     ACCESS_TOKEN_EXPIRE_MINUTES,
+    run_password_hash,
     truncate_password
 )
 from app.oauth import google_oauth_login
+from app.ratelimit import login_rate_limit, register_rate_limit, google_login_rate_limit
 from datetime import datetime
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -24,7 +26,12 @@ router = APIRouter(prefix="/api/auth", tags=["auth"])
 class GoogleTokenRequest(BaseModel):
     token: str
 
-@router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/register",
+    response_model=UserResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(register_rate_limit)]
+)
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user with robust validation"""
     try:
@@ -63,7 +70,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         password = truncate_password(user_data.password)
         
         # Create new user
-        hashed_password = get_password_hash(password)
+        hashed_password = await run_password_hash(get_password_hash, password)
         new_user = User(
             email=user_data.email.lower().strip(),  # Normalize email
             password_hash=hashed_password,
@@ -90,7 +97,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
             detail=f"Registration failed: {str(e)}"
         )
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=[Depends(login_rate_limit)])
 async def login(credentials: UserLogin, db: Session = Depends(get_db)):
     """Login and get access token with robust error handling"""
     try:
@@ -117,7 +124,7 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
         # Authenticate user with truncated password
         # Wrap in try-except to catch any passlib errors
         try:
-            user = authenticate_user(db, email, password)
+            user = await authenticate_user(db, email, password)
         except (ValueError, Exception) as e:
             # If passlib still throws 72-byte error, truncate more aggressively
             error_msg = str(e).lower()
@@ -125,7 +132,7 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
                 # Last resort: truncate to 65 bytes and try again
                 password_bytes = password.encode('utf-8')[:65]
                 password = password_bytes.decode('utf-8', errors='ignore')
-                user = authenticate_user(db, email, password)
+                user = await authenticate_user(db, email, password)
             else:
                 # Re-raise if it's a different error
                 raise
@@ -173,7 +180,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_active_
     """Get current user information"""
     return current_user
 
-@router.post("/google", response_model=Token)
+@router.post("/google", response_model=Token, dependencies=[Depends(google_login_rate_limit)])
 async def google_login(request: GoogleTokenRequest, db: Session = Depends(get_db)):
     """Login with Google OAuth token"""
     try:
@@ -195,6 +202,7 @@ async def google_oauth_callback(
     """Handle OAuth 2.0 redirect callback - exchange code for token"""
     import httpx
     from app.oauth import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET
+    from app.http_client import http_client
     
     if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
         raise HTTPException(
@@ -213,40 +221,39 @@ async def google_oauth_callback(
         print(f"  - Redirect URI: {redirect_uri}")
         print(f"  - Code: {code[:20]}...")
         
-        async with httpx.AsyncClient() as client:
-            token_response = await client.post(
-                "https://oauth2.googleapis.com/token",
-                data={
-                    "code": code,
-                    "client_id": GOOGLE_CLIENT_ID,
-                    "client_secret": GOOGLE_CLIENT_SECRET,
-                    "redirect_uri": redirect_uri,
-                    "grant_type": "authorization_code",
-                },
-                timeout=10.0
+        token_response = await http_client.post(
+            "https://oauth2.googleapis.com/token",
+            upstream="google-token",
+            data={
+                "code": code,
+                "client_id": GOOGLE_CLIENT_ID,
+                "client_secret": GOOGLE_CLIENT_SECRET,
+                "redirect_uri": redirect_uri,
+                "grant_type": "authorization_code",
+            }
+        )
+        
+        print(f"🔍 Google token response status: {token_response.status_code}")
+        if token_response.status_code != 200:
+            error_text = token_response.text
+            print(f"❌ Google token exchange error: {error_text}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Failed to exchange authorization code: {error_text}"
             )
-            
-            print(f"🔍 Google token response status: {token_response.status_code}")
-            if token_response.status_code != 200:
-                error_text = token_response.text
-                print(f"❌ Google token exchange error: {error_text}")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail=f"Failed to exchange authorization code: {error_text}"
-                )
-            
-            token_data = token_response.json()
-            id_token = token_data.get("id_token")
-            
-            if not id_token:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="No ID token received from Google"
-                )
-            
-            # Use existing google_oauth_login function with the ID token
-            return await google_oauth_login(db, id_token)
-            
+        
+        token_data = token_response.json()
+        id_token = token_data.get("id_token")
+        
+        if not id_token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No ID token received from Google"
+            )
+        
+        # Use existing google_oauth_login function with the ID token
+        return await google_oauth_login(db, id_token)
+        
     except httpx.RequestError as e:
         raise HTTPException(
             status_code=status.HTTP_502_BAD_GATEWAY,
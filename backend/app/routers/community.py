@@ -1,16 +1,93 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
 from typing import List, Optional
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models import CommunityPost, CommunityReply, PostLike, ReplyLike, User
 from app.schemas import PostCreate, PostResponse, PostUpdate, ReplyCreate, ReplyResponse
 from app.auth import get_current_active_user
+from app.singleflight import SingleFlight
 import json
 import uuid
 
 router = APIRouter(prefix="/api/community", tags=["community"])
 
+# The first page right after a notification is requested by many users at once:
+# identical concurrent listings share one query, only likes are per user
+posts_flight = SingleFlight("community_posts")
+
+def load_posts(category: Optional[str], search: Optional[str], sort_by: str, skip: int, limit: int) -> List[dict]:
+    """Post list without per-user fields (runs in a worker thread with its own session)"""
+    db = SessionLocal()
+    try:
+        query = db.query(CommunityPost)
+        
+        # Filter by category
+        if category:
+            query = query.filter(CommunityPost.category == category)
+        
+        # Search
+        if search:
+            search_term = f"%{search}%"
+            query = query.filter(
+                or_(
+                    CommunityPost.title.ilike(search_term),
+                    CommunityPost.content.ilike(search_term)
+                )
+            )
+        
+        # Sorting
+        if sort_by == "newest":
+            query = query.order_by(CommunityPost.created_at.desc())
+        elif sort_by == "popular":
+            query = query.order_by(
+                (CommunityPost.likes_count + CommunityPost.replies_count + CommunityPost.views).desc()
+            )
+        elif sort_by == "trending":
+            # Trending: recent posts with high engagement
+            query = query.order_by(CommunityPost.is_pinned.desc(), CommunityPost.created_at.desc())
+        
+        # Get posts
+        posts = query.offset(skip).limit(limit).all()
+        
+        result = []
+        for post in posts:
+            # Parse tags
+            tags = []
+            if post.tags:
+                try:
+                    tags = json.loads(post.tags)
+                except:
+                    tags = []
+            
+            result.append({
+                "id": post.id,
+                "title": post.title,
+                "content": post.content,
+                "category": post.category,
+                "tags": tags,
+                "is_pinned": post.is_pinned,
+                "is_announcement": post.is_announcement,
+                "is_solved": post.is_solved,
+                "views": post.views,
+                "likes_count": post.likes_count,
+                "replies_count": post.replies_count,
+                "created_at": post.created_at,
+                "updated_at": post.updated_at,
+                "author": {
+                    "id": post.user.id,
+                    "username": post.user.username,
+                    "email": post.user.email,
+                    "edition": post.user.edition,
+                    "is_admin": post.user.is_admin,
+                    "avatar_url": post.user.avatar_url
+                }
+            })
+        return result
+    finally:
+        db.close()
+
 @router.get("/posts", response_model=List[PostResponse])
 async def get_posts(
     category: Optional[str] = Query(None),
@@ -22,83 +99,27 @@ async def get_posts(
     db: Session = Depends(get_db)
 ):
     """Get all community posts with filtering and sorting"""
-    query = db.query(CommunityPost)
-    
-    # Filter by category
-    if category and category != "All":
-        query = query.filter(CommunityPost.category == category)
-    
-    # Search
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                CommunityPost.title.ilike(search_term),
-                CommunityPost.content.ilike(search_term)
-            )
-        )
-    
-    # Sorting
-    if sort_by == "newest":
-        query = query.order_by(CommunityPost.created_at.desc())
-    elif sort_by == "popular":
-        query = query.order_by(
-            (CommunityPost.likes_count + CommunityPost.replies_count + CommunityPost.views).desc()
-        )
-    elif sort_by == "trending":
-        # Trending: recent posts with high engagement
-        query = query.order_by(CommunityPost.is_pinned.desc(), CommunityPost.created_at.desc())
-    
-    # Get posts
-    posts = query.offset(skip).limit(limit).all()
-    
-    # Check which posts user has liked
+    key = (
+        category if category and category != "All" else None,
+        search or None,
+        sort_by,
+        skip,
+        limit
+    )
+    posts = await posts_flight.do(key, lambda: run_in_threadpool(load_posts, *key))
+    
+    # Check which of these posts the user has liked
+    post_ids = [post["id"] for post in posts]
     user_liked_post_ids = {
         like.post_id for like in db.query(PostLike.post_id)
-        .filter(PostLike.user_id == current_user.id)
+        .filter(PostLike.user_id == current_user.id, PostLike.post_id.in_(post_ids))
         .all()
-    }
-    
-    # Format response
-    result = []
-    for post in posts:
-        # Parse tags
-        tags = []
-        if post.tags:
-            try:
-                tags = json.loads(post.tags)
-            except:
-                tags = []
-        
-        # Get author info
-        author_data = {
-            "id": post.user.id,
-            "username": post.user.username,
-            "email": post.user.email,
-            "edition": post.user.edition,
-            "is_admin": post.user.is_admin,
-            "avatar_url": post.user.avatar_url
-        }
-        
-        result.append(PostResponse(
-            id=post.id,
-            title=post.title,
-            content=post.content,
-            category=post.category,
-            tags=tags,
-            is_pinned=post.is_pinned,
-            is_announcement=post.is_announcement,
-            is_solved=post.is_solved,
-            views=post.views,
-            likes_count=post.likes_count,
-            replies_count=post.replies_count,
-            created_at=post.created_at,
-            updated_at=post.updated_at,
-            author=author_data,
-            user_liked=post.id in user_liked_post_ids
-        ))
+    } if post_ids else set()
     
-    return result
+    return [
+        PostResponse(**post, user_liked=post["id"] in user_liked_post_ids)
+        for post in posts
+    ]
 
 @router.post("/posts", response_model=PostResponse, status_code=status.HTTP_201_CREATED)
 async def create_post(
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.orm import Session
+from typing import List
+from app.database import get_db
+from app.models import User, UserDevice
+from app.schemas import DeviceBase, DeviceResponse
+from app.auth import get_current_active_user, get_token_subject
+from app.device_heartbeats import DEVICE_HEARTBEAT_INTERVAL, record_heartbeat, pending_last_seen
+
+router = APIRouter(prefix="/api/devices", tags=["devices"])
+
+@router.post("/heartbeat", status_code=status.HTTP_202_ACCEPTED)
+async def device_heartbeat(
+    heartbeat: DeviceBase,
+    email: str = Depends(get_token_subject)
+):
+    """Report that a device is connected (no database access; written in batches)"""
+    record_heartbeat(
+        email,
+        heartbeat.device_id,
+        device_name=heartbeat.device_name,
+        device_model=heartbeat.device_model,
+        android_version=heartbeat.android_version
+    )
+    return {"success": True, "next_heartbeat_in": DEVICE_HEARTBEAT_INTERVAL}
+
+@router.get("", response_model=List[DeviceResponse])
+async def get_devices(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """List the current user's devices"""
+    devices = db.query(UserDevice).filter(
+        UserDevice.user_id == current_user.id
+    ).order_by(UserDevice.last_seen.desc()).all()
+    
+    # Include heartbeats that haven't been flushed yet
+    results = []
+    for device in devices:
+        result = DeviceResponse.model_validate(device)
+        pending = pending_last_seen(current_user.email, device.device_id)
+        if pending is not None:
+            result.last_seen = pending
+        results.append(result)
+    return results
@@ -0,0 +1,147 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.models import User
+from app.routers.admin import get_current_admin
+from app import profiler, memory
+
+router = APIRouter(prefix="/api/admin/diagnostics", tags=["diagnostics"])
+
+@router.post("/profile")
+async def run_profile(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval: float = Query(profiler.PROFILE_INTERVAL, ge=0.001, le=1),
+    include_idle: bool = Query(False),
+    format: str = Query("json", regex="^(json|collapsed)$"),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Sample every thread of this worker process for `seconds`.
+
+    `format=collapsed` returns the stacks ready for flamegraph.pl/speedscope;
+    the JSON report adds the hottest functions and is kept for later retrieval.
+    """
+    try:
+        report = await profiler.profile(seconds, interval, include_idle)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    profile_id = profiler.store_report(report, requested_by=current_user.email)
+    if format == "collapsed":
+        return PlainTextResponse(report["collapsed"], headers={"x-profile-id": profile_id})
+    return {"id": profile_id, **report}
+
+@router.get("/profiles")
+async def list_profiles(current_user: User = Depends(get_current_admin)):
+    """Recent profile reports (admin-triggered and per-request), newest first"""
+    return [
+        {
+            "id": profile_id,
+            "path": report.get("path"),
+            "method": report.get("method"),
+            "requested_by": report.get("requested_by"),
+            "started_at": report["started_at"],
+            "duration_seconds": report["duration_seconds"],
+            "samples": report["samples"],
+        }
+        for profile_id, report in reversed(profiler.reports.items())
+    ]
+
+@router.get("/profiles/{profile_id}")
+async def get_profile_report(
+    profile_id: str,
+    format: str = Query("json", regex="^(json|collapsed)$"),
+    current_user: User = Depends(get_current_admin)
+):
+    """A stored profile report, e.g. the one named by a response's X-Profile-Id header"""
+    report = profiler.reports.get(profile_id)
+    if report is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    if format == "collapsed":
+        return PlainTextResponse(report["collapsed"])
+    return {"id": profile_id, **report}
+
+@router.get("/memory")
+async def memory_status(current_user: User = Depends(get_current_admin)):
+    """Whether allocation tracing is on, traced heap size and stored snapshots"""
+    return memory.status()
+
+@router.post("/memory/start")
+async def start_memory_tracing(
+    frames: int = Query(memory.MEMORY_TRACE_FRAMES, ge=1, le=100),
+    current_user: User = Depends(get_current_admin)
+):
+    """Start tracemalloc and tag new ORM instances with the route that made them"""
+    return memory.start(frames)
+
+@router.post("/memory/stop")
+async def stop_memory_tracing(current_user: User = Depends(get_current_admin)):
+    """Stop tracing (snapshots already taken are kept)"""
+    return memory.stop()
+
+@router.post("/memory/snapshots")
+async def take_memory_snapshot(
+    label: Optional[str] = Query(None, max_length=100),
+    limit: int = Query(25, ge=1, le=500),
+    current_user: User = Depends(get_current_admin)
+):
+    """Snapshot the traced heap; returns its id and the largest modules and call sites"""
+    try:
+        snapshot_id = await run_in_threadpool(memory.take_snapshot, label)
+    except memory.MemoryTracingOff as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    return await run_in_threadpool(memory.summarize, snapshot_id, limit)
+
+@router.get("/memory/snapshots/{snapshot_id}")
+async def get_memory_snapshot(
+    snapshot_id: str,
+    limit: int = Query(25, ge=1, le=500),
+    current_user: User = Depends(get_current_admin)
+):
+    if snapshot_id not in memory.snapshots:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Snapshot not found"
+        )
+    return await run_in_threadpool(memory.summarize, snapshot_id, limit)
+
+@router.delete("/memory/snapshots")
+async def clear_memory_snapshots(current_user: User = Depends(get_current_admin)):
+    memory.clear_snapshots()
+    return {"message": "Snapshots cleared"}
+
+@router.get("/memory/diff")
+async def diff_memory_snapshots(
+    base: str = Query(...),
+    target: Optional[str] = Query(None, description="Snapshot id; omit to compare against the heap now"),
+    limit: int = Query(25, ge=1, le=500),
+    current_user: User = Depends(get_current_admin)
+):
+    """Allocation growth from `base` to `target`, by call site and by module"""
+    for snapshot_id in (base, target):
+        if snapshot_id is not None and snapshot_id not in memory.snapshots:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Snapshot {snapshot_id} not found"
+            )
+    try:
+        return await run_in_threadpool(memory.diff, base, target, limit)
+    except memory.MemoryTracingOff as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+
+@router.get("/memory/objects")
+async def orm_object_counts(current_user: User = Depends(get_current_admin)):
+    """Live ORM instances per model class, and per route for instances created while tracing"""
+    return await run_in_threadpool(memory.orm_object_counts)
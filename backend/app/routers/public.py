@@ -1,58 +1,88 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, EmailStr
 from app.database import get_db
-from app.models import BetaWaitlist, AppSettings
+from app.settings import settings
+from app.waitlist import (
+    WAITLIST_BATCHING,
+    waitlist_batcher,
+    join_waitlist,
+    get_waitlist_count as get_cached_waitlist_count,
+)
+from app.catalog import get_catalog_changes, get_apps_list_path, load_apps_list, load_published_apps_list, find_app
+from app.compression import PrecompressedPayload
+from app.singleflight import SingleFlight
+from app.ratelimit import waitlist_rate_limit
+from app.downloads import stat_file, file_response
+from app.storage import get_downloads_dir, blob_relative_path
+from app.patches import patch_relative_path
+from app.download_stats import record_download, counts_as_download
+from app.licensing import public_key as license_public_key
 from pathlib import Path
+from typing import Optional
 import os
 import uuid
 
 router = APIRouter(prefix="/api/public", tags=["public"])
 
+DOWNLOADS_DIR = get_downloads_dir()
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_apps_list_cache = {"mtime": None, "payload": None}
+# Clients polling right after a release share one rebuild of the catalog
+apps_list_flight = SingleFlight("apps_list")
+
+def _apps_list_mtime() -> Optional[int]:
+    try:
+        return get_apps_list_path().stat().st_mtime_ns
+    except OSError:
+        return None
+
+def _build_apps_list_payload(mtime: Optional[int]) -> PrecompressedPayload:
+    """Read apps_list.json and encode/compress it (runs in a worker thread)"""
+    payload = PrecompressedPayload(load_published_apps_list())
+    _apps_list_cache.update(mtime=mtime, payload=payload)
+    return payload
+
+async def _apps_list_payload() -> PrecompressedPayload:
+    """The catalog as served by /apps/list, rebuilt only when apps_list.json changes on disk"""
+    mtime = _apps_list_mtime()
+    if _apps_list_cache["payload"] is not None and _apps_list_cache["mtime"] == mtime:
+        return _apps_list_cache["payload"]
+    return await apps_list_flight.do(mtime, lambda: run_in_threadpool(_build_apps_list_payload, mtime))
+
 class BetaWaitlistRequest(BaseModel):
     email: EmailStr
 
-@router.post("/beta-waitlist")
+@router.post("/beta-waitlist", dependencies=[Depends(waitlist_rate_limit)])
 async def join_beta_waitlist(
     request: BetaWaitlistRequest,
     db: Session = Depends(get_db)
 ):
     """Add email to beta waitlist"""
-    # Check if email already exists
-    existing = db.query(BetaWaitlist).filter(BetaWaitlist.email == request.email).first()
-    if existing:
+    # Single INSERT ... ON CONFLICT DO NOTHING: no lookup, no duplicate-key race.
+    # In batching mode the insert is shared with other concurrent signups.
+    if WAITLIST_BATCHING:
+        inserted = await waitlist_batcher.submit(request.email)
+    else:
+        inserted = join_waitlist(db, request.email)
+    if not inserted:
         return {"message": "Email already registered for beta access", "success": True}
     
-    # Add to waitlist
-    waitlist_entry = BetaWaitlist(
-        email=request.email,
-        notified=False
-    )
-    
-    db.add(waitlist_entry)
-    db.commit()
-    db.refresh(waitlist_entry)
-    
     return {"message": "Successfully added to beta waitlist", "success": True}
 
 @router.get("/beta-waitlist")
-async def get_waitlist_count(
-    db: Session = Depends(get_db)
-):
+async def get_waitlist_count():
     """Get waitlist count (for display purposes)"""
-    count = db.query(BetaWaitlist).count()
-    return {"count": count}
+    # Cached and refreshed periodically so landing-page traffic doesn't COUNT(*) each view
+    return {"count": await get_cached_waitlist_count()}
 
 @router.get("/beta-password")
-async def get_beta_password_public(db: Session = Depends(get_db)):
+async def get_beta_password_public():
     """Get current BetaGate password (public endpoint for BetaGate page)"""
-    setting = db.query(AppSettings).filter(AppSettings.key == "beta_access_password").first()
-    if not setting:
-        # Return default if not set
-        default_password = "androama2025beta"
-        return {"password": default_password}
-    return {"password": setting.value}
+    # Served from the in-memory settings cache, no database access
+    return {"password": settings.beta_access_password}
 
 class BetaTokenRequest(BaseModel):
     token: str
@@ -82,103 +112,104 @@ async def validate_beta_token(request: BetaTokenRequest):
     except JWTError:
         return {"valid": False, "reason": "Token expired or invalid"}
 
+@router.get("/license/public-key")
+async def get_license_public_key():
+    """Public key the desktop app uses to verify license tokens offline"""
+    return license_public_key()
 
 @router.get("/apps/list")
-async def get_apps_list():
+async def get_apps_list(request: Request):
     """
     Get list of available apps for Androama desktop app.
     This endpoint is checked automatically when users open the Apps section.
     
     Apps are managed through the Admin Panel - no manual editing needed!
+    Served from a precompressed in-memory copy with an ETag, so polls that
+    send If-None-Match get a 304 until the catalog changes.
     """
-    import json
-    from pathlib import Path
-    
-    # Try to load from JSON file (managed by admin panel)
-    backend_dir = Path(__file__).parent.parent.parent
-    apps_file = backend_dir / "apps_list.json"
-    
-    if apps_file.exists():
-        try:
-            with open(apps_file, 'r', encoding='utf-8') as f:
-                apps_data = json.load(f)
-                # Ensure lastUpdated is current
-                from datetime import datetime
-                apps_data["lastUpdated"] = datetime.utcnow().isoformat() + "Z"
-                return apps_data
-        except Exception as e:
-            # If JSON file is corrupted, fall back to default
-            pass
+    return (await _apps_list_payload()).response(request)
+
+@router.get("/apps/changes")
+async def get_apps_changes(since: int = Query(0, ge=0)):
+    """
+    Incremental catalog sync for the desktop app.
     
-    # Fallback to default apps if JSON file doesn't exist
-    from datetime import datetime
+    Pass the `catalogVersion` from the last list/changes response as `since`.
+    Returns only added/updated/removed apps, or `full: true` with the complete
+    list when the change history no longer covers `since`.
+    """
+    return get_catalog_changes(since)
+
+@router.api_route("/apps/{app_id}/patches/{from_version}/{to_version}", methods=["GET", "HEAD"])
+async def download_patch(app_id: str, from_version: str, to_version: str, request: Request):
+    """
+    Serve a bsdiff patch that turns the APK of `from_version` into `to_version`.
+    Available patches (with sizes and checksums) are listed on the catalog entry.
+    """
+    app = next((a for a in load_apps_list()["apps"] if a.get("id") == app_id), None)
+    patch = None
+    if app and app.get("version") == to_version:
+        patch = next((p for p in app.get("patches", []) if p.get("fromVersion") == from_version), None)
+    if patch is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No patch from {from_version} to {to_version} for '{app_id}'"
+        )
     
-    apps = [
-        {
-            "id": "androama_websocket_client",
-            "name": "ANDROAMA Client",
-            "description": "Enhanced WebSocket client v2.0 with SMS, phone calls, photos, notifications, and ADB Proxy. Full device integration for seamless PC-to-phone connectivity.",
-            "version": "2.0.0",
-            "build": 13,
-            "packageName": "com.androama.websocketclient",
-            "downloadUrl": "https://androama.com/downloads/androama-client-v2.0.0-build13.apk",
-            "iconUrl": "https://androama.com/images/androama-client-icon.png",
-            "category": "Essentials",
-            "isEssential": True
-        },
-        {
-            "id": "termux",
-            "name": "Termux",
-            "description": "Terminal emulator with package management. Required for SSH tunnels and advanced features. Provides Linux-like environment on Android.",
-            "version": "0.118.0",
-            "packageName": "com.termux",
-            "downloadUrl": "https://androama.com/downloads/termux-latest.apk",
-            "iconUrl": "https://raw.githubusercontent.com/termux/termux-app/master/app/src/main/res/mipmap-xxxhdpi/ic_launcher.png",
-            "category": "Tools",
-            "isEssential": False
+    info = stat_file(DOWNLOADS_DIR, patch_relative_path(patch["fromSha256"], app["sha256"]))
+    response = file_response(
+        request,
+        info._replace(etag=f'"{patch["sha256"]}"'),
+        filename=f"{app_id}-{from_version}-to-{to_version}.bsdiff",
+        media_type="application/octet-stream",
+        headers={
+            "cache-control": IMMUTABLE_CACHE_CONTROL,
+            "x-patch-sha256": patch["sha256"],
+            "x-target-sha256": app["sha256"],
         }
-    ]
-    
-    return {
-        "apps": apps,
-        "lastUpdated": datetime.utcnow().isoformat() + "Z"
-    }
+    )
+    if counts_as_download(request.method, response):
+        record_download(app, request.headers.get("authorization"))
+    return response
 
-@router.get("/downloads/{filename:path}")
-async def download_file(filename: str):
+@router.api_route("/blobs/{sha256}", methods=["GET", "HEAD"])
+async def download_blob(sha256: str, request: Request):
     """
-    Serve APK files from the public/downloads directory.
-    This endpoint allows downloading APK files that were uploaded via the Admin Panel.
+    Serve an APK by its SHA-256 (as published in the apps catalog).
+    Content never changes for a given URL, so it can be cached forever.
     """
-    try:
-        # Get the project root directory (go up from backend/app/routers/public.py)
-        # backend/app/routers/public.py -> backend/app/routers -> backend/app -> backend -> project root
-        project_root = Path(__file__).parent.parent.parent.parent
-        downloads_dir = project_root / "public" / "downloads"
-        file_path = downloads_dir / filename
-        
-        # Security: prevent directory traversal
-        try:
-            file_path.resolve().relative_to(downloads_dir.resolve())
-        except ValueError:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Invalid file path"
-            )
-        
-        # Check if file exists
-        if not file_path.exists() or not file_path.is_file():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"File not found: {filename}"
-            )
-        
-        # Return file with appropriate content type
-        return FileResponse(
-            path=str(file_path),
-            filename=filename,
-            media_type="application/vnd.android.package-archive"
+    sha256 = sha256.lower()
+    if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid checksum"
         )
+    info = stat_file(DOWNLOADS_DIR, blob_relative_path(sha256))
+    response = file_response(
+        request,
+        info._replace(etag=f'"{sha256}"'),
+        filename=f"{sha256}.apk",
+        headers={"cache-control": IMMUTABLE_CACHE_CONTROL}
+    )
+    if counts_as_download(request.method, response):
+        record_download(find_app(sha256=sha256), request.headers.get("authorization"))
+    return response
+
+@router.api_route("/downloads/{filename:path}", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request):
+    """
+    Serve APK files from the downloads directory (APPS_DOWNLOADS_DIR,
+    default <project>/public/downloads), where the Admin Panel stores uploads.
+    
+    Supports `Range`/`If-Range` for resumable downloads and
+    `If-None-Match`/`If-Modified-Since` for revalidation.
+    """
+    try:
+        info = stat_file(DOWNLOADS_DIR, filename)
+        response = file_response(request, info, filename=Path(filename).name)
+        if counts_as_download(request.method, response):
+            record_download(find_app(filename=Path(filename).name), request.headers.get("authorization"))
+        return response
     except HTTPException:
         raise
     except Exception as e:
@@ -186,4 +217,3 @@ async def download_file(filename: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error serving file: {str(e)}"
         )
-
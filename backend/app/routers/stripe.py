@@ -1,14 +1,19 @@
 """
 Stripe Payment Integration (Test Mode)
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Header
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from typing import Optional
 from app.database import get_db
 from app.auth import get_current_active_user
 from app.models import User
+from app.stripe_events import store_event, LIFETIME_PRODUCT, LIFETIME_PRICE, LIFETIME_CURRENCY
+from app import stripe_client
+from app.stripe_client import idempotency_key
 from dotenv import load_dotenv
 import stripe
+import json
 import os
 
 # Load environment variables
@@ -20,23 +25,30 @@ router = APIRouter(prefix="/api/stripe", tags=["stripe"])
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "sk_test_51QEXAMPLE")
 
 class PaymentIntentRequest(BaseModel):
-    amount: int  # Amount in cents
+    amount: Optional[int] = None  # Ignored: the price is set server-side (LIFETIME_PRICE)
     description: str
 
 @router.post("/create-payment-intent")
 async def create_payment_intent(
     request: PaymentIntentRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key_header: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Create a Stripe payment intent (test mode)"""
+    # Retries of the same request (same key) get the original intent back
+    key = idempotency_key(
+        idempotency_key_header, f"payment_intent:{current_user.id}", LIFETIME_PRICE, request.description
+    )
     try:
-        # Create payment intent
-        intent = stripe.PaymentIntent.create(
-            amount=request.amount,
-            currency="usd",
+        # Create payment intent (off the event loop)
+        intent = await stripe_client.create_payment_intent(
+            key,
+            amount=LIFETIME_PRICE,
+            currency=LIFETIME_CURRENCY,
             description=request.description,
             metadata={
+                "product": LIFETIME_PRODUCT,
                 "user_id": str(current_user.id),
                 "user_email": current_user.email,
             },
@@ -52,6 +64,8 @@ async def create_payment_intent(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Stripe error: {str(e)}"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -59,14 +73,15 @@ async def create_payment_intent(
         )
 
 @router.post("/webhook")
-async def stripe_webhook(request: Request):
-    """Handle Stripe webhook events (for subscription management)"""
+async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+    """Verify and store a Stripe webhook event; it is applied in the background"""
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET", "")
     
     try:
-        event = stripe.Webhook.construct_event(
+        # Only verifies the signature; the raw payload is what gets stored
+        stripe.Webhook.construct_event(
             payload, sig_header, webhook_secret
         )
     except ValueError:
@@ -74,12 +89,7 @@ async def stripe_webhook(request: Request):
     except stripe.error.SignatureVerificationError:
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    # Handle the event
-    if event["type"] == "payment_intent.succeeded":
-        payment_intent = event["data"]["object"]
-        # Update user subscription here
-        # For now, just log it
-        print(f"Payment succeeded: {payment_intent['id']}")
+    # Acknowledge as soon as the event is durable; duplicates are ignored
+    store_event(db, json.loads(payload))
     
     return {"status": "success"}
-
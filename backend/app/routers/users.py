@@ -3,7 +3,12 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
 from app.schemas import UserResponse, UserUpdate, PasswordChange
-from app.auth import get_current_active_user, verify_password, get_password_hash, truncate_password
+from app.auth import get_current_active_user, verify_password, get_password_hash, truncate_password, run_password_hash
+from app.licensing import license_state, cached_subscription_state, issue_license_token
+from pydantic import BaseModel
+from sqlalchemy import or_
+from typing import List, Optional
+import uuid
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
@@ -66,21 +71,21 @@ async def change_password(
     new_password = truncate_password(password_data.new_password)
     
     # Verify current password
-    if not verify_password(current_password, current_user.password_hash):
+    if not await run_password_hash(verify_password, current_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Current password is incorrect"
         )
     
     # Check if new password is different
-    if verify_password(new_password, current_user.password_hash):
+    if await run_password_hash(verify_password, new_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New password must be different from current password"
         )
     
     # Update password
-    current_user.password_hash = get_password_hash(new_password)
+    current_user.password_hash = await run_password_hash(get_password_hash, new_password)
     db.commit()
     
     return {"message": "Password changed successfully"}
@@ -96,39 +101,34 @@ async def mark_downloaded(
     db.refresh(current_user)
     return {"message": "Download status updated", "has_downloaded": True}
 
-@router.get("/{user_id}/license/status")
-async def get_license_status(
-    user_id: str,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Get user's license status (for desktop app integration)"""
-    import uuid
-    from datetime import datetime
-    
-    # Convert user_id string to UUID
+def get_license_user(user_id: str, current_user: User, db: Session) -> Optional[User]:
+    """User whose license is being read; raises 400/403, returns None if not found"""
     try:
         user_uuid = uuid.UUID(user_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
     
     # Verify user can access this (own profile or admin)
-    if str(current_user.id) != str(user_id) and not current_user.is_admin:
+    if current_user.id != user_uuid and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    user = db.query(User).filter(User.id == user_uuid).first()
+    # The desktop app asks about its own user: that row is already loaded
+    if current_user.id == user_uuid:
+        return current_user
+    return db.query(User).filter(User.id == user_uuid).first()
+
+@router.get("/{user_id}/license/status")
+async def get_license_status(
+    user_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get user's license status (for desktop app integration)"""
+    user = get_license_user(user_id, current_user, db)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Determine if license is valid
-    is_valid = True
-    if user.subscription_status == "expired":
-        is_valid = False
-    elif user.subscription_status == "cancelled":
-        is_valid = False
-    elif user.subscription_end:
-        if datetime.now(user.subscription_end.tzinfo) > user.subscription_end:
-            is_valid = False
+    is_valid, _ = license_state(user)
     
     return {
         "success": True,
@@ -146,37 +146,16 @@ async def check_license(
     db: Session = Depends(get_db)
 ):
     """Check if user's license is valid (for desktop app integration)"""
-    import uuid
-    from datetime import datetime
-    
-    # Convert user_id string to UUID
     try:
-        user_uuid = uuid.UUID(user_id)
-    except ValueError:
+        user = get_license_user(user_id, current_user, db)
+    except HTTPException as e:
+        if e.status_code != 400:
+            raise
         return {"success": False, "valid": False, "reason": "Invalid user ID format"}
-    
-    # Verify user can access this
-    if str(current_user.id) != str(user_id) and not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    user = db.query(User).filter(User.id == user_uuid).first()
     if not user:
         return {"success": False, "valid": False, "reason": "User not found"}
     
-    # Check license validity
-    is_valid = True
-    reason = ""
-    
-    if user.subscription_status == "expired":
-        is_valid = False
-        reason = "Subscription expired"
-    elif user.subscription_status == "cancelled":
-        is_valid = False
-        reason = "Subscription cancelled"
-    elif user.subscription_end:
-        if datetime.now(user.subscription_end.tzinfo) > user.subscription_end:
-            is_valid = False
-            reason = "Subscription expired"
+    is_valid, reason = license_state(user)
     
     return {
         "success": True,
@@ -184,6 +163,102 @@ async def check_license(
         "reason": reason
     }
 
+@router.post("/{user_id}/license/token")
+async def issue_license(
+    user_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Issue a signed license token the desktop app can verify offline"""
+    user = get_license_user(user_id, current_user, db)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return issue_license_token(user)
+
+# Upper bound on identifiers per bulk verification request
+MAX_LICENSE_BATCH = 1000
+
+class LicenseVerifyRequest(BaseModel):
+    user_ids: List[str] = []
+    license_keys: List[str] = []
+
+@router.post("/license/verify")
+async def verify_licenses(
+    request: LicenseVerifyRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Check many licenses at once (for enterprise fleets).
+
+    Admins may look up any user. Other callers may look up license keys
+    (possession of the key is the credential) and their own user ID.
+    """
+    if len(request.user_ids) + len(request.license_keys) > MAX_LICENSE_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_LICENSE_BATCH} user IDs and license keys per request"
+        )
+    
+    results = []
+    user_uuids = {}
+    for user_id in dict.fromkeys(request.user_ids):
+        try:
+            user_uuid = uuid.UUID(user_id)
+        except ValueError:
+            results.append({"user_id": user_id, "valid": False, "reason": "Invalid user ID format"})
+            continue
+        if current_user.id != user_uuid and not current_user.is_admin:
+            results.append({"user_id": user_id, "valid": False, "reason": "Access denied"})
+            continue
+        user_uuids[user_id] = user_uuid
+    license_keys = list(dict.fromkeys(k for k in request.license_keys if k))
+    
+    # One query for every identifier, reading only the license columns
+    rows = []
+    if user_uuids or license_keys:
+        conditions = []
+        if user_uuids:
+            conditions.append(User.id.in_(list(user_uuids.values())))
+        if license_keys:
+            conditions.append(User.license_key.in_(license_keys))
+        rows = db.query(
+            User.id,
+            User.license_key,
+            User.subscription_tier,
+            User.subscription_status,
+            User.subscription_end,
+            User.license_valid,
+            User.edition
+        ).filter(or_(*conditions)).all()
+    by_id = {row.id: row for row in rows}
+    by_key = {row.license_key: row for row in rows if row.license_key}
+    
+    def describe(row) -> dict:
+        if row.license_valid is False:
+            is_valid, reason = license_state(row)
+        else:
+            is_valid, reason = cached_subscription_state(row.subscription_status, row.subscription_end)
+        return {
+            "user_id": str(row.id),
+            "license_key": row.license_key,
+            "valid": is_valid,
+            "reason": reason,
+            "tier": row.subscription_tier or "beta",
+            "status": "valid" if is_valid else "expired",
+            "edition": row.edition,
+            "subscription_end": row.subscription_end.isoformat() if row.subscription_end else None
+        }
+    
+    for user_id, user_uuid in user_uuids.items():
+        row = by_id.get(user_uuid)
+        results.append(describe(row) if row else {"user_id": user_id, "valid": False, "reason": "User not found"})
+    for license_key in license_keys:
+        row = by_key.get(license_key)
+        results.append(describe(row) if row else {"license_key": license_key, "valid": False, "reason": "License not found"})
+    
+    return {"success": True, "results": results}
+
 @router.put("/{user_id}/edition")
 async def update_edition(
     user_id: str,
@@ -0,0 +1,182 @@
+"""
+In-memory, typed view of the app_settings table
+
+All settings are loaded once and served from memory. Every write also
+replaces the `settings_version` row; workers reload when that version changes.
+PostgreSQL workers hear about changes immediately through LISTEN/NOTIFY; every
+worker (and SQLite deployments) additionally polls the version row every
+SETTINGS_POLL_INTERVAL seconds, which bounds how stale a worker can be.
+"""
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Any, Callable, NamedTuple, Optional
+from app.database import SessionLocal, engine, is_sqlite, dialect_insert
+from app.models import AppSettings
+import asyncio
+import os
+import select
+import threading
+import uuid
+
+SETTINGS_POLL_INTERVAL = float(os.getenv("SETTINGS_POLL_INTERVAL", "5"))
+NOTIFY_CHANNEL = "app_settings_changed"
+VERSION_KEY = "settings_version"
+
+class SettingSpec(NamedTuple):
+    default: Any
+    description: str
+    parse: Callable[[str], Any] = str
+
+SETTINGS = {
+    "beta_access_password": SettingSpec("androama2025beta", "Beta access password for ANDROAMA"),
+}
+
+class SettingsService:
+    """Process-wide settings cache"""
+
+    def __init__(self):
+        self._values = {}
+        self._version = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._listener: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.reloads = 0
+
+    # -- reads (memory only) --
+
+    def get(self, key: str) -> Any:
+        spec = SETTINGS[key]
+        raw = self._values.get(key)
+        if raw is None:
+            return spec.default
+        try:
+            return spec.parse(raw)
+        except (TypeError, ValueError):
+            return spec.default
+
+    @property
+    def beta_access_password(self) -> str:
+        return self.get("beta_access_password")
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    # -- loading --
+
+    def load(self):
+        """Reload every setting from the database"""
+        db = SessionLocal()
+        try:
+            rows = db.query(AppSettings.key, AppSettings.value).all()
+        finally:
+            db.close()
+        values = dict(rows)
+        self._version = values.pop(VERSION_KEY, None)
+        self._values = values
+        self.reloads += 1
+
+    def refresh_if_changed(self) -> bool:
+        """Cheap check of the version row; reload everything if it moved"""
+        db = SessionLocal()
+        try:
+            version = db.query(AppSettings.value).filter(AppSettings.key == VERSION_KEY).scalar()
+        finally:
+            db.close()
+        if version != self._version:
+            self.load()
+            return True
+        return False
+
+    # -- writes --
+
+    def set(self, db: Session, key: str, value: Any, updated_by=None):
+        """Persist a setting, bump the version and notify other workers"""
+        spec = SETTINGS[key]
+        version = uuid.uuid4().hex
+        now = datetime.utcnow()
+        rows = [
+            {"id": uuid.uuid4(), "key": key, "value": str(value), "description": spec.description,
+             "updated_by": updated_by, "updated_at": now},
+            {"id": uuid.uuid4(), "key": VERSION_KEY, "value": version, "description": "Settings cache version",
+             "updated_by": updated_by, "updated_at": now},
+        ]
+        for row in rows:
+            stmt = dialect_insert(AppSettings.__table__).values(**row)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["key"],
+                set_={"value": stmt.excluded.value, "updated_by": stmt.excluded.updated_by,
+                      "updated_at": stmt.excluded.updated_at}
+            ))
+        if not is_sqlite:
+            db.execute(text("SELECT pg_notify(:channel, :version)"), {"channel": NOTIFY_CHANNEL, "version": version})
+        db.commit()
+
+        # This worker sees its own write immediately
+        self._values = {**self._values, key: str(value)}
+        self._version = version
+
+    # -- background refresh --
+
+    def _listen(self):
+        """LISTEN for change notifications on a dedicated connection (PostgreSQL only)"""
+        while not self._stopping.is_set():
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                raw.detach()
+                conn = raw.dbapi_connection
+                conn.set_isolation_level(0)  # autocommit, required for LISTEN
+                conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        latest = conn.notifies[-1].payload
+                        conn.notifies.clear()
+                        if latest != self._version:
+                            self.load()
+            except Exception as e:
+                print(f"⚠️ Warning: settings listener error, retrying: {e}")
+                self._stopping.wait(SETTINGS_POLL_INTERVAL)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(SETTINGS_POLL_INTERVAL)
+            try:
+                await run_in_threadpool(self.refresh_if_changed)
+            except Exception as e:
+                print(f"⚠️ Warning: settings refresh failed: {e}")
+
+    async def start(self):
+        """Load settings and start change tracking (call on application startup)"""
+        try:
+            await run_in_threadpool(self.load)
+        except Exception as e:
+            print(f"⚠️ Warning: could not load settings, using defaults: {e}")
+        self._stopping.clear()
+        if not is_sqlite:
+            self._listener = threading.Thread(target=self._listen, name="settings-listener", daemon=True)
+            self._listener.start()
+        self._poll_task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+
+settings = SettingsService()
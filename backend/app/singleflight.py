@@ -0,0 +1,70 @@
+"""
+Request coalescing (single-flight)
+
+Concurrent callers asking a SingleFlight group for the same key share one
+in-flight computation: the first caller starts it, later ones await the same
+result (or exception). Nothing is cached once it completes; the next call
+computes again.
+
+The computation runs as its own task, so a caller that disconnects never
+cancels it for the others, and it must not use a request-scoped DB session
+(use SessionLocal in a threadpool function instead). Waiters give up after
+the group's timeout with a 504; the key is then released so the next
+request starts a fresh computation. Shared results must be treated as
+read-only.
+"""
+from fastapi import HTTPException, status
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+import os
+
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", "15"))
+
+# name -> group, for /metrics
+groups: Dict[str, "SingleFlight"] = {}
+
+class SingleFlight:
+    def __init__(self, name: str, timeout: float = SINGLEFLIGHT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"calls": 0, "executions": 0, "shared": 0, "errors": 0, "timeouts": 0}
+        groups[name] = self
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `fn()`, shared with every concurrent call using the same key"""
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["executions"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.stats["shared"] += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Request timed out, please retry"
+            )
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.stats["errors"] += 1
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "in_flight": self.in_flight}
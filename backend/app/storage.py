@@ -0,0 +1,123 @@
+"""
+Content-addressed APK storage
+
+Uploaded APKs are stored once under `blobs/<sha256[:2]>/<sha256>.apk` in the
+downloads directory. Human-friendly names (`{app_id}-v{version}.apk`) are hard
+links (or symlinks where hard links are not possible) pointing at the blob, so
+identical uploads are deduplicated and blob URLs never change content.
+"""
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from pathlib import Path
+from typing import NamedTuple
+from app.downloads import forget_file, get_public_downloads_dir
+import hashlib
+import os
+import shutil
+import tempfile
+
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+class BlobInfo(NamedTuple):
+    sha256: str
+    size: int
+    path: Path
+    deduplicated: bool
+
+def get_downloads_dir() -> Path:
+    """Get path to downloads directory (the same one public.download_file serves)"""
+    downloads_path = os.getenv("APPS_DOWNLOADS_DIR")
+    if downloads_path:
+        return Path(downloads_path)
+    return get_public_downloads_dir()
+
+def get_blobs_dir() -> Path:
+    """Get path to the content-addressed blob directory"""
+    return get_downloads_dir() / "blobs"
+
+def blob_path(sha256: str) -> Path:
+    """Get path of the blob with the given SHA-256 (sharded by hash prefix)"""
+    return get_blobs_dir() / sha256[:2] / f"{sha256}.apk"
+
+def blob_relative_path(sha256: str) -> str:
+    """Blob path relative to the downloads directory (used in download URLs)"""
+    return f"blobs/{sha256[:2]}/{sha256}.apk"
+
+def friendly_filename(app_id: str, version: str) -> str:
+    """Human-readable APK filename for an app version"""
+    return f"{app_id}-v{version}.apk"
+
+async def store_upload(file: UploadFile, max_size: int = MAX_UPLOAD_SIZE) -> BlobInfo:
+    """Stream an upload into the blob store, hashing as we go.
+
+    The upload is never held in memory as a whole. If a blob with the same
+    hash already exists the new copy is discarded.
+    """
+    blobs_dir = get_blobs_dir()
+    blobs_dir.mkdir(parents=True, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    # Temp file lives next to the blobs so the final rename is atomic
+    fd, tmp_name = tempfile.mkstemp(dir=blobs_dir, suffix=".upload")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"File size exceeds {max_size // (1024 * 1024)}MB limit"
+                    )
+                digest.update(chunk)
+                await run_in_threadpool(tmp.write, chunk)
+            await run_in_threadpool(os.fsync, tmp.fileno())
+
+        sha256 = digest.hexdigest()
+        target = blob_path(sha256)
+        if target.exists():
+            os.unlink(tmp_name)
+            return BlobInfo(sha256, size, target, True)
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(tmp_name, 0o444)
+        os.replace(tmp_name, target)
+        return BlobInfo(sha256, size, target, False)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+def link_friendly_name(sha256: str, filename: str) -> Path:
+    """Point `downloads/<filename>` at a blob: hard link, else symlink, else copy"""
+    target = blob_path(sha256)
+    link = get_downloads_dir() / filename
+    if link.is_symlink() or link.exists():
+        link.unlink()
+    try:
+        os.link(target, link)
+    except OSError:
+        try:
+            link.symlink_to(os.path.relpath(target, link.parent))
+        except OSError:
+            shutil.copyfile(target, link)
+    forget_file(link)
+    return link
+
+def unlink_friendly_name(filename: str):
+    """Remove a friendly name (the blob itself is left alone)"""
+    link = get_downloads_dir() / filename
+    if link.is_symlink() or link.exists():
+        link.unlink()
+    forget_file(link)
+
+def remove_blob(sha256: str):
+    """Delete a blob that is no longer referenced by the catalog"""
+    target = blob_path(sha256)
+    if target.exists():
+        target.unlink()
+    forget_file(target)
@@ -0,0 +1,93 @@
+"""
+Non-blocking access to the Stripe API
+
+The stripe library is synchronous, so calls run in worker threads, at most
+STRIPE_MAX_CONCURRENCY at a time (callers wait up to STRIPE_QUEUE_TIMEOUT
+seconds for a slot, then get a 503). Network timeouts and the library's own
+safe retries are configured here, and every call's latency is recorded per
+operation.
+
+Creating calls carry an idempotency key so a retried request returns the
+original object instead of creating a duplicate. STRIPE_API_BASE points the
+library at a local stand-in such as stripe-mock
+(`docker run -p 12111:12111 stripe/stripe-mock`, STRIPE_API_BASE=http://localhost:12111).
+"""
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from typing import Callable, Dict, Optional
+from app.http_client import LatencyHistogram
+import asyncio
+import hashlib
+import os
+import stripe
+import time
+
+STRIPE_MAX_CONCURRENCY = int(os.getenv("STRIPE_MAX_CONCURRENCY", "10"))
+STRIPE_QUEUE_TIMEOUT = float(os.getenv("STRIPE_QUEUE_TIMEOUT", "5"))
+STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "20"))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
+# Derived idempotency keys dedupe identical requests within this window
+STRIPE_IDEMPOTENCY_WINDOW = int(os.getenv("STRIPE_IDEMPOTENCY_WINDOW", "600"))
+
+stripe.max_network_retries = STRIPE_MAX_RETRIES
+stripe.default_http_client = stripe.http_client.new_default_http_client(timeout=STRIPE_TIMEOUT)
+if STRIPE_API_BASE:
+    stripe.api_base = STRIPE_API_BASE
+
+_slots: Optional[asyncio.Semaphore] = None
+latency: Dict[str, LatencyHistogram] = {}
+stats = {"calls": 0, "errors": 0, "rejected": 0, "in_flight": 0}
+
+def idempotency_key(header: Optional[str], scope: str, *parts) -> str:
+    """Idempotency key for a Stripe call made on behalf of `scope` (e.g. one user).
+
+    A client-sent Idempotency-Key is namespaced by the scope so two users can
+    never collide on (and receive) each other's objects. Without one, the key
+    is derived from the request's parts plus the current
+    STRIPE_IDEMPOTENCY_WINDOW bucket: a double submit is deduped, the same
+    purchase made again later is not.
+    """
+    if header:
+        raw = f"{scope}|client|{header}"
+    else:
+        bucket = int(time.time() // STRIPE_IDEMPOTENCY_WINDOW)
+        raw = "|".join(str(part) for part in (scope,) + parts + (bucket,))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(STRIPE_MAX_CONCURRENCY)
+    return _slots
+
+async def call(operation: str, fn: Callable, *args, **kwargs):
+    """Run a blocking stripe-python call in a thread under the concurrency limit"""
+    slots = _get_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=STRIPE_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment service busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+    stats["calls"] += 1
+    stats["in_flight"] += 1
+    started = time.perf_counter()
+    try:
+        return await run_in_threadpool(fn, *args, **kwargs)
+    except stripe.error.StripeError:
+        stats["errors"] += 1
+        raise
+    finally:
+        stats["in_flight"] -= 1
+        slots.release()
+        latency.setdefault(operation, LatencyHistogram()).observe(time.perf_counter() - started)
+
+async def create_payment_intent(key: str, **params):
+    return await call("payment_intent.create", stripe.PaymentIntent.create, idempotency_key=key, **params)
+
+def snapshot() -> dict:
+    return {**stats, "latency": {name: h.snapshot() for name, h in latency.items()}}
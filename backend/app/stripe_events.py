@@ -0,0 +1,307 @@
+"""
+Durable Stripe webhook processing
+
+The webhook only verifies the signature and inserts the event into
+stripe_events (keyed by the Stripe event ID, so redeliveries are no-ops)
+before answering Stripe. A dispatcher then hands due events to
+STRIPE_EVENT_WORKERS workers, partitioned by a hash of the event's customer
+so each customer's events are applied by one worker, strictly in the order
+Stripe created them: only the oldest unfinished event of a customer is ever
+dispatched, and a failing event holds back the ones after it until it
+succeeds or exhausts its retries (exponential backoff with jitter).
+
+Claims are leases (`locked_until`), so several app processes can share the
+table and an event held by a crashed worker is picked up again.
+"""
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, exists, or_, update
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from app.database import SessionLocal, dialect_insert
+from app.models import StripeEvent, User
+import asyncio
+import hashlib
+import json
+import os
+import random
+import uuid
+
+STRIPE_EVENT_WORKERS = int(os.getenv("STRIPE_EVENT_WORKERS", "4"))
+STRIPE_EVENT_BATCH = int(os.getenv("STRIPE_EVENT_BATCH", "200"))
+STRIPE_EVENT_POLL_INTERVAL = float(os.getenv("STRIPE_EVENT_POLL_INTERVAL", "5"))
+STRIPE_EVENT_LEASE = float(os.getenv("STRIPE_EVENT_LEASE", "60"))
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", "8"))
+STRIPE_EVENT_BACKOFF = float(os.getenv("STRIPE_EVENT_BACKOFF", "2"))
+STRIPE_EVENT_BACKOFF_MAX = float(os.getenv("STRIPE_EVENT_BACKOFF_MAX", "3600"))
+
+# The lifetime tier: price is set here, never by the client
+LIFETIME_PRODUCT = "lifetime"
+LIFETIME_PRICE = int(os.getenv("STRIPE_LIFETIME_PRICE", "499"))  # in cents
+LIFETIME_CURRENCY = os.getenv("STRIPE_LIFETIME_CURRENCY", "usd")
+
+# Stripe subscription status -> users.subscription_status
+SUBSCRIPTION_STATUSES = {
+    "active": "active",
+    "trialing": "active",
+    "past_due": "active",
+    "canceled": "cancelled",
+    "unpaid": "expired",
+    "incomplete_expired": "expired",
+}
+
+_wakeup: Optional[asyncio.Event] = None
+_tasks: List[asyncio.Task] = []
+_queues: List[asyncio.Queue] = []
+_dispatched = set()
+stats = {"received": 0, "duplicates": 0, "processed": 0, "retried": 0, "failed": 0}
+
+class SkippedEvent(Exception):
+    """The event must not be applied; retrying won't help"""
+
+class UnknownUser(SkippedEvent):
+    """The event refers to a user we don't have"""
+
+def ordering_key(event: dict) -> str:
+    """Events with the same key are applied in order: the Stripe customer, else our user"""
+    obj = event.get("data", {}).get("object", {}) or {}
+    customer = obj.get("customer")
+    if isinstance(customer, dict):
+        customer = customer.get("id")
+    if customer:
+        return customer
+    user_id = (obj.get("metadata") or {}).get("user_id")
+    if user_id:
+        return f"user:{user_id}"
+    return f"event:{event['id']}"
+
+def store_event(db, event: dict) -> bool:
+    """Persist a verified webhook event. Returns False if it was already stored."""
+    stmt = dialect_insert(StripeEvent.__table__).values(
+        id=event["id"],
+        type=event["type"],
+        ordering_key=ordering_key(event),
+        payload=json.dumps(event),
+        status="pending",
+        attempts=0,
+        stripe_created=datetime.fromtimestamp(event.get("created") or 0, timezone.utc),
+    ).on_conflict_do_nothing(index_elements=["id"])
+    inserted = db.execute(stmt).rowcount == 1
+    db.commit()
+    if inserted:
+        stats["received"] += 1
+        notify()
+    else:
+        stats["duplicates"] += 1
+    return inserted
+
+def notify():
+    """Wake the dispatcher (new event stored or a customer's event finished)"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+# -- handlers: run in a worker thread with their own session --
+
+def _find_user(db, obj: dict) -> User:
+    """The user in the metadata we set when creating the object.
+
+    Never matched by receipt/customer email: the payer chooses those.
+    """
+    user_id = (obj.get("metadata") or {}).get("user_id")
+    user = None
+    if user_id:
+        try:
+            user = db.query(User).filter(User.id == uuid.UUID(user_id)).first()
+        except ValueError:
+            pass
+    if user is None:
+        raise UnknownUser(f"No user for Stripe object {obj.get('id')}")
+    return user
+
+def _from_timestamp(value) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, timezone.utc) if value else None
+
+def handle_payment_succeeded(db, obj: dict):
+    """A one-off payment of the lifetime price buys the lifetime tier"""
+    metadata = obj.get("metadata") or {}
+    if metadata.get("product") != LIFETIME_PRODUCT:
+        raise SkippedEvent(f"Payment {obj.get('id')} is not for the lifetime tier")
+    if obj.get("currency") != LIFETIME_CURRENCY or (obj.get("amount_received") or 0) < LIFETIME_PRICE:
+        raise SkippedEvent(
+            f"Payment {obj.get('id')} of {obj.get('amount_received')} {obj.get('currency')} "
+            f"does not cover the lifetime price"
+        )
+    user = _find_user(db, obj)
+    user.subscription_tier = "lifetime"
+    user.subscription_status = "lifetime"
+    user.subscription_end = None
+
+def handle_subscription_changed(db, obj: dict):
+    user = _find_user(db, obj)
+    if user.subscription_status == "lifetime":
+        return
+    status = SUBSCRIPTION_STATUSES.get(obj.get("status"))
+    if status is None:
+        # incomplete: nothing has been paid yet
+        return
+    user.subscription_status = status
+    user.subscription_end = _from_timestamp(obj.get("current_period_end"))
+
+def handle_subscription_deleted(db, obj: dict):
+    user = _find_user(db, obj)
+    if user.subscription_status == "lifetime":
+        return
+    user.subscription_status = "cancelled"
+    user.subscription_end = _from_timestamp(obj.get("ended_at") or obj.get("current_period_end"))
+
+HANDLERS: Dict[str, Callable] = {
+    "payment_intent.succeeded": handle_payment_succeeded,
+    "customer.subscription.created": handle_subscription_changed,
+    "customer.subscription.updated": handle_subscription_changed,
+    "customer.subscription.deleted": handle_subscription_deleted,
+}
+
+# -- processing --
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(STRIPE_EVENT_BACKOFF * 2 ** (attempts - 1), STRIPE_EVENT_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+def process_event(event_id: str):
+    """Apply one claimed event and record the outcome (runs in a worker thread)"""
+    db = SessionLocal()
+    try:
+        row = db.query(StripeEvent).filter(StripeEvent.id == event_id).first()
+        if row is None or row.status != "processing":
+            return
+        event = json.loads(row.payload)
+        handler = HANDLERS.get(row.type)
+        now = datetime.now(timezone.utc)
+        try:
+            if handler is not None:
+                handler(db, event["data"]["object"])
+            row.status = "done"
+            row.processed_at = now
+            row.last_error = None
+            stats["processed"] += 1
+        except SkippedEvent as e:
+            db.rollback()
+            row.status = "done"
+            row.processed_at = now
+            row.last_error = str(e)
+            print(f"⚠️ Warning: Stripe event {event_id} skipped: {e}")
+        except Exception as e:
+            db.rollback()
+            row.attempts += 1
+            row.last_error = str(e)
+            if row.attempts >= STRIPE_EVENT_MAX_ATTEMPTS:
+                row.status = "failed"
+                stats["failed"] += 1
+                print(f"⚠️ Warning: Stripe event {event_id} failed permanently: {e}")
+            else:
+                row.status = "pending"
+                row.next_attempt_at = now + _backoff(row.attempts)
+                stats["retried"] += 1
+        row.locked_until = None
+        db.commit()
+    finally:
+        db.close()
+
+def claim_due_events(limit: int = STRIPE_EVENT_BATCH) -> List[tuple]:
+    """Lease the oldest unfinished event of each customer, if it is due"""
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        # Head of each customer: no unfinished event of the same customer came before it
+        earlier = aliased(StripeEvent)
+        unfinished = ("pending", "processing")
+        is_head = ~exists().where(and_(
+            earlier.ordering_key == StripeEvent.ordering_key,
+            earlier.status.in_(unfinished),
+            or_(
+                earlier.stripe_created < StripeEvent.stripe_created,
+                and_(earlier.stripe_created == StripeEvent.stripe_created,
+                     or_(earlier.received_at < StripeEvent.received_at,
+                         and_(earlier.received_at == StripeEvent.received_at, earlier.id < StripeEvent.id)))
+            )
+        ))
+        # Heads waiting out a backoff or leased elsewhere hold back their own customer only
+        is_due = or_(
+            and_(StripeEvent.status == "pending",
+                 or_(StripeEvent.next_attempt_at.is_(None), StripeEvent.next_attempt_at <= now)),
+            and_(StripeEvent.status == "processing",
+                 or_(StripeEvent.locked_until.is_(None), StripeEvent.locked_until <= now)),
+        )
+        rows = db.query(
+            StripeEvent.id, StripeEvent.ordering_key, StripeEvent.status
+        ).filter(
+            StripeEvent.status.in_(unfinished), is_head, is_due
+        ).order_by(StripeEvent.stripe_created, StripeEvent.received_at).limit(limit).all()
+
+        claimed = []
+        for row in rows:
+            if row.id in _dispatched:
+                continue
+            result = db.execute(
+                update(StripeEvent.__table__)
+                .where(and_(
+                    StripeEvent.__table__.c.id == row.id,
+                    StripeEvent.__table__.c.status == row.status,
+                    or_(StripeEvent.__table__.c.locked_until.is_(None),
+                        StripeEvent.__table__.c.locked_until <= now)
+                ))
+                .values(status="processing", locked_until=now + timedelta(seconds=STRIPE_EVENT_LEASE))
+            )
+            if result.rowcount == 1:
+                claimed.append((row.id, row.ordering_key))
+        db.commit()
+        return claimed
+    finally:
+        db.close()
+
+def _partition(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big") % len(_queues)
+
+async def _worker(queue: asyncio.Queue):
+    while True:
+        event_id = await queue.get()
+        try:
+            await run_in_threadpool(process_event, event_id)
+        except Exception as e:
+            print(f"⚠️ Warning: Stripe event {event_id} processing error: {e}")
+        finally:
+            _dispatched.discard(event_id)
+            notify()
+
+async def _dispatch_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=STRIPE_EVENT_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        try:
+            claimed = await run_in_threadpool(claim_due_events)
+        except Exception as e:
+            print(f"⚠️ Warning: Stripe event dispatch failed: {e}")
+            continue
+        for event_id, key in claimed:
+            _dispatched.add(event_id)
+            _queues[_partition(key)].put_nowait(event_id)
+
+async def start():
+    """Start the dispatcher and workers (call on application startup)"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    _wakeup.set()  # pick up anything left from before a restart
+    _queues[:] = [asyncio.Queue() for _ in range(max(1, STRIPE_EVENT_WORKERS))]
+    _tasks[:] = [asyncio.create_task(_worker(queue)) for queue in _queues]
+    _tasks.append(asyncio.create_task(_dispatch_loop()))
+
+async def stop():
+    """Stop processing; leased events are retried after their lease runs out"""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    _dispatched.clear()
@@ -0,0 +1,166 @@
+"""
+Beta waitlist writes and the cached public signup counter
+
+With WAITLIST_BATCHING=1, signups are not committed one request at a time:
+they are queued and written by a single background task as multi-row upserts
+(every WAITLIST_BATCH_MS milliseconds or WAITLIST_BATCH_SIZE rows, whichever
+comes first). Each request still gets its own result through a future.
+"""
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, dialect_insert
+from app.models import BetaWaitlist
+from typing import List, Optional, Set
+import asyncio
+import os
+import time
+import uuid
+
+# The landing-page counter is recounted at most this often per worker
+WAITLIST_COUNT_TTL = float(os.getenv("WAITLIST_COUNT_TTL", "30"))
+
+WAITLIST_BATCHING = os.getenv("WAITLIST_BATCHING", "0") == "1"
+WAITLIST_BATCH_SIZE = int(os.getenv("WAITLIST_BATCH_SIZE", "500"))
+WAITLIST_BATCH_MS = float(os.getenv("WAITLIST_BATCH_MS", "20"))
+
+_count = {"value": None, "expires": 0.0}
+_count_lock = asyncio.Lock()
+
+def join_waitlist(db: Session, email: str) -> bool:
+    """Add an email in a single idempotent statement. Returns True if it was new."""
+    stmt = dialect_insert(BetaWaitlist.__table__).values(
+        id=uuid.uuid4(),
+        email=email,
+        notified=False
+    ).on_conflict_do_nothing(index_elements=["email"])
+    result = db.execute(stmt)
+    db.commit()
+    inserted = result.rowcount == 1
+    if inserted:
+        note_signups(1)
+    return inserted
+
+def note_signups(n: int):
+    """Keep the cached counter in step with signups made by this worker"""
+    if _count["value"] is not None:
+        _count["value"] += n
+
+def _count_rows() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.count(BetaWaitlist.id)).scalar() or 0
+    finally:
+        db.close()
+
+async def get_waitlist_count() -> int:
+    """Waitlist size, recounted at most every WAITLIST_COUNT_TTL seconds"""
+    if _count["value"] is not None and _count["expires"] > time.monotonic():
+        return _count["value"]
+    async with _count_lock:
+        # Another request may have refreshed it while we waited
+        if _count["value"] is None or _count["expires"] <= time.monotonic():
+            _count["value"] = await run_in_threadpool(_count_rows)
+            _count["expires"] = time.monotonic() + WAITLIST_COUNT_TTL
+    return _count["value"]
+
+def insert_batch(emails: List[str]) -> Set[str]:
+    """Multi-row upsert of unique emails. Returns the ones that were new."""
+    table = BetaWaitlist.__table__
+    stmt = dialect_insert(table).values([
+        {"id": uuid.uuid4(), "email": email, "notified": False} for email in emails
+    ]).on_conflict_do_nothing(index_elements=["email"]).returning(table.c.email)
+    db = SessionLocal()
+    try:
+        inserted = {row.email for row in db.execute(stmt)}
+        db.commit()
+        return inserted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# Queued by stop(): everything before it is written, then the task exits
+_STOP = object()
+
+class WaitlistBatcher:
+    """Collects signups from concurrent requests and commits them together"""
+
+    def __init__(self, max_rows: int = WAITLIST_BATCH_SIZE, max_delay_ms: float = WAITLIST_BATCH_MS):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"batches": 0, "rows": 0, "inserted": 0, "errors": 0, "largest_batch": 0}
+
+    async def submit(self, email: str) -> bool:
+        """Queue an email; resolves to True once committed if it was a new signup"""
+        if self._task is None or self._stopping:
+            raise RuntimeError("Waitlist batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((email, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """Next batch; ends early (possibly empty) at the stop marker"""
+        batch = []
+        item = await self._queue.get()
+        deadline = time.monotonic() + self.max_delay
+        while item is not _STOP:
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_rows or remaining <= 0:
+                return batch
+            try:
+                item = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return batch
+        return batch
+
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._collect()
+            if not batch:
+                continue
+            # The first request for an email in a batch "wins"; repeats get False
+            unique = list(dict.fromkeys(email for email, _ in batch))
+            try:
+                inserted = await run_in_threadpool(insert_batch, unique)
+            except Exception as e:
+                self.stats["errors"] += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["rows"] += len(batch)
+            self.stats["inserted"] += len(inserted)
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+            note_signups(len(inserted))
+            for email, future in batch:
+                if not future.done():
+                    future.set_result(email in inserted)
+                    inserted.discard(email)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting work after committing whatever is already queued.
+
+        The batch being written when stop() is called is finished too: the
+        task is left to exit on its own rather than cancelled mid-insert.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+waitlist_batcher = WaitlistBatcher()
@@ -0,0 +1,26 @@
+"""
+Benchmarks for the backend's hot paths.
+
+Run from the backend directory, e.g. `python -m benchmarks.waitlist`. Like
+the tests they use a throwaway SQLite database and downloads directory, set
+here before any `app` module is imported (app.database creates its engine at
+import time). Numbers are for comparing changes on one machine, not absolute.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="androama-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+os.environ.setdefault("APPS_DOWNLOADS_DIR", os.path.join(_tmp, "downloads"))
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+BENCH_DIR = _tmp
+
+def create_tables():
+    from app.database import Base, engine
+    import app.models  # noqa: F401  (registers the tables)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+def report(name: str, seconds: float, n: int, extra: str = ""):
+    print(f"{name:<50} {seconds * 1000:9.1f} ms  {n / seconds:10.0f}/s  {extra}")
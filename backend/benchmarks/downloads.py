@@ -0,0 +1,97 @@
+"""
+Concurrent partial downloads through the Range-aware download path.
+
+Each client fetches the whole APK as consecutive `Range: bytes=a-b` chunks,
+the way a resuming client on a flaky connection does, and the result is
+checked against the file's SHA-256.
+
+    python -m benchmarks.downloads [--size-mb 32] [--clients 16] [--chunk-mb 4] [--in-process]
+
+By default the app is served by uvicorn on a local port, so the numbers
+include the socket path (and sendfile when the server offers it).
+--in-process drives the ASGI app directly through httpx instead.
+"""
+from benchmarks import BENCH_DIR, report
+from pathlib import Path
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.routing import Route
+from app.downloads import file_response, stat_file
+import argparse
+import asyncio
+import hashlib
+import httpx
+import os
+import socket
+import threading
+import time
+
+ROOT = Path(BENCH_DIR) / "bench-downloads"
+
+async def serve(request: Request):
+    info = stat_file(ROOT, request.path_params["filename"])
+    return file_response(request, info, filename=info.path.rsplit("/", 1)[-1])
+
+app = Starlette(routes=[Route("/downloads/{filename}", serve, methods=["GET", "HEAD"])])
+
+async def fetch_in_chunks(client: httpx.AsyncClient, size: int, chunk: int) -> str:
+    digest = hashlib.sha256()
+    for start in range(0, size, chunk):
+        end = min(start + chunk, size) - 1
+        response = await client.get("/downloads/app.apk", headers={"Range": f"bytes={start}-{end}"})
+        assert response.status_code == 206, response.status_code
+        digest.update(response.content)
+    return digest.hexdigest()
+
+async def run_clients(base_url: str, transport, clients: int, size: int, chunk: int) -> list:
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=120) as client:
+        return await asyncio.gather(*(fetch_in_chunks(client, size, chunk) for _ in range(clients)))
+
+def start_server():
+    import uvicorn
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--chunk-mb", type=float, default=4)
+    parser.add_argument("--in-process", action="store_true")
+    args = parser.parse_args()
+
+    ROOT.mkdir(parents=True, exist_ok=True)
+    content = os.urandom(args.size_mb * 1024 * 1024)
+    (ROOT / "app.apk").write_bytes(content)
+    expected = hashlib.sha256(content).hexdigest()
+    chunk = int(args.chunk_mb * 1024 * 1024)
+
+    server = None
+    if args.in_process:
+        base_url, transport = "http://bench", httpx.ASGITransport(app=app)
+    else:
+        server, base_url = start_server()
+        transport = None
+    try:
+        started = time.perf_counter()
+        digests = asyncio.run(run_clients(base_url, transport, args.clients, len(content), chunk))
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    assert all(digest == expected for digest in digests), "corrupted download"
+    requests = args.clients * -(-len(content) // chunk)
+    megabytes = args.clients * len(content) / 1024 / 1024
+    report(f"{args.clients} clients x {args.size_mb} MB in {args.chunk_mb:g} MB ranges", elapsed, requests,
+           f"requests, {megabytes / elapsed:.0f} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Rendering a full community page (100 posts) with FastJSONResponse against
+Starlette's stdlib JSONResponse.
+
+    python -m benchmarks.json_responses [--posts 100] [--iterations 500]
+
+Two shapes are timed: the JSON-mode dicts a response_model produces (plain
+str/int values), and Python objects with UUID/datetime values, which the
+stdlib path has to run through jsonable_encoder first.
+"""
+from benchmarks import report
+from datetime import datetime, timedelta, timezone
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from app import responses
+from app.responses import FastJSONResponse
+from app.schemas import PostResponse
+import argparse
+import time
+import uuid
+
+def community_page(posts: int) -> list:
+    now = datetime.now(timezone.utc)
+    author = {"id": uuid.uuid4(), "username": "ada", "email": "ada@example.com", "edition": "monitor",
+              "is_admin": False, "avatar_url": None}
+    return [
+        {
+            "id": uuid.uuid4(),
+            "title": f"How do I pair device {i}?",
+            "content": "Steps I tried so far: " + "lorem ipsum dolor sit amet " * 20,
+            "category": "help",
+            "tags": ["pairing", "adb", "android-14"],
+            "is_pinned": i == 0,
+            "is_announcement": False,
+            "is_solved": i % 3 == 0,
+            "views": 1000 + i,
+            "likes_count": i,
+            "replies_count": i // 2,
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now - timedelta(minutes=i),
+            "author": author,
+            "user_liked": i % 2 == 0,
+        }
+        for i in range(posts)
+    ]
+
+def timed(render, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render()
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+    if responses.orjson is None:
+        print("orjson is not installed: FastJSONResponse is timing its stdlib fallback")
+
+    objects = community_page(args.posts)
+    json_mode = [PostResponse.model_validate(post).model_dump(mode="json") for post in objects]
+    n = args.iterations
+
+    report("response_model page, stdlib", timed(lambda: JSONResponse(json_mode), n), n)
+    report("response_model page, FastJSONResponse", timed(lambda: FastJSONResponse(json_mode), n), n)
+    report("UUID/datetime objects, jsonable_encoder + stdlib",
+           timed(lambda: JSONResponse(jsonable_encoder(objects)), n), n)
+    report("UUID/datetime objects, FastJSONResponse", timed(lambda: FastJSONResponse(objects), n), n)
+
+if __name__ == "__main__":
+    main()
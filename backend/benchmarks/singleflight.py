@@ -0,0 +1,67 @@
+"""
+A burst of identical community listings: coalesced through SingleFlight (as
+/api/community/posts does) against every request running its own query.
+
+    python -m benchmarks.singleflight [--posts 500] [--callers 50] [--bursts 20]
+
+Each burst fires `--callers` concurrent loads of the same first page; the
+query runs in the threadpool with its own session, as in the router.
+"""
+from benchmarks import create_tables, report
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal
+from app.models import CommunityPost, User
+from app.routers.community import load_posts
+from app.singleflight import SingleFlight
+from typing import Optional
+import argparse
+import asyncio
+import time
+
+PAGE = (None, None, "newest", 0, 20)
+
+def seed(posts: int):
+    db = SessionLocal()
+    try:
+        author = User(email="ada@example.com", username="ada")
+        db.add(author)
+        db.flush()
+        db.add_all(
+            CommunityPost(user_id=author.id, title=f"How do I pair device {i}?", category="help",
+                          content="Steps I tried so far: " + "lorem ipsum " * 40, tags='["pairing"]')
+            for i in range(posts)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+async def bursts(callers: int, count: int, flight: Optional[SingleFlight] = None):
+    for _ in range(count):
+        if flight is None:
+            await asyncio.gather(*(run_in_threadpool(load_posts, *PAGE) for _ in range(callers)))
+        else:
+            await asyncio.gather(*(flight.do(PAGE, lambda: run_in_threadpool(load_posts, *PAGE))
+                                   for _ in range(callers)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--bursts", type=int, default=20)
+    args = parser.parse_args()
+    create_tables()
+    seed(args.posts)
+    n = args.callers * args.bursts
+
+    flight = SingleFlight("bench_posts")
+    started = time.perf_counter()
+    asyncio.run(bursts(args.callers, args.bursts, flight))
+    report("coalesced (SingleFlight)", time.perf_counter() - started, n,
+           f"{flight.stats['executions']} queries")
+
+    started = time.perf_counter()
+    asyncio.run(bursts(args.callers, args.bursts))
+    report("uncoalesced (query per request)", time.perf_counter() - started, n, f"{n} queries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Waitlist signups: WaitlistBatcher against the per-request join_waitlist path.
+
+    python -m benchmarks.waitlist [--signups 2000] [--unique 1500]
+"""
+from benchmarks import create_tables, report
+from app.database import SessionLocal
+from app.waitlist import WaitlistBatcher, join_waitlist
+import argparse
+import asyncio
+import time
+
+async def batched(signups: int, unique: int) -> WaitlistBatcher:
+    batcher = WaitlistBatcher()
+    await batcher.start()
+    try:
+        await asyncio.gather(*(batcher.submit(f"user{i % unique}@example.com") for i in range(signups)))
+    finally:
+        await batcher.stop()
+    return batcher
+
+def per_request(signups: int, unique: int):
+    db = SessionLocal()
+    try:
+        for i in range(signups):
+            join_waitlist(db, f"user{i % unique}@example.com")
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--signups", type=int, default=2000)
+    parser.add_argument("--unique", type=int, default=1500)
+    args = parser.parse_args()
+
+    create_tables()
+    started = time.perf_counter()
+    batcher = asyncio.run(batched(args.signups, args.unique))
+    report("batched (concurrent submissions)", time.perf_counter() - started, args.signups,
+           f"{batcher.stats['batches']} transactions")
+
+    create_tables()
+    started = time.perf_counter()
+    per_request(args.signups, args.unique)
+    report("per request (sequential joins)", time.perf_counter() - started, args.signups,
+           f"{args.signups} transactions")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ Creates tables and seeds initial admin user and welcome post
 """
 from app.database import engine, Base, SessionLocal
 from app.models import User, CommunityPost, AppSettings
+from app.licensing import sweep_expired
+from sqlalchemy import inspect, text
 from app.auth import get_password_hash
 import os
 import json
@@ -17,6 +19,39 @@ def init_db():
     Base.metadata.create_all(bind=engine)
     print("[OK] Database tables created")
 
+def migrate_license_state():
+    """Add users.license_valid and the subscription_end index to existing databases"""
+    columns = {column["name"] for column in inspect(engine).get_columns("users")}
+    with engine.begin() as conn:
+        if "license_valid" not in columns:
+            conn.execute(text("ALTER TABLE users ADD COLUMN license_valid BOOLEAN NOT NULL DEFAULT TRUE"))
+            print("[OK] Added users.license_valid")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_subscription_end ON users (subscription_end)"))
+    # Backfill: expire everything that is already due and clear the flag on
+    # rows written before it existed (the periodic sweep only looks at dates)
+    expired = sweep_expired(backfill=True)
+    print(f"[OK] License state up to date ({expired} subscriptions expired)")
+
+def migrate_device_uniqueness():
+    """Collapse duplicate (user_id, device_id) rows and add the unique index heartbeats upsert on"""
+    with engine.begin() as conn:
+        # Keep the most recently seen row of each duplicate group
+        removed = conn.execute(text("""
+            DELETE FROM user_devices WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY user_id, device_id
+                        ORDER BY (last_seen IS NULL), last_seen DESC, created_at DESC
+                    ) AS rn
+                    FROM user_devices
+                ) ranked WHERE rn > 1
+            )
+        """)).rowcount
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_devices_user_device ON user_devices (user_id, device_id)"
+        ))
+    print(f"[OK] Device uniqueness enforced ({removed} duplicate rows removed)")
+
 def seed_admin():
     """Seed initial admin user"""
     db = SessionLocal()
@@ -177,6 +212,8 @@ def seed_beta_password():
 if __name__ == "__main__":
     print("Initializing ANDROAMA database...")
     init_db()
+    migrate_license_state()
+    migrate_device_uniqueness()
     seed_admin()
     seed_welcome_post()
     seed_beta_password()
@@ -0,0 +1,28 @@
+"""
+Test setup: a throwaway SQLite database and downloads directory.
+
+The environment is set before any `app` module is imported, because
+app.database creates its engine at import time.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="androama-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ.setdefault("APPS_DOWNLOADS_DIR", os.path.join(_tmp, "downloads"))
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+import pytest
+from app.database import Base, SessionLocal, engine
+import app.models  # noqa: F401  (registers the tables)
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables"""
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,135 @@
+from app.admission import AdmissionController, AdmissionMiddleware, PriorityClass, Rejected, _parse_route_limits
+from starlette.responses import PlainTextResponse
+import asyncio
+import httpx
+import pytest
+
+def make_controller(max_concurrency: int = 1, limit: int = 1, queue: int = 5, wait: float = 5) -> AdmissionController:
+    controller = AdmissionController(max_concurrency)
+    for name, priority in (("read", 1), ("write", 2), ("hashing", 3)):
+        controller.add_class(PriorityClass(name, priority, limit, queue, wait))
+    controller.add_class(PriorityClass("download", 1, limit, queue, wait, shared=False))
+    return controller
+
+def test_classify():
+    controller = make_controller()
+    assert controller.classify("GET", "/api/health") is None
+    assert controller.classify("GET", "/metrics/") is None
+    assert controller.classify("GET", "/api/public/apps/list").name == "read"
+    assert controller.classify("DELETE", "/api/admin/apps/x").name == "write"
+    assert controller.classify("POST", "/api/auth/login").name == "hashing"
+    assert controller.classify("GET", "/downloads/app.apk").name == "download"
+    assert controller.classify("GET", "/api/public/apps/x/patches/1.0/1.1").name == "download"
+
+def test_route_limit_keeps_the_class_priority():
+    controller = make_controller()
+    for method, path, limit, queue in _parse_route_limits("post /api/auth/login=8:50;GET /api/admin/stats=2"):
+        controller.add_route_limit(method, path, limit, queue)
+    login = controller.classify("POST", "/api/auth/login")
+    assert (login.name, login.priority, login.limit, login.queue_size) == ("POST /api/auth/login", 3, 8, 50)
+    assert controller.classify("GET", "/api/admin/stats").queue_size == 4
+
+def test_freed_shared_slot_goes_to_the_highest_priority_waiter():
+    controller = make_controller(max_concurrency=1, limit=2)
+    order = []
+
+    async def run(name):
+        cls = controller.classes[name]
+        await controller.acquire(cls)
+        order.append(name)
+        await asyncio.sleep(0)
+        controller.release(cls)
+
+    async def main():
+        holder = controller.classes["write"]
+        await controller.acquire(holder)
+        tasks = [asyncio.create_task(run(name)) for name in ("hashing", "write", "read", "hashing", "read")]
+        await asyncio.sleep(0)
+        controller.release(holder)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["read", "read", "write", "hashing", "hashing"]
+    assert controller.shared_active == 0
+
+def test_downloads_do_not_take_shared_slots():
+    controller = make_controller(max_concurrency=1)
+
+    async def main():
+        await controller.acquire(controller.classes["read"])
+        await asyncio.wait_for(controller.acquire(controller.classes["download"]), 1)
+
+    asyncio.run(main())
+    assert controller.shared_active == 1
+
+def test_full_queue_is_rejected():
+    controller = make_controller(queue=1)
+    cls = controller.classes["hashing"]
+
+    async def main():
+        await controller.acquire(cls)
+        queued = asyncio.create_task(controller.acquire(cls))
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected):
+            await controller.acquire(cls)
+        controller.release(cls)
+        await queued
+
+    asyncio.run(main())
+    assert cls.stats["rejected"] == 1
+    assert cls.active == 1
+
+def test_wait_timeout_is_rejected():
+    controller = make_controller(wait=0.01)
+    cls = controller.classes["write"]
+
+    async def main():
+        await controller.acquire(cls)
+        with pytest.raises(Rejected):
+            await controller.acquire(cls)
+
+    asyncio.run(main())
+    assert cls.stats["timeouts"] == 1
+    assert cls.waiting == 0
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    controller = make_controller()
+    cls = controller.classes["read"]
+
+    async def main():
+        await controller.acquire(cls)
+        queued = asyncio.create_task(controller.acquire(cls))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        controller.release(cls)
+
+    asyncio.run(main())
+    assert (cls.active, cls.waiting, controller.shared_active) == (0, 0, 0)
+
+def test_middleware_sheds_with_503_and_retry_after():
+    controller = make_controller(limit=1, queue=2, wait=5)
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def app(scope, receive, send):
+            if scope["path"] == "/api/auth/login":
+                await gate.wait()
+            await PlainTextResponse("ok")(scope, receive, send)
+
+        transport = httpx.ASGITransport(app=AdmissionMiddleware(app, controller))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            requests = [asyncio.create_task(client.post("/api/auth/login")) for _ in range(6)]
+            while controller.classes["hashing"].stats["rejected"] < 3:
+                await asyncio.sleep(0)
+            health = await client.get("/api/health")
+            gate.set()
+            return health, await asyncio.gather(*requests)
+
+    health, responses = asyncio.run(main())
+    assert health.status_code == 200
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200, 200, 200, 503, 503, 503]
+    assert all(r.headers["retry-after"] for r in responses if r.status_code == 503)
+    assert controller.shared_active == 0
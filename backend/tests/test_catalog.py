@@ -0,0 +1,132 @@
+from fastapi import HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from app import catalog
+from app.main import app
+from app.routers import admin, public
+from app.patches import patch_path
+from app.storage import BlobInfo, blob_path, get_downloads_dir
+import asyncio
+import hashlib
+import io
+import pytest
+
+@pytest.fixture
+def catalog_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, "get_apps_list_path", lambda: tmp_path / "apps_list.json")
+    monkeypatch.setenv("APPS_DOWNLOADS_DIR", str(tmp_path / "downloads"))
+    catalog.update_catalog(lambda data: data["apps"].append({"id": "other", "name": "Other"}) or [("add", "other")])
+    return tmp_path / "apps_list.json"
+
+@pytest.fixture
+def slow_upload(monkeypatch):
+    """store_upload that lets a concurrent catalog edit happen while it runs"""
+    async def store_upload(file):
+        content = await file.read()
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = blob_path(sha256)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        await asyncio.sleep(0)
+        catalog.update_app_entry("other", lambda app: app.update(name="Renamed during upload"))
+        return BlobInfo(sha256, len(content), path, False)
+    monkeypatch.setattr(admin, "store_upload", store_upload)
+
+def apk(content: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename="build.apk")
+
+def assert_versions_contiguous():
+    data = catalog.load_apps_list()
+    versions = [change["version"] for change in catalog.load_changelog()["changes"]]
+    assert versions == list(range(1, data["catalogVersion"] + 1))
+
+def test_upload_keeps_edits_made_while_the_file_was_stored(catalog_file, slow_upload):
+    asyncio.run(admin.upload_app(
+        file=apk(b"first build"), name="Demo", description="d", version="1.0",
+        package_name="com.example.demo", category="Other", icon_url=None,
+        is_essential=False, current_user=None
+    ))
+    apps = {app["id"]: app for app in catalog.load_apps_list()["apps"]}
+    assert apps["other"]["name"] == "Renamed during upload"
+    assert "demo" in apps
+    assert_versions_contiguous()
+
+def test_release_keeps_edits_made_while_the_file_was_stored(catalog_file, slow_upload, monkeypatch):
+    monkeypatch.setattr(admin, "schedule_patches", lambda *args: 0)
+    asyncio.run(admin.upload_app(
+        file=apk(b"first build"), name="Demo", description="d", version="1.0",
+        package_name="com.example.demo", category="Other", icon_url=None,
+        is_essential=False, current_user=None
+    ))
+    result = asyncio.run(admin.release_app_version(
+        app_id="demo", file=apk(b"second build"), version="1.1", description=None, current_user=None
+    ))
+    apps = {app["id"]: app for app in catalog.load_apps_list()["apps"]}
+    assert apps["demo"]["version"] == "1.1"
+    assert apps["demo"]["history"][0]["version"] == "1.0"
+    assert result["app"]["sha256"] == hashlib.sha256(b"second build").hexdigest()
+    assert_versions_contiguous()
+
+def test_failed_release_keeps_the_files_the_catalog_points_at(catalog_file, monkeypatch):
+    monkeypatch.setattr(admin, "schedule_patches", lambda *args: 0)
+    asyncio.run(admin.upload_app(
+        file=apk(b"first build"), name="Demo", description="d", version="1.0",
+        package_name="com.example.demo", category="Other", icon_url=None,
+        is_essential=False, current_user=None
+    ))
+    old = hashlib.sha256(b"first build").hexdigest()
+    patch = patch_path("0" * 64, old)
+    patch.parent.mkdir(parents=True, exist_ok=True)
+    patch.write_bytes(b"patch")
+    catalog.update_app_entry("demo", lambda app: app.update(patches=[{"fromSha256": "0" * 64}]))
+
+    def fail_save(*args, **kwargs):
+        raise HTTPException(status_code=500, detail="disk full")
+    monkeypatch.setattr(catalog, "save_apps_list", fail_save)
+    with pytest.raises(HTTPException):
+        asyncio.run(admin.release_app_version(
+            app_id="demo", file=apk(b"second build"), version="1.1", description=None, current_user=None
+        ))
+
+    assert catalog.load_apps_list()["apps"][-1]["version"] == "1.0"
+    assert (get_downloads_dir() / admin.friendly_filename("demo", "1.0")).exists()
+    assert patch.exists()
+
+def test_release_removes_the_replaced_files_once_saved(catalog_file, monkeypatch):
+    monkeypatch.setattr(admin, "schedule_patches", lambda *args: 0)
+    asyncio.run(admin.upload_app(
+        file=apk(b"first build"), name="Demo", description="d", version="1.0",
+        package_name="com.example.demo", category="Other", icon_url=None,
+        is_essential=False, current_user=None
+    ))
+    asyncio.run(admin.release_app_version(
+        app_id="demo", file=apk(b"second build"), version="1.1", description=None, current_user=None
+    ))
+    assert not (get_downloads_dir() / admin.friendly_filename("demo", "1.0")).exists()
+    assert (get_downloads_dir() / admin.friendly_filename("demo", "1.1")).exists()
+
+def test_failed_mutation_saves_nothing(catalog_file):
+    before = catalog.load_apps_list()["catalogVersion"]
+    def fail(data):
+        data["apps"].clear()
+        raise RuntimeError("nope")
+    with pytest.raises(RuntimeError):
+        catalog.update_catalog(fail)
+    data = catalog.load_apps_list()
+    assert data["catalogVersion"] == before and data["apps"]
+
+@pytest.mark.parametrize("contents", [None, "{not json"])
+def test_full_snapshot_matches_apps_list_without_a_catalog_file(db, tmp_path, monkeypatch, contents):
+    apps_file = tmp_path / "apps_list.json"
+    if contents is not None:
+        apps_file.write_text(contents)
+    monkeypatch.setattr(catalog, "get_apps_list_path", lambda: apps_file)
+    monkeypatch.setattr(public, "get_apps_list_path", lambda: apps_file)
+    public._apps_list_cache.update(mtime=None, payload=None)
+    client = TestClient(app)
+
+    listed = client.get("/api/public/apps/list").json()
+    changes = client.get("/api/public/apps/changes", params={"since": 0}).json()
+
+    assert changes["full"] is True
+    assert changes["apps"] == listed["apps"] == catalog.DEFAULT_APPS
+    assert changes["catalogVersion"] == listed["catalogVersion"] == 0
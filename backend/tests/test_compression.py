@@ -0,0 +1,119 @@
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from app import catalog, compression
+from app.compression import CompressionMiddleware, PrecompressedPayload, choose_encoding
+from app.main import app
+from app.routers import public
+import gzip
+import json
+import pytest
+
+BIG = {"apps": [{"id": f"app-{i}", "name": "Some app"} for i in range(200)]}
+
+def big(request):
+    return JSONResponse(BIG)
+
+def small(request):
+    return JSONResponse({"ok": True})
+
+def encoded(request):
+    return Response(gzip.compress(json.dumps(BIG).encode()), media_type="application/json",
+                    headers={"content-encoding": "gzip"})
+
+def ranged(request):
+    return Response(b"x" * 4096, media_type="text/plain", headers={"accept-ranges": "bytes"})
+
+def streamed(request):
+    return StreamingResponse(iter([b"a" * 4096, b"b" * 4096]), media_type="text/plain")
+
+def binary(request):
+    return Response(b"\0" * 4096, media_type="application/octet-stream")
+
+@pytest.fixture
+def client():
+    routes = [Route(f"/{view.__name__}", view) for view in (big, small, encoded, ranged, streamed, binary)]
+    return TestClient(CompressionMiddleware(Starlette(routes=routes), minimum_size=500))
+
+def get(client, path, accept_encoding="gzip"):
+    return client.get(path, headers={"accept-encoding": accept_encoding})
+
+def test_encoding_negotiation_prefers_brotli_then_gzip():
+    both = ("br", "gzip")
+    assert choose_encoding("gzip, br", both) == "br"
+    assert choose_encoding("gzip, br;q=0", both) == "gzip"
+    assert choose_encoding("*", both) == "br"
+    assert choose_encoding("*, br;q=0, gzip;q=0", both) is None
+    assert choose_encoding("identity", both) is None
+    assert choose_encoding("", both) is None
+    assert choose_encoding("br, gzip", ("gzip",)) == "gzip"
+
+def test_large_json_is_gzipped_with_vary(client):
+    response = get(client, "/big")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(json.dumps(BIG))
+    assert response.json() == BIG
+
+def test_brotli_is_used_when_accepted():
+    pytest.importorskip("brotli")
+    routes = [Route("/big", big)]
+    response = get(TestClient(CompressionMiddleware(Starlette(routes=routes), minimum_size=500)), "/big", "gzip, br")
+    assert response.headers["content-encoding"] == "br"
+
+def test_identity_clients_get_the_plain_body(client):
+    response = get(client, "/big", "identity")
+    assert "content-encoding" not in response.headers
+    assert response.json() == BIG
+
+@pytest.mark.parametrize("path", ["/small", "/encoded", "/ranged", "/streamed", "/binary"])
+def test_ineligible_responses_pass_through(client, path):
+    response = get(client, path)
+    expected = "gzip" if path == "/encoded" else None
+    assert response.headers.get("content-encoding") == expected
+    assert "vary" not in response.headers
+
+def test_head_requests_are_not_compressed(client):
+    response = client.head("/big", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+def test_large_bodies_are_compressed_off_the_event_loop(client, monkeypatch):
+    calls = []
+    async def run_in_threadpool(func, *args):
+        calls.append(args[1])
+        return func(*args)
+    monkeypatch.setattr(compression, "run_in_threadpool", run_in_threadpool)
+    monkeypatch.setattr(compression, "COMPRESSION_THREAD_SIZE", 1000)
+    assert get(client, "/big").json() == BIG
+    assert calls == ["gzip"]
+
+def test_tiny_precompressed_payload_is_served_plain():
+    payload = PrecompressedPayload({"a": 1})
+    assert payload._select("gzip") == (None, payload.body)
+
+@pytest.fixture
+def published_catalog(tmp_path, monkeypatch):
+    apps_file = tmp_path / "apps_list.json"
+    apps_file.write_text(json.dumps({"catalogVersion": 3, **BIG}))
+    monkeypatch.setattr(catalog, "get_apps_list_path", lambda: apps_file)
+    monkeypatch.setattr(public, "get_apps_list_path", lambda: apps_file)
+    public._apps_list_cache.update(mtime=None, payload=None)
+    yield apps_file
+    public._apps_list_cache.update(mtime=None, payload=None)
+
+def test_catalog_is_served_precompressed(db, published_catalog):
+    client = TestClient(app)
+    response = get(client, "/api/public/apps/list")
+    payload = public._apps_list_cache["payload"]
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == payload.etag
+    assert int(response.headers["content-length"]) == len(payload.encoded["gzip"])
+    assert response.json()["apps"] == BIG["apps"]
+
+    plain = get(client, "/api/public/apps/list", "identity")
+    assert "content-encoding" not in plain.headers and plain.content == payload.body
+
+    unchanged = client.get("/api/public/apps/list", headers={"if-none-match": payload.etag})
+    assert unchanged.status_code == 304 and unchanged.content == b""
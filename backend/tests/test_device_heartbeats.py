@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from app import device_heartbeats
+from app.models import User, UserDevice
+import asyncio
+import pytest
+
+@pytest.fixture(autouse=True)
+def empty_pending(monkeypatch):
+    monkeypatch.setattr(device_heartbeats, "_pending", {})
+    monkeypatch.setattr(device_heartbeats, "_pending_per_user", device_heartbeats.Counter())
+    monkeypatch.setattr(device_heartbeats, "stats", dict.fromkeys(device_heartbeats.stats, 0))
+
+def make_user(db, email="owner@example.com") -> User:
+    user = User(email=email, password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+def test_heartbeats_from_one_device_merge():
+    device_heartbeats.record_heartbeat("a@example.com", "d1", device_name="Pixel", android_version="14")
+    device_heartbeats.record_heartbeat("a@example.com", "d1", device_model="Pixel 8")
+    assert len(device_heartbeats._pending) == 1
+    entry = device_heartbeats._pending[("a@example.com", "d1")]
+    assert (entry["device_name"], entry["device_model"], entry["android_version"]) == ("Pixel", "Pixel 8", "14")
+
+def test_merge_keeps_the_newest_last_seen():
+    now = datetime.now(timezone.utc)
+    old = {"device_name": "old", "last_seen": now}
+    merged = device_heartbeats._merge(old, {"device_name": None, "last_seen": now - timedelta(seconds=5)})
+    assert merged == {"device_name": "old", "last_seen": now}
+
+def test_flush_upserts_one_row_per_device(db):
+    user = make_user(db)
+    device_heartbeats.record_heartbeat(user.email, "d1", device_name="Pixel")
+    device_heartbeats.record_heartbeat("nobody@example.com", "d9")
+    asyncio.run(device_heartbeats.flush())
+    device_heartbeats.record_heartbeat(user.email, "d1", android_version="14")
+    asyncio.run(device_heartbeats.flush())
+
+    devices = db.query(UserDevice).all()
+    assert [(d.device_id, d.device_name, d.android_version) for d in devices] == [("d1", "Pixel", "14")]
+    assert device_heartbeats.stats["unknown_users"] == 1
+    assert device_heartbeats._pending == {}
+
+def test_failed_flush_requeues_and_merges_with_newer_heartbeats(db, monkeypatch):
+    user = make_user(db)
+    device_heartbeats.record_heartbeat(user.email, "d1", device_name="Pixel")
+
+    def fail(entries):
+        # A heartbeat arriving while the write is in flight
+        device_heartbeats.record_heartbeat(user.email, "d1", android_version="14")
+        raise RuntimeError("database down")
+    monkeypatch.setattr(device_heartbeats, "_flush_batch", fail)
+    asyncio.run(device_heartbeats.flush())
+
+    entry = device_heartbeats._pending[(user.email, "d1")]
+    assert (entry["device_name"], entry["android_version"]) == ("Pixel", "14")
+    assert device_heartbeats.stats["flush_errors"] == 1
+    assert device_heartbeats._pending_per_user[user.email] == 1
+
+def test_new_devices_past_the_per_user_limit_are_refused(db, monkeypatch):
+    monkeypatch.setattr(device_heartbeats, "DEVICE_MAX_PER_USER", 2)
+    user = make_user(db)
+    device_heartbeats.record_heartbeat(user.email, "d1")
+    device_heartbeats.record_heartbeat(user.email, "d2")
+    with pytest.raises(HTTPException) as exc:
+        device_heartbeats.record_heartbeat(user.email, "d3")
+    assert exc.value.status_code == 429
+    device_heartbeats.record_heartbeat(user.email, "d1")  # known devices still report in
+    asyncio.run(device_heartbeats.flush())
+
+    # Also enforced against devices already stored
+    device_heartbeats.record_heartbeat(user.email, "d3")
+    asyncio.run(device_heartbeats.flush())
+    assert sorted(d.device_id for d in db.query(UserDevice)) == ["d1", "d2"]
+    assert device_heartbeats.stats["over_device_limit"] == 2
+
+def test_new_devices_are_shed_while_pending_is_full(monkeypatch):
+    monkeypatch.setattr(device_heartbeats, "DEVICE_MAX_PENDING", 2)
+    device_heartbeats.record_heartbeat("a@example.com", "d1")
+    device_heartbeats.record_heartbeat("b@example.com", "d1")
+    with pytest.raises(HTTPException) as exc:
+        device_heartbeats.record_heartbeat("c@example.com", "d1")
+    assert exc.value.status_code == 503
+    assert "Retry-After" in exc.value.headers
+    device_heartbeats.record_heartbeat("a@example.com", "d1")
+    assert len(device_heartbeats._pending) == 2
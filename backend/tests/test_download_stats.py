@@ -0,0 +1,91 @@
+from collections import deque
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+from app import download_stats
+from app.auth import create_access_token
+from app.models import App, User, UserAppDownload
+import asyncio
+import pytest
+
+DEMO = {"packageName": "com.example.demo", "name": "Demo", "version": "1.0"}
+OTHER = {"packageName": "com.example.other", "name": "Other", "version": "2.0"}
+
+@pytest.fixture(autouse=True)
+def empty_queue(monkeypatch):
+    monkeypatch.setattr(download_stats, "_queue", deque(maxlen=100))
+    monkeypatch.setattr(download_stats, "stats", dict.fromkeys(download_stats.stats, 0))
+
+def test_flush_writes_batches_and_aggregates_counts(db, monkeypatch):
+    monkeypatch.setattr(download_stats, "DOWNLOAD_FLUSH_BATCH", 2)
+    user = User(email="fan@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    token = create_access_token({"sub": user.email})
+    for app, authorization in [(DEMO, None), (DEMO, f"Bearer {token}"), (OTHER, None), (DEMO, None), (OTHER, f"Bearer {token}")]:
+        download_stats.record_download(app, authorization)
+
+    asyncio.run(download_stats.flush())
+
+    assert download_stats.stats["flushes"] == 3 and download_stats.stats["flushed"] == 5
+    counts = dict(db.query(App.package_name, App.download_count).all())
+    assert counts == {"com.example.demo": 3, "com.example.other": 2}
+    assert db.query(UserAppDownload).count() == 2
+    db.refresh(user)
+    assert user.has_downloaded is True
+
+def test_failed_flush_requeues_the_batch_in_order(monkeypatch):
+    def fail(events):
+        raise RuntimeError("database down")
+    monkeypatch.setattr(download_stats, "_flush_batch", fail)
+    for app in (DEMO, OTHER, DEMO):
+        download_stats.record_download(app)
+
+    asyncio.run(download_stats.flush())
+
+    assert [event[0] for event in download_stats._queue] == [
+        "com.example.demo", "com.example.other", "com.example.demo"
+    ]
+    assert download_stats.stats["flush_errors"] == 1
+    assert download_stats.stats["dropped"] == 0
+
+def test_requeue_into_a_full_queue_counts_what_it_drops(monkeypatch):
+    monkeypatch.setattr(download_stats, "_queue", deque(maxlen=4))
+    for _ in range(3):
+        download_stats.record_download(DEMO)
+
+    def fail(events):
+        # Newer downloads arriving while the write is in flight
+        for _ in range(3):
+            download_stats.record_download(OTHER)
+        raise RuntimeError("database down")
+    monkeypatch.setattr(download_stats, "_flush_batch", fail)
+    asyncio.run(download_stats.flush())
+
+    assert [event[0] for event in download_stats._queue] == ["com.example.demo"] + ["com.example.other"] * 3
+    assert download_stats.stats["dropped"] == 2
+
+def test_recording_into_a_full_queue_counts_the_drop(monkeypatch):
+    monkeypatch.setattr(download_stats, "_queue", deque(maxlen=2))
+    for _ in range(3):
+        download_stats.record_download(DEMO)
+    assert len(download_stats._queue) == 2
+    assert download_stats.stats["dropped"] == 1
+
+@pytest.mark.parametrize("method, path, headers, counted", [
+    ("GET", "/downloads/demo-v1.0.apk", {}, True),
+    ("GET", "/downloads/demo-v1.0.apk", {"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}, False),
+    ("HEAD", "/downloads/demo-v1.0.apk", {}, False),
+    ("GET", "/downloads/readme.txt", {}, False),
+])
+def test_counting_static_files(tmp_path, monkeypatch, method, path, headers, counted):
+    (tmp_path / "demo-v1.0.apk").write_bytes(b"x" * 100)
+    (tmp_path / "readme.txt").write_text("hello")
+    monkeypatch.setattr(download_stats, "find_app", lambda filename=None, sha256=None: DEMO)
+    client = TestClient(Starlette(routes=[
+        Mount("/downloads", download_stats.CountingStaticFiles(directory=str(tmp_path)))
+    ]))
+
+    client.request(method, path, headers=headers)
+
+    assert len(download_stats._queue) == (1 if counted else 0)
@@ -0,0 +1,201 @@
+from fastapi import HTTPException
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from app import downloads
+from app.storage import blob_path, link_friendly_name, remove_blob, unlink_friendly_name
+import asyncio
+import hashlib
+import httpx
+import os
+import pytest
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setenv("APPS_DOWNLOADS_DIR", str(tmp_path))
+    monkeypatch.setattr(downloads, "DOWNLOAD_STAT_TTL", 60)
+    downloads._file_cache.clear()
+    return tmp_path
+
+def put_blob(content: bytes) -> str:
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = blob_path(sha256)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return sha256
+
+def test_relink_is_seen_before_the_ttl_expires(root):
+    old, new = put_blob(b"old"), put_blob(b"a newer build")
+    link_friendly_name(old, "app.apk")
+    before = downloads.stat_file(root, "app.apk")
+
+    link_friendly_name(new, "app.apk")
+    after = downloads.stat_file(root, "app.apk")
+
+    assert after.size == len(b"a newer build")
+    assert after.etag != before.etag
+
+def test_relink_by_another_worker_is_seen_before_the_ttl_expires(root):
+    """Without the local cache being told: the stat check alone catches it"""
+    (root / "old.bin").write_bytes(b"old")
+    (root / "new.bin").write_bytes(b"a newer build")
+    os.symlink("old.bin", root / "app.apk")
+    before = downloads.stat_file(root, "app.apk")
+
+    os.symlink("new.bin", root / "app.apk.tmp")
+    os.replace(root / "app.apk.tmp", root / "app.apk")
+    after = downloads.stat_file(root, "app.apk")
+
+    assert after.path.endswith("new.bin")
+    assert after.size == len(b"a newer build")
+    assert after.etag != before.etag
+
+def test_deleted_file_is_not_served_from_cache(root):
+    sha256 = put_blob(b"content")
+    link_friendly_name(sha256, "app.apk")
+    downloads.stat_file(root, "app.apk")
+    downloads.stat_file(root, blob_path(sha256).relative_to(root).as_posix())
+
+    unlink_friendly_name("app.apk")
+    remove_blob(sha256)
+
+    with pytest.raises(HTTPException) as exc:
+        downloads.stat_file(root, "app.apk")
+    assert exc.value.status_code == 404
+    with pytest.raises(HTTPException) as exc:
+        downloads.stat_file(root, blob_path(sha256).relative_to(root).as_posix())
+    assert exc.value.status_code == 404
+
+def test_unchanged_file_is_served_from_cache(root):
+    (root / "app.apk").write_bytes(b"content")
+    first = downloads.stat_file(root, "app.apk")
+    assert downloads.stat_file(root, "app.apk") is first
+
+CONTENT = bytes(i % 251 for i in range(1000))
+
+@pytest.fixture
+def client(root):
+    (root / "app.apk").write_bytes(CONTENT)
+
+    async def serve(request):
+        info = downloads.stat_file(root, request.path_params["filename"])
+        return downloads.file_response(request, info, filename="app.apk")
+
+    return TestClient(Starlette(routes=[Route("/{filename}", serve, methods=["GET", "HEAD"])]))
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=900-", [(900, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=990-2000", [(990, 999)]),
+    ("bytes=0-9, 5-19, 50-59", [(0, 19), (50, 59)]),
+    ("bytes=1000-", []),
+    ("bytes=5-1", None),
+    ("items=0-1", None),
+    ("bytes=abc", None),
+    ("bytes=" + ",".join(f"{i}-{i}" for i in range(0, 40, 2)), None),
+])
+def test_parse_range_header(header, expected):
+    assert downloads.parse_range_header(header, 1000) == expected
+
+def test_full_download(client):
+    response = client.get("/app.apk")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == "1000"
+    assert response.headers["etag"].startswith('"')
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-99", 0, 99),
+    ("bytes=500-", 500, 999),
+    ("bytes=-10", 990, 999),
+])
+def test_single_range(client, header, start, end):
+    response = client.get("/app.apk", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {start}-{end}/1000"
+    assert response.content == CONTENT[start:end + 1]
+
+def test_multiple_ranges(client):
+    response = client.get("/app.apk", headers={"Range": "bytes=0-9,100-109"})
+    assert response.status_code == 206
+    content_type = response.headers["content-type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.split("boundary=")[1]
+    assert int(response.headers["content-length"]) == len(response.content)
+    parts = response.content.split(f"--{boundary}".encode())
+    assert parts[-1] == b"--\r\n"
+    bodies = [part.split(b"\r\n\r\n", 1) for part in parts[1:-1]]
+    assert [head.split(b"Content-Range: ")[1] for head, _ in bodies] == [b"bytes 0-9/1000", b"bytes 100-109/1000"]
+    assert [body[:-2] if body.endswith(b"\r\n") else body for _, body in bodies] == [CONTENT[0:10], CONTENT[100:110]]
+
+def test_unsatisfiable_range(client):
+    response = client.get("/app.apk", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1000"
+
+@pytest.mark.parametrize("if_range, status", [
+    ("current-etag", 206),
+    ('"stale-etag"', 200),
+    ("current-date", 206),
+    ("Thu, 01 Jan 1970 00:00:00 GMT", 200),
+])
+def test_if_range(client, if_range, status):
+    validators = client.head("/app.apk").headers
+    if_range = {"current-etag": validators["etag"], "current-date": validators["last-modified"]}.get(if_range, if_range)
+    response = client.get("/app.apk", headers={"Range": "bytes=0-9", "If-Range": if_range})
+    assert response.status_code == status
+    assert response.content == (CONTENT[:10] if status == 206 else CONTENT)
+
+@pytest.mark.parametrize("header, value, status", [
+    ("If-None-Match", "current-etag", 304),
+    ("If-None-Match", "W/current-etag", 304),
+    ("If-None-Match", '"other"', 200),
+    ("If-Modified-Since", "current-date", 304),
+    ("If-Modified-Since", "Thu, 01 Jan 1970 00:00:00 GMT", 200),
+])
+def test_conditional_get(client, header, value, status):
+    validators = client.head("/app.apk").headers
+    value = value.replace("current-etag", validators["etag"]).replace("current-date", validators["last-modified"])
+    response = client.get("/app.apk", headers={header: value})
+    assert response.status_code == status
+    if status == 304:
+        assert response.content == b""
+        assert response.headers["etag"] == validators["etag"]
+
+@pytest.mark.parametrize("headers, status, length", [
+    ({}, 200, "1000"),
+    ({"Range": "bytes=0-99"}, 206, "100"),
+])
+def test_head(client, headers, status, length):
+    response = client.head("/app.apk", headers=headers)
+    assert response.status_code == status
+    assert response.headers["content-length"] == length
+    assert response.content == b""
+
+def test_missing_file(client):
+    assert client.get("/missing.apk").status_code == 404
+
+def test_concurrent_ranged_downloads_reassemble_the_file(root):
+    """Many clients resuming in chunks at once (see benchmarks/downloads.py for timings)"""
+    (root / "app.apk").write_bytes(CONTENT)
+
+    async def serve(request):
+        return downloads.file_response(request, downloads.stat_file(root, "app.apk"))
+
+    async def fetch(client, chunk):
+        parts = []
+        for start in range(0, len(CONTENT), chunk):
+            end = min(start + chunk, len(CONTENT)) - 1
+            response = await client.get("/app.apk", headers={"Range": f"bytes={start}-{end}"})
+            assert response.status_code == 206
+            parts.append(response.content)
+        return b"".join(parts)
+
+    async def main():
+        transport = httpx.ASGITransport(app=Starlette(routes=[Route("/app.apk", serve)]))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(fetch(client, chunk) for chunk in (7, 64, 100, 333, 1000) * 4))
+
+    assert all(body == CONTENT for body in asyncio.run(main()))
@@ -0,0 +1,125 @@
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwk, jwt
+from app import google_jwks, oauth
+from app.google_jwks import JWKSCache, StaticKeySource, TokenVerificationError, parse_max_age, verify_id_token
+import asyncio
+import pytest
+import time
+
+CLIENT_ID = "client-123.apps.googleusercontent.com"
+
+def make_key(kid: str):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    return pem, {**public, "kid": kid, "use": "sig"}
+
+PEM, JWK = make_key("key-1")
+NEW_PEM, NEW_JWK = make_key("key-2")
+
+def token(pem=PEM, kid="key-1", **overrides) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": "https://accounts.google.com", "aud": CLIENT_ID, "sub": "1234",
+        "email": "user@example.com", "email_verified": True, "iat": now, "exp": now + 3600,
+        **overrides,
+    }
+    return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": kid})
+
+class CountingSource(StaticKeySource):
+    def __init__(self, *key_sets):
+        super().__init__()
+        self.key_sets = list(key_sets)
+        self.fetches = 0
+
+    async def fetch(self):
+        jwks = self.key_sets[min(self.fetches, len(self.key_sets) - 1)]
+        self.fetches += 1
+        await asyncio.sleep(0.01)
+        return jwks, None
+
+def verify(raw_token, cache):
+    return asyncio.run(verify_id_token(raw_token, CLIENT_ID, cache))
+
+def test_valid_token():
+    cache = JWKSCache(StaticKeySource({"keys": [JWK]}))
+    claims = verify(token(), cache)
+    assert claims["sub"] == "1234" and claims["email"] == "user@example.com"
+
+@pytest.mark.parametrize("overrides, message", [
+    ({"aud": "someone-else"}, "audience"),
+    ({"iss": "https://evil.example.com"}, "issuer"),
+    ({"exp": int(time.time()) - google_jwks.GOOGLE_TOKEN_LEEWAY - 60}, "expired"),
+])
+def test_rejected_claims(overrides, message):
+    cache = JWKSCache(StaticKeySource({"keys": [JWK]}))
+    with pytest.raises(TokenVerificationError, match=f"(?i){message}"):
+        verify(token(**overrides), cache)
+
+def test_bad_signature():
+    cache = JWKSCache(StaticKeySource({"keys": [JWK]}))
+    with pytest.raises(TokenVerificationError):
+        verify(token(pem=NEW_PEM, kid="key-1"), cache)
+
+def test_unknown_kid_refetches_once_for_concurrent_requests():
+    source = CountingSource({"keys": [JWK]}, {"keys": [JWK, NEW_JWK]})
+    cache = JWKSCache(source, min_refetch_interval=0)
+    verify(token(), cache)
+    assert source.fetches == 1
+
+    async def main():
+        rotated = token(pem=NEW_PEM, kid="key-2")
+        return await asyncio.gather(*(verify_id_token(rotated, CLIENT_ID, cache) for _ in range(5)))
+
+    assert all(claims["sub"] == "1234" for claims in asyncio.run(main()))
+    assert source.fetches == 2
+    assert cache.stats["unknown_kid_refetches"] == 1
+
+def test_unknown_kid_refetches_are_rate_limited():
+    source = CountingSource({"keys": [JWK]})
+    cache = JWKSCache(source, min_refetch_interval=60)
+    with pytest.raises(TokenVerificationError, match="unknown key"):
+        verify(token(kid="bogus"), cache)
+    with pytest.raises(TokenVerificationError, match="unknown key"):
+        verify(token(kid="bogus-2"), cache)
+    assert source.fetches == 1
+
+@pytest.mark.parametrize("cache_control, age, expected", [
+    ("public, max-age=19204, must-revalidate, no-transform", None, 19204.0),
+    ("public, max-age=100", "40", 60.0),
+    ("max-age=100", "400", 0.0),
+    ("max-age=100", "garbage", 100.0),
+    ("no-cache", None, 0.0),
+    ("private, no-store", None, 0.0),
+    ("public", None, None),
+    (None, None, None),
+])
+def test_parse_max_age(cache_control, age, expected):
+    assert parse_max_age(cache_control, age) == expected
+
+def test_cache_lifetime_follows_max_age():
+    class MaxAgeSource(CountingSource):
+        async def fetch(self):
+            jwks, _ = await super().fetch()
+            return jwks, 0.0
+    source = MaxAgeSource({"keys": [JWK]})
+    cache = JWKSCache(source)
+    verify(token(), cache)
+    verify(token(), cache)
+    assert source.fetches == 2  # max-age=0: refetched on every use
+
+def test_verify_google_token_uses_the_local_keys(monkeypatch):
+    monkeypatch.setattr(oauth, "GOOGLE_CLIENT_ID", CLIENT_ID)
+    monkeypatch.setattr(oauth, "GOOGLE_TOKEN_VERIFICATION", "local")
+    monkeypatch.setattr(google_jwks, "jwks_cache", JWKSCache(StaticKeySource({"keys": [JWK]})))
+
+    user_info = asyncio.run(oauth.verify_google_token(token(name="Ada")))
+    assert (user_info["id"], user_info["name"], user_info["verified_email"]) == ("1234", "Ada", True)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(oauth.verify_google_token(token(aud="someone-else")))
+    assert exc.value.status_code == 401
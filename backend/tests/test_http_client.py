@@ -0,0 +1,131 @@
+from app.http_client import CircuitBreaker, CircuitOpenError, HTTPClient
+import asyncio
+import httpx
+import pytest
+
+COOLDOWN = 0.05
+
+def client_with(handler) -> HTTPClient:
+    client = HTTPClient()
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    breaker = client.upstream("api").breaker
+    breaker.threshold = 2
+    breaker.cooldown = COOLDOWN
+    return client
+
+async def trip(client: HTTPClient):
+    for _ in range(2):
+        await client.post("http://api.test/", upstream="api")
+    assert client.upstream("api").breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await client.post("http://api.test/", upstream="api")
+    await asyncio.sleep(COOLDOWN * 1.5)
+    assert client.upstream("api").breaker.state == "half_open"
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=2, cooldown=0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "half_open"  # cooldown 0: trial allowed right away
+    trial = breaker.allow()
+    assert trial is not None
+    assert breaker.allow() is None  # only one trial at a time
+    breaker.record_success(trial)
+    assert breaker.state == "closed" and breaker.allow() is not None
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(threshold=5, cooldown=60)
+    breaker.opened_at = 0.0  # long ago: half open
+    trial = breaker.allow()
+    breaker.record_failure(trial)
+    assert breaker.state == "open"
+    assert breaker.trial_in_flight is False
+
+def test_late_failure_from_before_the_breaker_opened_keeps_the_trial():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    early = breaker.allow()  # admitted while closed, still running
+    breaker.record_failure(breaker.allow())
+    assert breaker.state == "open"
+    breaker.opened_at -= 1  # cooldown over: half open
+    trial = breaker.allow()
+    assert trial is not None
+
+    breaker.record_failure(early)
+    assert breaker.trial_in_flight
+    assert breaker.allow() is None  # still only the one trial
+    breaker.record_success(trial)
+    assert breaker.state == "closed"
+
+def test_successful_trial_closes_the_breaker():
+    outcome = {"status": 503}
+    client = client_with(lambda request: httpx.Response(outcome["status"]))
+
+    async def run():
+        await trip(client)
+        outcome["status"] = 200
+        response = await client.post("http://api.test/", upstream="api")
+        assert response.status_code == 200
+        assert client.upstream("api").breaker.state == "closed"
+    asyncio.run(run())
+
+def test_trial_raising_a_non_transport_error_does_not_wedge_the_breaker():
+    outcome = {"fail": False}
+
+    def handler(request):
+        if outcome["fail"]:
+            raise httpx.DecodingError("garbled body", request=request)
+        return httpx.Response(503)
+    client = client_with(handler)
+
+    async def run():
+        await trip(client)
+        outcome["fail"] = True
+        with pytest.raises(httpx.DecodingError):
+            await client.post("http://api.test/", upstream="api")
+        breaker = client.upstream("api").breaker
+        assert breaker.state == "open" and not breaker.trial_in_flight
+        outcome["fail"] = False
+        await asyncio.sleep(COOLDOWN * 1.5)
+        assert breaker.allow() is not None  # a new trial is possible
+    asyncio.run(run())
+
+def test_cancelled_trial_releases_the_trial_slot():
+    gate = {"hang": False}
+
+    async def handler(request):
+        if gate["hang"]:
+            await asyncio.sleep(10)
+        return httpx.Response(503)
+    client = client_with(handler)
+
+    async def run():
+        await trip(client)
+        gate["hang"] = True
+        task = asyncio.create_task(client.post("http://api.test/", upstream="api"))
+        await asyncio.sleep(0.01)
+        assert client.upstream("api").breaker.trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        breaker = client.upstream("api").breaker
+        assert not breaker.trial_in_flight
+        gate["hang"] = False
+        await asyncio.sleep(COOLDOWN * 1.5)
+        response = await client.post("http://api.test/", upstream="api", retries=0)
+        assert response.status_code == 503  # the request was sent, not rejected
+    asyncio.run(run())
+
+def test_cancelled_call_outside_a_trial_is_not_a_failure():
+    async def handler(request):
+        await asyncio.sleep(10)
+    client = client_with(handler)
+
+    async def run():
+        task = asyncio.create_task(client.get("http://api.test/", upstream="api"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert client.upstream("api").breaker.failures == 0
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+from fastapi.testclient import TestClient
+from app.auth import get_current_active_user
+from app.main import app
+from app.models import User
+from app.routers import users
+import pytest
+import uuid
+
+@pytest.fixture
+def fleet(db):
+    now = datetime.now(timezone.utc)
+    people = {
+        "admin": User(email="admin@example.com", is_admin=True, subscription_status="lifetime", license_key="LK-ADMIN"),
+        "valid": User(email="valid@example.com", subscription_status="active", subscription_end=now + timedelta(days=30),
+                      subscription_tier="beta", license_key="LK-VALID"),
+        "expired": User(email="expired@example.com", subscription_status="expired", subscription_end=now - timedelta(days=1),
+                        license_key="LK-EXPIRED"),
+    }
+    db.add_all(people.values())
+    db.commit()
+    return people
+
+def client_as(user: User) -> TestClient:
+    app.dependency_overrides[get_current_active_user] = lambda: user
+    return TestClient(app)
+
+@pytest.fixture(autouse=True)
+def clear_overrides():
+    yield
+    app.dependency_overrides.pop(get_current_active_user, None)
+
+def verify(client: TestClient, **body):
+    return client.post("/api/users/license/verify", json=body)
+
+def test_mixed_batch_for_an_admin(fleet):
+    response = verify(
+        client_as(fleet["admin"]),
+        user_ids=[str(fleet["valid"].id), str(fleet["expired"].id), str(fleet["valid"].id)],
+        license_keys=["LK-EXPIRED", "LK-VALID"],
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(r.get("user_id"), r["license_key"], r["valid"]) for r in results] == [
+        (str(fleet["valid"].id), "LK-VALID", True),
+        (str(fleet["expired"].id), "LK-EXPIRED", False),
+        (str(fleet["expired"].id), "LK-EXPIRED", False),
+        (str(fleet["valid"].id), "LK-VALID", True),
+    ]
+    assert results[1]["reason"] == "Subscription expired"
+
+def test_unknown_and_malformed_identifiers(fleet):
+    missing = str(uuid.uuid4())
+    results = verify(
+        client_as(fleet["admin"]), user_ids=["not-a-uuid", missing], license_keys=["LK-NOPE", ""]
+    ).json()["results"]
+    assert results == [
+        {"user_id": "not-a-uuid", "valid": False, "reason": "Invalid user ID format"},
+        {"user_id": missing, "valid": False, "reason": "User not found"},
+        {"license_key": "LK-NOPE", "valid": False, "reason": "License not found"},
+    ]
+
+def test_non_admins_only_see_themselves_and_keys_they_hold(fleet):
+    results = verify(
+        client_as(fleet["valid"]),
+        user_ids=[str(fleet["valid"].id), str(fleet["expired"].id)],
+        license_keys=["LK-EXPIRED"],
+    ).json()["results"]
+    assert [r["reason"] for r in results] == ["Access denied", "", "Subscription expired"]
+    assert results[0]["user_id"] == str(fleet["expired"].id)
+
+def test_batch_size_is_capped(fleet, monkeypatch):
+    monkeypatch.setattr(users, "MAX_LICENSE_BATCH", 3)
+    client = client_as(fleet["admin"])
+    assert verify(client, user_ids=[str(fleet["valid"].id)] * 2, license_keys=["LK-VALID"]).status_code == 200
+    response = verify(client, user_ids=[str(fleet["valid"].id)] * 2, license_keys=["LK-VALID", "LK-EXPIRED"])
+    assert response.status_code == 400
+    assert "At most 3" in response.json()["detail"]
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from sqlalchemy import update
+from app import licensing
+from app.models import User
+import pytest
+
+@pytest.fixture(autouse=True)
+def fresh_keys(monkeypatch):
+    monkeypatch.delenv("LICENSE_SIGNING_KEY", raising=False)
+    monkeypatch.delenv("LICENSE_SIGNING_KEY_FILE", raising=False)
+    licensing._keys.clear()
+    yield
+    licensing._keys.clear()
+
+def user() -> User:
+    return User(email="owner@example.com", subscription_status="lifetime", subscription_tier="lifetime",
+                edition="monitor", license_key="LK-1")
+
+def test_no_signing_key_refuses_to_issue(monkeypatch):
+    monkeypatch.setattr(licensing, "LICENSE_EPHEMERAL_KEY", False)
+    with pytest.raises(HTTPException) as e:
+        licensing.issue_license_token(user())
+    assert e.value.status_code == 503
+    with pytest.raises(HTTPException):
+        licensing.public_key()
+
+def test_ephemeral_key_only_behind_the_dev_flag(monkeypatch, capsys):
+    monkeypatch.setattr(licensing, "LICENSE_EPHEMERAL_KEY", True)
+    issued = licensing.issue_license_token(user())
+    assert licensing.verify_license_token(issued["token"])["license_key"] == "LK-1"
+
+def test_configured_key_is_shared_by_every_process(monkeypatch, capsys):
+    monkeypatch.setattr(licensing, "LICENSE_EPHEMERAL_KEY", True)
+    pem = licensing._load_private_key()
+    monkeypatch.setattr(licensing, "LICENSE_EPHEMERAL_KEY", False)
+    monkeypatch.setenv("LICENSE_SIGNING_KEY", pem.replace("\n", "\\n"))
+    first = licensing.public_key()
+    licensing._keys.clear()  # a second worker / a restart
+    assert licensing.public_key() == first
+
+def test_sweep_expires_only_due_subscriptions(db):
+    now = datetime.now(timezone.utc)
+    rows = {
+        "expired": User(email="expired@example.com", subscription_status="active", subscription_end=now - timedelta(days=1)),
+        "active": User(email="active@example.com", subscription_status="active", subscription_end=now + timedelta(days=1)),
+        "lifetime": User(email="lifetime@example.com", subscription_status="lifetime"),
+        "cancelled": User(email="cancelled@example.com", subscription_status="cancelled", subscription_end=now - timedelta(days=1)),
+        "lagging": User(email="lagging@example.com", subscription_status="cancelled"),
+    }
+    db.add_all(rows.values())
+    db.commit()
+    # Written before the flag existed: status says cancelled, flag still set
+    db.execute(update(User.__table__).where(User.__table__.c.email == "lagging@example.com").values(license_valid=True))
+    db.commit()
+
+    assert licensing.sweep_expired(now) == 1
+    assert licensing.sweep_expired(now) == 0
+    assert licensing.sweep_expired(now, backfill=True) == 1
+
+    db.expire_all()
+    state = {name: (user.subscription_status, user.license_valid) for name, user in rows.items()}
+    assert state == {
+        "expired": ("expired", False),
+        "active": ("active", True),
+        "lifetime": ("lifetime", True),
+        "cancelled": ("cancelled", False),
+        "lagging": ("cancelled", False),
+    }
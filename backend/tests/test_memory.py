@@ -0,0 +1,93 @@
+from fastapi.testclient import TestClient
+from starlette.routing import Route
+from app import memory, metrics
+from app.main import app
+from app.models import User
+from app.routers.admin import get_current_admin
+import contextvars
+import tracemalloc
+import pytest
+
+DIAGNOSTICS = "/api/admin/diagnostics"
+
+@pytest.fixture(autouse=True)
+def clean_memory():
+    yield
+    memory.stop()
+    memory.clear_snapshots()
+
+@pytest.fixture
+def admin_client():
+    app.dependency_overrides[get_current_admin] = lambda: User(email="admin@example.com", is_admin=True)
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_current_admin, None)
+
+def test_snapshots_need_tracing(admin_client):
+    assert admin_client.get(f"{DIAGNOSTICS}/memory").json()["tracing"] is False
+    with pytest.raises(memory.MemoryTracingOff):
+        memory.take_snapshot()
+    response = admin_client.post(f"{DIAGNOSTICS}/memory/snapshots")
+    assert response.status_code == 409
+
+def test_unknown_snapshots_are_404(admin_client):
+    assert admin_client.get(f"{DIAGNOSTICS}/memory/snapshots/nope").status_code == 404
+    response = admin_client.get(f"{DIAGNOSTICS}/memory/diff", params={"base": "nope"})
+    assert response.status_code == 404 and "nope" in response.json()["detail"]
+
+def test_start_snapshot_and_diff_find_the_growth(admin_client):
+    started = admin_client.post(f"{DIAGNOSTICS}/memory/start", params={"frames": 5}).json()
+    assert started["tracing"] is True and started["frames"] == 5
+
+    before = admin_client.post(f"{DIAGNOSTICS}/memory/snapshots", params={"label": "before"}).json()
+    assert before["label"] == "before"
+    assert admin_client.get(f"{DIAGNOSTICS}/memory/snapshots/{before['id']}").json()["id"] == before["id"]
+
+    hog = [bytearray(1024) for _ in range(2000)]
+    grown = admin_client.get(f"{DIAGNOSTICS}/memory/diff", params={"base": before["id"]}).json()
+    assert grown["base"] == before["id"] and grown["target"] in memory.snapshots
+    assert grown["traced_bytes_diff"] > 2_000_000
+    ours = [m for m in grown["by_module"] if m["module"] == __name__]
+    assert ours and ours[0]["size_diff"] > 2_000_000
+    assert any(site["module"] == __name__ for site in grown["top_sites"])
+    del hog
+
+    # Stopping keeps the snapshots, but comparing against "now" needs tracing
+    assert admin_client.post(f"{DIAGNOSTICS}/memory/stop").json()["tracing"] is False
+    assert before["id"] in memory.snapshots
+    assert admin_client.get(f"{DIAGNOSTICS}/memory/diff", params={"base": before["id"]}).status_code == 409
+    admin_client.delete(f"{DIAGNOSTICS}/memory/snapshots")
+    assert memory.snapshots == {}
+
+def test_only_the_latest_snapshots_are_kept(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_KEEP_SNAPSHOTS", 2)
+    memory.start(1)
+    ids = [memory.take_snapshot(str(i)) for i in range(3)]
+    assert list(memory.snapshots) == ids[1:]
+    assert tracemalloc.is_tracing()
+
+def in_route(path, func):
+    """Run `func` as if serving a request matched to `path`"""
+    def run():
+        metrics._request_scope.set({"route": Route(path, lambda request: None)})
+        return func()
+    return contextvars.copy_context().run(run)
+
+def test_orm_objects_are_counted_per_route():
+    memory.start(1)
+    background = User(email="cron@example.com")
+    served = in_route("/api/users/{user_id}", lambda: [User(email=f"u{i}@example.com") for i in range(3)])
+
+    counts = memory.orm_object_counts()
+    assert counts["tracking_routes"] is True
+    assert counts["by_class"]["User"] >= 4
+    assert counts["by_route"]["/api/users/{user_id}"] == {"User": 3}
+    assert counts["by_route"]["background"] == {"User": 1}
+
+    # Tags are weak: freed instances drop out
+    del served
+    assert "/api/users/{user_id}" not in memory.orm_object_counts()["by_route"]
+
+    memory.stop()
+    counts = memory.orm_object_counts()
+    assert counts["tracking_routes"] is False and counts["by_route"] == {}
+    del background
@@ -0,0 +1,25 @@
+from fastapi.testclient import TestClient
+from app import metrics
+from app.main import app
+import pytest
+
+@pytest.fixture
+def client(db):
+    return TestClient(app)
+
+def test_metrics_are_not_served_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", None)
+    assert client.get("/metrics").status_code == 404
+
+def test_metrics_require_the_bearer_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert "androama_http_requests_in_flight" in response.text
+
+def test_non_ascii_authorization_is_rejected_not_an_error(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3crét".encode("latin-1")})
+    assert response.status_code == 401
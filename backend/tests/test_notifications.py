@@ -0,0 +1,58 @@
+from app import mailer, notifications
+from app.mailer import ConsoleMailer, Mailer, MailerConnection
+from app.models import BetaWaitlist
+import asyncio
+
+class RecordingMailer(Mailer):
+    """A mailer that delivers, into a list"""
+
+    def __init__(self):
+        self.sent = []
+
+    def connect(self) -> MailerConnection:
+        mailer = self
+
+        class Connection(MailerConnection):
+            def send(self, message):
+                mailer.sent.append(message["To"])
+        return Connection()
+
+def seed(db, count: int):
+    db.add_all(BetaWaitlist(email=f"user{i}@example.com") for i in range(count))
+    db.commit()
+
+def run(job):
+    async def go():
+        job.start()
+        await job._task
+    asyncio.run(go())
+    return job
+
+def test_delivered_rows_are_marked_notified(db):
+    seed(db, 5)
+    recording = RecordingMailer()
+    job = run(notifications.NotificationJob("Hi", "Beta is open", mailer=recording, concurrency=2))
+    assert job.state == "completed" and job.sent == 5
+    assert len(recording.sent) == 5
+    assert db.query(BetaWaitlist).filter(BetaWaitlist.notified.is_(True)).count() == 5
+
+def test_console_mailer_is_a_dry_run(db, capsys):
+    seed(db, 5)
+    job = run(notifications.NotificationJob("Hi", "Beta is open", mailer=ConsoleMailer(), concurrency=2))
+    assert job.state == "completed" and job.sent == 5
+    assert job.status()["dry_run"] is True and job.marked == 0
+    assert db.query(BetaWaitlist).filter(BetaWaitlist.notified.is_(True)).count() == 0
+
+def test_console_outbox_is_bounded(capsys):
+    console = ConsoleMailer(outbox_size=3)
+    connection = console.connect()
+    for i in range(10):
+        connection.send(mailer.build_message(f"user{i}@example.com", "Hi", "body"))
+    assert [m["To"] for m in console.outbox] == [f"user{i}@example.com" for i in (7, 8, 9)]
+
+def test_only_an_explicit_console_backend_skips_smtp(monkeypatch, capsys):
+    for backend in ("smtp", "consle"):
+        monkeypatch.setattr(mailer, "MAIL_BACKEND", backend)
+        assert isinstance(mailer.get_mailer(), mailer.SMTPMailer)
+    monkeypatch.setattr(mailer, "MAIL_BACKEND", "console")
+    assert isinstance(mailer.get_mailer(), ConsoleMailer)
@@ -0,0 +1,123 @@
+from fastapi.testclient import TestClient
+from app import profiler
+from app.main import app
+from app.models import User
+from app.routers.admin import get_current_admin
+from app.profiler import ProfilerBusy, SamplingProfiler
+import threading
+import time
+import pytest
+
+@pytest.fixture(autouse=True)
+def clean_profiler():
+    profiler.reports.clear()
+    yield
+    profiler.reports.clear()
+    profiler._active = None
+
+@pytest.fixture
+def admin_client():
+    app.dependency_overrides[get_current_admin] = lambda: User(email="admin@example.com", is_admin=True)
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_current_admin, None)
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    thread.start()
+    yield
+    stop.set()
+    thread.join()
+
+def test_samples_busy_threads_and_drops_idle_ones(busy_thread):
+    idle = threading.Event()
+    waiter = threading.Thread(target=idle.wait, name="idle")
+    waiter.start()
+    try:
+        sampler = SamplingProfiler(interval=0.002)
+        sampler.start()
+        time.sleep(0.1)
+        report = sampler.stop()
+    finally:
+        idle.set()
+        waiter.join()
+
+    assert report["samples"] > 0
+    stacks = report["collapsed"].splitlines()
+    assert any(s.startswith("thread:busy;") and "busy_loop" in s for s in stacks)
+    assert not any(s.startswith("thread:idle;") for s in stacks)
+    assert any("busy_loop" in f["function"] for f in report["top_cumulative"])
+    assert not profiler.is_running()
+
+def test_only_one_profile_runs_at_a_time():
+    first = SamplingProfiler(interval=0.01)
+    first.start()
+    try:
+        with pytest.raises(ProfilerBusy):
+            SamplingProfiler().start()
+    finally:
+        first.stop()
+    second = SamplingProfiler(interval=0.01)
+    second.start()
+    second.stop()
+
+def test_only_the_latest_reports_are_kept(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_KEEP_REPORTS", 2)
+    ids = [profiler.store_report({"n": i}) for i in range(3)]
+    assert list(profiler.reports) == ids[1:]
+
+def test_profile_endpoint_stores_the_report(admin_client):
+    response = admin_client.post("/api/admin/diagnostics/profile", params={"seconds": 0.05})
+    assert response.status_code == 200
+    report = response.json()
+    assert profiler.reports[report["id"]]["requested_by"] == "admin@example.com"
+    listed = admin_client.get("/api/admin/diagnostics/profiles").json()
+    assert [entry["id"] for entry in listed] == [report["id"]]
+    collapsed = admin_client.get(f"/api/admin/diagnostics/profiles/{report['id']}", params={"format": "collapsed"})
+    assert collapsed.text == report["collapsed"]
+    assert admin_client.get("/api/admin/diagnostics/profiles/nope").status_code == 404
+
+def test_profile_endpoint_is_409_while_another_profile_runs(admin_client):
+    running = SamplingProfiler(interval=0.01)
+    running.start()
+    try:
+        response = admin_client.post("/api/admin/diagnostics/profile", params={"seconds": 0.05})
+    finally:
+        running.stop()
+    assert response.status_code == 409
+    assert profiler.reports == {}
+
+def test_middleware_profiles_requests_with_the_token(db, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_TOKEN", "let-me-profile")
+    client = TestClient(app)
+
+    response = client.get("/api/health", headers={"x-profile-token": "let-me-profile"})
+    profile_id = response.headers["x-profile-id"]
+    assert profiler.reports[profile_id]["path"] == "/api/health"
+    assert profiler.reports[profile_id]["method"] == "GET"
+    assert not profiler.is_running()
+
+    for headers in ({}, {"x-profile-token": "wrong"}):
+        assert "x-profile-id" not in client.get("/api/health", headers=headers).headers
+    assert list(profiler.reports) == [profile_id]
+
+def test_middleware_serves_unprofiled_while_busy_or_disabled(db, monkeypatch):
+    client = TestClient(app)
+    headers = {"x-profile-token": "let-me-profile"}
+    monkeypatch.setattr(profiler, "PROFILE_TOKEN", None)
+    assert "x-profile-id" not in client.get("/api/health", headers=headers).headers
+
+    monkeypatch.setattr(profiler, "PROFILE_TOKEN", "let-me-profile")
+    running = SamplingProfiler(interval=0.01)
+    running.start()
+    try:
+        response = client.get("/api/health", headers=headers)
+    finally:
+        running.stop()
+    assert response.status_code == 200 and "x-profile-id" not in response.headers
+    assert profiler.reports == {}
@@ -0,0 +1,85 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from app import ratelimit
+from app.ratelimit import LocalCounterStore, MemoryBackend, RateLimit, RateLimiter, SharedBackend, _sliding_window
+import asyncio
+import random
+import pytest
+
+class Clock:
+    def __init__(self, now: float = 1_000_020.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_sliding_window_allows_up_to_the_limit():
+    assert _sliding_window(0, 0, 3, 60, 0).allowed
+    assert _sliding_window(0, 2, 3, 60, 0) == (True, 0, 0.0)
+    blocked = _sliding_window(0, 3, 3, 60, 20)
+    assert not blocked.allowed and blocked.retry_after == pytest.approx(40)
+
+def test_sliding_window_weights_the_previous_window():
+    # 30s into the window half of the previous 10 hits still count
+    assert _sliding_window(10, 4, 10, 60, 30).allowed  # 5 + 4 < 10
+    blocked = _sliding_window(10, 5, 10, 60, 30)        # 5 + 5 = 10
+    assert not blocked.allowed
+    # frees up once 6 of the 10 have slid out: at 36s
+    assert blocked.retry_after == pytest.approx(6)
+    assert _sliding_window(10, 5, 10, 60, 36.01).allowed
+
+def test_memory_and_shared_backends_agree():
+    clock = Clock()
+    memory = MemoryBackend(shards=4, clock=clock)
+    shared = SharedBackend(LocalCounterStore(clock=clock), clock=clock)
+    rng = random.Random(42)
+
+    async def run():
+        for _ in range(2000):
+            clock.now += rng.choice((0.0, 0.5, 3.0, 17.0, 61.0))
+            key = f"login:ip:10.0.0.{rng.randrange(4)}"
+            a = await memory.hit(key, 5, 60, partition="ip")
+            b = await shared.hit(key, 5, 60, partition="ip")
+            assert a.allowed == b.allowed
+            assert a.retry_after == pytest.approx(b.retry_after)
+    asyncio.run(run())
+
+def test_memory_backend_is_bounded_and_counts_evictions_per_rule():
+    backend = MemoryBackend(shards=2, max_keys=10, clock=Clock())
+    for i in range(100):
+        backend.hit_sync(f"login:email:user{i}@example.com", 5, 60, partition="email")
+    assert backend.size() <= 10
+    assert backend.evictions() == {("login", "email"): 100 - backend.size()}
+
+def test_email_rotation_cannot_evict_ip_counters():
+    backend = MemoryBackend(shards=1, max_keys=10, clock=Clock())
+    for _ in range(3):
+        backend.hit_sync("login:ip:10.0.0.1", 3, 60, partition="ip")
+    for i in range(1000):
+        backend.hit_sync(f"login:email:fake{i}@example.com", 3, 60, partition="email")
+    assert not backend.hit_sync("login:ip:10.0.0.1", 3, 60, partition="ip").allowed
+
+@pytest.fixture
+def limited_client(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMITING", True)
+    limiter = RateLimiter(MemoryBackend(clock=Clock()))
+    rule = RateLimit("login", per_ip=(100, 60), per_email=(2, 60), limiter=limiter)
+    app = FastAPI()
+
+    @app.post("/login", dependencies=[Depends(rule)])
+    async def login(body: dict):
+        return {"ok": True}
+    return TestClient(app), limiter
+
+def test_per_email_limit_returns_429_with_retry_after(limited_client):
+    client, _ = limited_client
+    codes = [client.post("/login", json={"email": " Victim@Example.com"}).status_code for _ in range(2)]
+    blocked = client.post("/login", json={"email": "victim@example.com"})
+    assert codes == [200, 200]
+    assert blocked.status_code == 429 and int(blocked.headers["retry-after"]) >= 1
+
+def test_invalid_emails_get_no_counter(limited_client):
+    client, limiter = limited_client
+    for value in ("not-an-email", "", 42):
+        assert client.post("/login", json={"email": value}).status_code == 200
+    assert {c["key"] for c in limiter.snapshot()["checks"]} == {"ip"}
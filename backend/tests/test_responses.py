@@ -0,0 +1,53 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from fastapi.testclient import TestClient
+from app import responses
+from app.main import app
+from app.responses import FastJSONResponse
+import json
+import pytest
+import uuid
+
+POST_ID = uuid.UUID("12345678-1234-5678-1234-567812345678")
+CONTENT = {
+    "id": POST_ID,
+    "created_at": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "day": date(2026, 1, 2),
+    "rating": Decimal("4.50"),
+    "tags": {"help"},
+    "title": "Ünïcode ✓",
+    1: "non-string key",
+}
+EXPECTED = {
+    "id": str(POST_ID),
+    "created_at": "2026-01-02T03:04:05+00:00",
+    "day": "2026-01-02",
+    "rating": 4.5,
+    "tags": ["help"],
+    "title": "Ünïcode ✓",
+    "1": "non-string key",
+}
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def encoder(request, monkeypatch):
+    if request.param == "stdlib":
+        monkeypatch.setattr(responses, "orjson", None)
+    elif responses.orjson is None:
+        pytest.skip("orjson not installed")
+    return request.param
+
+def test_renders_api_types(encoder):
+    response = FastJSONResponse(CONTENT)
+    assert json.loads(response.body) == EXPECTED
+    assert response.headers["content-type"] == "application/json"
+    assert b'": ' not in response.body and b', "' not in response.body  # compact
+    assert "Ünïcode ✓".encode() in response.body  # not \u-escaped
+
+def test_unsupported_types_raise(encoder):
+    with pytest.raises(TypeError):
+        FastJSONResponse({"value": object()})
+
+def test_is_the_default_response_class(db):
+    assert app.router.default_response_class is FastJSONResponse
+    response = TestClient(app).get("/api/health")
+    assert response.status_code == 200 and response.json()
@@ -0,0 +1,111 @@
+from app import settings as settings_module
+from app.settings import SettingSpec, SettingsService
+import asyncio
+import pytest
+
+@pytest.fixture
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(settings_module, "SETTINGS_POLL_INTERVAL", 0.01)
+
+async def wait_for_value(service: SettingsService, expected: str, timeout: float = 2):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while service.beta_access_password != expected:
+        assert asyncio.get_running_loop().time() < deadline, "settings were not refreshed"
+        await asyncio.sleep(0.01)
+
+def test_writes_bump_the_version_other_workers_check(db):
+    writer, reader = SettingsService(), SettingsService()
+    reader.load()
+    assert reader.beta_access_password == settings_module.SETTINGS["beta_access_password"].default
+    assert reader.refresh_if_changed() is False
+
+    writer.set(db, "beta_access_password", "open-sesame")
+    assert writer.beta_access_password == "open-sesame" and writer.version is not None
+    assert reader.refresh_if_changed() is True
+    assert reader.beta_access_password == "open-sesame" and reader.version == writer.version
+    assert reader.refresh_if_changed() is False
+
+    first = writer.version
+    writer.set(db, "beta_access_password", "again")
+    assert writer.version != first
+    assert reader.refresh_if_changed() is True and reader.beta_access_password == "again"
+
+def test_unparseable_values_fall_back_to_the_default(db, monkeypatch):
+    monkeypatch.setitem(settings_module.SETTINGS, "max_devices", SettingSpec(3, "Devices per user", int))
+    service = SettingsService()
+    service.set(db, "max_devices", "7")
+    assert service.get("max_devices") == 7
+    service.set(db, "max_devices", "lots")
+    assert service.get("max_devices") == 3
+
+def test_sqlite_workers_pick_up_changes_by_polling(db, fast_poll):
+    async def scenario():
+        reader = SettingsService()
+        await reader.start()
+        try:
+            assert reader._listener is None
+            SettingsService().set(db, "beta_access_password", "polled")
+            await wait_for_value(reader, "polled")
+        finally:
+            await reader.stop()
+        assert reader._poll_task is None
+
+    asyncio.run(scenario())
+
+def test_polling_covers_for_an_unavailable_listener(db, fast_poll, monkeypatch, capsys):
+    async def scenario():
+        reader = SettingsService()
+        # LISTEN is attempted on a connection that cannot do it
+        monkeypatch.setattr(settings_module, "is_sqlite", False)
+        await reader.start()
+        monkeypatch.setattr(settings_module, "is_sqlite", True)
+        try:
+            assert reader._listener is not None
+            SettingsService().set(db, "beta_access_password", "via-poll")
+            await wait_for_value(reader, "via-poll")
+        finally:
+            await reader.stop()
+        reader._listener.join(timeout=1)
+        assert not reader._listener.is_alive()
+
+    asyncio.run(scenario())
+    assert "settings listener error" in capsys.readouterr().out
+
+def test_failed_reads_keep_serving_the_cached_settings(db, fast_poll, monkeypatch, capsys):
+    def broken_session():
+        raise RuntimeError("database is down")
+
+    async def scenario():
+        writer, reader = SettingsService(), SettingsService()
+        writer.set(db, "beta_access_password", "cached")
+        session_factory = settings_module.SessionLocal
+        await reader.start()
+        try:
+            assert reader.beta_access_password == "cached"
+            monkeypatch.setattr(settings_module, "SessionLocal", broken_session)
+            await asyncio.sleep(0.05)
+            assert reader.beta_access_password == "cached"
+            assert not reader._poll_task.done()
+            monkeypatch.setattr(settings_module, "SessionLocal", session_factory)
+            writer.set(db, "beta_access_password", "recovered")
+            await wait_for_value(reader, "recovered")
+        finally:
+            await reader.stop()
+
+    asyncio.run(scenario())
+    assert "settings refresh failed" in capsys.readouterr().out
+
+def test_startup_uses_defaults_when_settings_cannot_be_loaded(monkeypatch, capsys):
+    def broken_session():
+        raise RuntimeError("database is down")
+    monkeypatch.setattr(settings_module, "SessionLocal", broken_session)
+
+    async def scenario():
+        service = SettingsService()
+        await service.start()
+        await service.stop()
+        return service
+
+    service = asyncio.run(scenario())
+    assert service.beta_access_password == settings_module.SETTINGS["beta_access_password"].default
+    assert "using defaults" in capsys.readouterr().out
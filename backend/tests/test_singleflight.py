@@ -0,0 +1,94 @@
+from fastapi import HTTPException
+from app import singleflight
+from app.singleflight import SingleFlight
+import asyncio
+import pytest
+
+@pytest.fixture(autouse=True)
+def isolated_groups(monkeypatch):
+    monkeypatch.setattr(singleflight, "groups", {})
+
+def test_concurrent_callers_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+        runs = []
+        async def compute():
+            runs.append(1)
+            await release.wait()
+            return {"rows": len(runs)}
+        callers = [asyncio.ensure_future(flight.do("page-1", compute)) for _ in range(10)]
+        other = asyncio.ensure_future(flight.do("page-2", compute))
+        await asyncio.sleep(0)
+        assert flight.in_flight == 2
+        release.set()
+        results = await asyncio.gather(*callers)
+        await other
+        assert all(result is results[0] for result in results)
+        # Nothing is cached: the next call computes again
+        await flight.do("page-1", compute)
+        return flight, runs
+
+    flight, runs = asyncio.run(scenario())
+    assert len(runs) == 3
+    assert flight.snapshot() == {"calls": 12, "executions": 3, "shared": 9, "errors": 0, "timeouts": 0,
+                                 "in_flight": 0}
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight("test")
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("query failed")
+        results = await asyncio.gather(*(flight.do("k", compute) for _ in range(5)), return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert results[0] is results[-1]
+    assert flight.stats["executions"] == 1 and flight.stats["errors"] == 1
+    assert flight.in_flight == 0
+
+def test_timeout_is_504_and_releases_the_key():
+    async def scenario():
+        flight = SingleFlight("test", timeout=0.05)
+        stuck = asyncio.Event()
+        async def hang():
+            await stuck.wait()
+        with pytest.raises(HTTPException) as exc_info:
+            await flight.do("k", hang)
+        assert exc_info.value.status_code == 504
+        assert flight.in_flight == 0
+        # The next caller starts fresh instead of joining the stuck computation
+        assert await flight.do("k", lambda: asyncio.sleep(0, result="fresh")) == "fresh"
+        stuck.set()
+        await asyncio.sleep(0)
+        return flight
+
+    flight = asyncio.run(scenario())
+    assert flight.stats["timeouts"] == 1 and flight.stats["executions"] == 2
+
+def test_disconnecting_caller_does_not_cancel_the_shared_task():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+        async def compute():
+            await release.wait()
+            return "done"
+        leaving = asyncio.ensure_future(flight.do("k", compute))
+        staying = asyncio.ensure_future(flight.do("k", compute))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        assert flight.in_flight == 1 and not staying.done()
+        release.set()
+        return flight, await staying
+
+    flight, result = asyncio.run(scenario())
+    assert result == "done"
+    assert flight.stats["executions"] == 1 and flight.in_flight == 0
+
+def test_groups_are_registered_for_metrics():
+    flight = SingleFlight("listing")
+    assert singleflight.groups == {"listing": flight}
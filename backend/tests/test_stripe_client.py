@@ -0,0 +1,89 @@
+from fastapi import HTTPException
+from app import stripe_client
+import asyncio
+import pytest
+import stripe
+import threading
+
+class FakePaymentIntents:
+    """Stands in for stripe.PaymentIntent.create (no network)"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def create(self, **params):
+        self.calls.append(params)
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return stripe.PaymentIntent.construct_from(
+            {"id": "pi_1", "client_secret": "pi_1_secret", "amount": params["amount"], "currency": params["currency"]},
+            "sk_test"
+        )
+
+@pytest.fixture
+def intents(monkeypatch):
+    fake = FakePaymentIntents()
+    monkeypatch.setattr(stripe.PaymentIntent, "create", fake.create)
+    monkeypatch.setattr(stripe_client, "_slots", None)
+    monkeypatch.setattr(stripe_client, "latency", {})
+    monkeypatch.setattr(stripe_client, "stats", dict.fromkeys(stripe_client.stats, 0))
+    yield fake
+    fake.release.set()
+
+def test_create_payment_intent_passes_the_key_and_records_latency(intents):
+    intent = asyncio.run(stripe_client.create_payment_intent("key-1", amount=499, currency="usd"))
+    assert intent.client_secret == "pi_1_secret"
+    assert intents.calls == [{"idempotency_key": "key-1", "amount": 499, "currency": "usd"}]
+    snapshot = stripe_client.snapshot()
+    assert snapshot["calls"] == 1 and snapshot["in_flight"] == 0
+    assert snapshot["latency"]["payment_intent.create"]["count"] == 1
+
+def test_stripe_errors_are_counted_and_reraised(intents):
+    intents.error = stripe.error.APIConnectionError("unreachable")
+    with pytest.raises(stripe.error.APIConnectionError):
+        asyncio.run(stripe_client.create_payment_intent("key-1", amount=499, currency="usd"))
+    assert stripe_client.stats["errors"] == 1 and stripe_client.stats["in_flight"] == 0
+    assert stripe_client.latency["payment_intent.create"].count == 1
+
+def test_calls_past_the_concurrency_limit_get_503(intents, monkeypatch):
+    monkeypatch.setattr(stripe_client, "STRIPE_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(stripe_client, "STRIPE_QUEUE_TIMEOUT", 0.05)
+    intents.release.clear()
+
+    async def main():
+        first = asyncio.create_task(stripe_client.create_payment_intent("key-1", amount=499, currency="usd"))
+        while stripe_client.stats["in_flight"] == 0:
+            await asyncio.sleep(0.001)
+        with pytest.raises(HTTPException) as exc:
+            await stripe_client.create_payment_intent("key-2", amount=499, currency="usd")
+        intents.release.set()
+        await first
+        return exc.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 503 and error.headers["Retry-After"] == "1"
+    assert stripe_client.stats["rejected"] == 1 and stripe_client.stats["calls"] == 1
+    assert len(intents.calls) == 1
+
+def test_client_key_is_stable_and_scoped():
+    key = stripe_client.idempotency_key("abc", "payment_intent:user-1", 499, "Lifetime")
+    assert key == stripe_client.idempotency_key("abc", "payment_intent:user-1", 1, "other parts")
+    assert key != stripe_client.idempotency_key("abc", "payment_intent:user-2", 499, "Lifetime")
+    assert key != stripe_client.idempotency_key("abd", "payment_intent:user-1", 499, "Lifetime")
+
+def test_derived_key_dedupes_within_the_window_only(monkeypatch):
+    monkeypatch.setattr(stripe_client, "STRIPE_IDEMPOTENCY_WINDOW", 600)
+    now = {"t": 6000.0}
+    monkeypatch.setattr(stripe_client.time, "time", lambda: now["t"])
+    key = stripe_client.idempotency_key(None, "payment_intent:user-1", 499, "Lifetime")
+
+    now["t"] = 6599.0
+    assert key == stripe_client.idempotency_key(None, "payment_intent:user-1", 499, "Lifetime")
+    assert key != stripe_client.idempotency_key(None, "payment_intent:user-2", 499, "Lifetime")
+    assert key != stripe_client.idempotency_key(None, "payment_intent:user-1", 499, "Other")
+    now["t"] = 6600.0
+    assert key != stripe_client.idempotency_key(None, "payment_intent:user-1", 499, "Lifetime")
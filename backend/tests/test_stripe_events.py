@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+from app import stripe_events
+from app.models import StripeEvent, User
+
+def make_user(db, email="buyer@example.com") -> User:
+    user = User(email=email, password_hash="x", subscription_status="none", subscription_tier="beta")
+    db.add(user)
+    db.commit()
+    return user
+
+def event(event_id, created, customer="cus_a", type="customer.subscription.updated", **obj):
+    return {
+        "id": event_id,
+        "type": type,
+        "created": created,
+        "data": {"object": {"id": f"obj_{event_id}", "customer": customer, **obj}},
+    }
+
+def payment(event_id, user, amount=stripe_events.LIFETIME_PRICE, currency=stripe_events.LIFETIME_CURRENCY,
+            product=stripe_events.LIFETIME_PRODUCT, **obj):
+    metadata = {"user_id": str(user.id)} if user is not None else {}
+    if product:
+        metadata["product"] = product
+    return event(event_id, 1000, customer=None, type="payment_intent.succeeded",
+                 amount_received=amount, currency=currency, metadata=metadata, **obj)
+
+def apply(db, evt):
+    stripe_events.store_event(db, evt)
+    claimed = stripe_events.claim_due_events()
+    for event_id, _ in claimed:
+        stripe_events.process_event(event_id)
+    db.expire_all()
+    return db.query(StripeEvent).filter(StripeEvent.id == evt["id"]).one()
+
+def test_redelivered_event_is_stored_once(db):
+    assert stripe_events.store_event(db, event("evt_1", 1000)) is True
+    assert stripe_events.store_event(db, event("evt_1", 1000)) is False
+    assert db.query(StripeEvent).count() == 1
+
+def test_only_the_oldest_event_of_each_customer_is_claimed(db):
+    stripe_events.store_event(db, event("evt_a2", 1002))
+    stripe_events.store_event(db, event("evt_a1", 1001))
+    stripe_events.store_event(db, event("evt_b1", 1005, customer="cus_b"))
+
+    claimed = stripe_events.claim_due_events()
+    assert sorted(claimed) == [("evt_a1", "cus_a"), ("evt_b1", "cus_b")]
+    # Leased heads are not handed out twice, and nothing overtakes them
+    assert stripe_events.claim_due_events() == []
+
+def test_events_of_a_customer_are_applied_in_order(db):
+    for i in range(3):
+        stripe_events.store_event(db, event(f"evt_{i}", 1000 + i))
+    order = []
+    for _ in range(3):
+        claimed = stripe_events.claim_due_events()
+        assert len(claimed) == 1
+        order.append(claimed[0][0])
+        stripe_events.process_event(claimed[0][0])  # unknown user: recorded as done
+    assert order == ["evt_0", "evt_1", "evt_2"]
+
+def test_customer_in_backoff_does_not_starve_others(db):
+    for i in range(stripe_events.STRIPE_EVENT_BATCH + 50):
+        stripe_events.store_event(db, event(f"evt_a{i:04d}", 1000 + i))
+    stripe_events.store_event(db, event("evt_b", 5000, customer="cus_b"))
+    head = db.query(StripeEvent).filter(StripeEvent.id == "evt_a0000").one()
+    head.next_attempt_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    db.commit()
+
+    assert stripe_events.claim_due_events() == [("evt_b", "cus_b")]
+
+def test_lifetime_payment_upgrades_the_user(db):
+    user = make_user(db)
+    row = apply(db, payment("evt_pay", user))
+    db.refresh(user)
+    assert row.status == "done" and row.last_error is None
+    assert user.subscription_tier == "lifetime"
+
+def test_underpaid_or_untagged_payments_are_ignored(db):
+    user = make_user(db)
+    for evt in (
+        payment("evt_cheap", user, amount=50),
+        payment("evt_eur", user, currency="eur"),
+        payment("evt_other", user, product=None),
+    ):
+        row = apply(db, evt)
+        assert row.status == "done" and row.last_error
+    db.refresh(user)
+    assert user.subscription_tier == "beta"
+
+def test_payment_is_not_matched_by_payer_email(db):
+    victim = make_user(db, "victim@example.com")
+    row = apply(db, payment("evt_mail", None, receipt_email="victim@example.com"))
+    db.refresh(victim)
+    assert row.status == "done" and "No user" in row.last_error
+    assert victim.subscription_tier == "beta"
+
+def test_failing_event_is_retried_with_backoff(db, monkeypatch):
+    def boom(db, obj):
+        raise RuntimeError("database hiccup")
+    monkeypatch.setitem(stripe_events.HANDLERS, "customer.subscription.updated", boom)
+    stripe_events.store_event(db, event("evt_fail", 1000))
+    stripe_events.store_event(db, event("evt_next", 1001))
+
+    (event_id, _), = stripe_events.claim_due_events()
+    stripe_events.process_event(event_id)
+    db.expire_all()
+    row = db.query(StripeEvent).filter(StripeEvent.id == "evt_fail").one()
+    assert row.status == "pending" and row.attempts == 1 and row.next_attempt_at is not None
+    # The customer's next event waits behind the failed one
+    assert stripe_events.claim_due_events() == []
@@ -0,0 +1,71 @@
+from app import waitlist
+from app.models import BetaWaitlist
+import asyncio
+import pytest
+import time
+
+def run_batcher(scenario, **kwargs):
+    """Run `scenario(batcher)` against a started batcher, stopping it afterwards"""
+    async def main():
+        batcher = waitlist.WaitlistBatcher(**kwargs)
+        await batcher.start()
+        try:
+            return batcher, await scenario(batcher)
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+def test_repeats_in_one_batch_resolve_false(db):
+    db.add(BetaWaitlist(email="old@example.com"))
+    db.commit()
+
+    async def scenario(batcher):
+        emails = ["a@example.com", "b@example.com", "a@example.com", "old@example.com"]
+        return await asyncio.gather(*(batcher.submit(email) for email in emails))
+
+    batcher, results = run_batcher(scenario, max_delay_ms=50)
+    assert results == [True, True, False, False]
+    assert batcher.stats["batches"] == 1 and batcher.stats["inserted"] == 2
+    assert db.query(BetaWaitlist).count() == 3
+
+def test_batches_are_capped_at_max_rows(db):
+    async def scenario(batcher):
+        return await asyncio.gather(*(batcher.submit(f"u{i}@example.com") for i in range(5)))
+
+    batcher, results = run_batcher(scenario, max_rows=2, max_delay_ms=50)
+    assert results == [True] * 5
+    assert batcher.stats["batches"] == 3 and batcher.stats["largest_batch"] == 2
+
+def test_failed_write_fails_every_caller_in_the_batch(monkeypatch):
+    def fail(emails):
+        raise RuntimeError("database down")
+    monkeypatch.setattr(waitlist, "insert_batch", fail)
+
+    async def scenario(batcher):
+        return await asyncio.gather(
+            batcher.submit("a@example.com"), batcher.submit("b@example.com"), return_exceptions=True
+        )
+
+    batcher, results = run_batcher(scenario, max_delay_ms=50)
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+    assert batcher.stats["errors"] == 1
+
+def test_stop_finishes_the_batch_being_written(db, monkeypatch):
+    real_insert = waitlist.insert_batch
+    def slow_insert(emails):
+        time.sleep(0.1)
+        return real_insert(emails)
+    monkeypatch.setattr(waitlist, "insert_batch", slow_insert)
+
+    async def main():
+        batcher = waitlist.WaitlistBatcher(max_rows=2, max_delay_ms=1)
+        await batcher.start()
+        submitted = [asyncio.create_task(batcher.submit(f"u{i}@example.com")) for i in range(3)]
+        await asyncio.sleep(0.02)  # the first batch is being inserted, the queue is empty
+        await batcher.stop()
+        with pytest.raises(RuntimeError):
+            await batcher.submit("late@example.com")
+        return await asyncio.wait_for(asyncio.gather(*submitted), 5)
+
+    assert asyncio.run(main()) == [True, True, True]
+    assert db.query(BetaWaitlist).count() == 3